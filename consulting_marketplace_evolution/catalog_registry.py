@@ -0,0 +1,219 @@
+# This module provides a shared, read-only registry for the descriptive catalogs used across consulting_marketplace_evolution.
+
+import copy
+import math
+import re
+import threading
+from bisect import bisect_left
+from difflib import SequenceMatcher, get_close_matches
+
+
+class FrozenDict(dict):
+    """
+    A dict that rejects mutation. Stays a dict so catalog records still serialise with json.dumps.
+    copy.copy/copy.deepcopy return plain (mutable) dicts; pickling round-trips the frozen record.
+    """
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Catalog records are read-only.")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def __hash__(self):
+        return hash(tuple(self.items()))
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {copy.deepcopy(key, memo): copy.deepcopy(item, memo) for key, item in self.items()}
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+class FrozenList(list):
+    """A list that rejects mutation; copies are plain lists, as for FrozenDict."""
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Catalog records are read-only.")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = clear = extend = insert = pop = remove = reverse = sort = _immutable
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(item, memo) for item in self]
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+def freeze(value):
+    """Recursively converts dicts to FrozenDict and lists to FrozenList (sets/tuples to tuples)."""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    if isinstance(value, (tuple, set, frozenset)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class CatalogIndex:
+    """
+    Immutable catalog of named records with exact, case-insensitive, alias and token-based lookup.
+
+    Names are indexed three ways: a case-folded map, an alias map of names with their parenthetical
+    examples removed (e.g. "Global Strategy Leader"), and an inverted index from name tokens to records.
+    Token queries score records by the IDF weight of matched tokens, falling back to prefix matches on
+    the sorted vocabulary and then to close spelling matches. Resolutions are memoised.
+    """
+    stopwords = frozenset({"a", "an", "and", "e", "g", "eg", "for", "in", "of", "on", "or", "the", "to", "with"})
+    token_pattern = re.compile(r"[a-z0-9]+")
+    parenthetical_pattern = re.compile(r"\s*\([^)]*\)")
+    prefix_weight, fuzzy_weight = 0.8, 0.6
+    cache_size = 4096
+
+    def __init__(self, name: str, records: dict):
+        self.name = name
+        self.records = freeze(records)
+        self.names = tuple(self.records)
+        self._casefolded = {n.casefold(): n for n in self.names}
+        aliases = {}
+        for n in self.names:
+            alias = self.parenthetical_pattern.sub("", n).strip().casefold()
+            aliases.setdefault(alias, []).append(n)
+        self._aliases = {alias: found[0] for alias, found in aliases.items() if len(found) == 1}
+        postings = {}
+        for position, n in enumerate(self.names):
+            for token in set(self.tokenize(n)):
+                postings.setdefault(token, []).append(position)
+        self._postings = {token: tuple(ids) for token, ids in postings.items()}
+        self._vocabulary = sorted(self._postings)
+        total = len(self.names)
+        self._idf = {token: math.log(1 + total / len(ids)) for token, ids in self._postings.items()}
+        self._resolved = {}
+
+    @classmethod
+    def tokenize(cls, text: str) -> list:
+        return [t for t in cls.token_pattern.findall(text.casefold()) if t not in cls.stopwords]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def canonical_name(self, name: str):
+        """Catalog name for an exact, case-insensitive or alias (no parenthetical) match, else None."""
+        if name in self.records:
+            return name
+        folded = name.strip().casefold()
+        return self._casefolded.get(folded) or self._aliases.get(self.parenthetical_pattern.sub("", folded).strip())
+
+    def get(self, name: str, default=None):
+        """Record by exact, case-insensitive or alias name."""
+        canonical = self.canonical_name(name)
+        return self.records[canonical] if canonical is not None else default
+
+    def _token_matches(self, token: str):
+        """(record ids, weight) for a query token: exact token, else vocabulary prefix, else close spelling."""
+        if token in self._postings:
+            return [(self._postings[token], self._idf[token])]
+        matches = []
+        if len(token) >= 2:
+            start = bisect_left(self._vocabulary, token)
+            for candidate in self._vocabulary[start:]:
+                if not candidate.startswith(token):
+                    break
+                matches.append((self._postings[candidate], self.prefix_weight * self._idf[candidate]))
+        if not matches and len(token) >= 4:
+            for candidate in get_close_matches(token, self._vocabulary, n=3, cutoff=0.75):
+                similarity = SequenceMatcher(None, token, candidate).ratio()
+                matches.append((self._postings[candidate], self.fuzzy_weight * similarity * self._idf[candidate]))
+        return matches
+
+    def resolve(self, query: str, limit: int = 5) -> list:
+        """
+        Ranked catalog names for a free-text query.
+
+        Returns:
+            list: Dicts with 'name', 'score' (1.0 for exact, case-insensitive or alias hits) and 'match'
+                  ('exact', 'case_insensitive', 'alias' or 'token').
+        """
+        key = (query, limit)
+        cached = self._resolved.get(key)
+        if cached is not None:
+            return list(cached)
+        canonical = self.canonical_name(query)
+        if canonical is not None:
+            if canonical == query:
+                match = "exact"
+            elif canonical.casefold() == query.strip().casefold():
+                match = "case_insensitive"
+            else:
+                match = "alias"
+            hits = [{"name": canonical, "score": 1.0, "match": match}]
+        else:
+            scores, query_weight = {}, 0.0
+            unknown_token_weight = math.log(1 + len(self.names))
+            for token in self.tokenize(query):
+                best_for_token = {}
+                for ids, weight in self._token_matches(token):
+                    for i in ids:
+                        if weight > best_for_token.get(i, 0.0):
+                            best_for_token[i] = weight
+                for i, weight in best_for_token.items():
+                    scores[i] = scores.get(i, 0.0) + weight
+                query_weight += self._idf.get(token, unknown_token_weight)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], len(self.names[item[0]])))[:limit]
+            hits = [{"name": self.names[i], "score": round(min(score / query_weight, 1.0), 4) if query_weight else 0.0, "match": "token"}
+                    for i, score in ranked]
+        if len(self._resolved) >= self.cache_size:
+            self._resolved.clear()
+        self._resolved[key] = tuple(hits)
+        return hits
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(name: str, builder=None) -> CatalogIndex:
+    """
+    Shared CatalogIndex for a catalog name, built on first use from builder() and reused for the rest
+    of the process.
+    """
+    catalog = _catalogs.get(name)
+    if catalog is not None:
+        return catalog
+    if builder is None:
+        raise KeyError(f"Catalog '{name}' has not been registered.")
+    with _catalogs_lock:
+        catalog = _catalogs.get(name)
+        if catalog is None:
+            catalog = _catalogs[name] = CatalogIndex(name, builder())
+    return catalog
+
+
+def registered_catalogs() -> list:
+    """Names of the catalogs built so far in this process."""
+    return sorted(_catalogs)
+
+
+def resolve_anywhere(query: str, limit: int = 5, names=None) -> list:
+    """
+    Resolves a query against the named catalogs (which must already be built), or against every catalog
+    built so far when names is None; hits carry their catalog name.
+    """
+    names = registered_catalogs() if names is None else list(names)
+    hits = [dict(hit, catalog=name) for name in names for hit in get_catalog(name).resolve(query, limit)]
+    hits.sort(key=lambda hit: -hit["score"])
+    return hits[:limit]
@@ -1,5 +1,14 @@
 # This module will cover the transformation of client needs. 
 
+from array import array
+from itertools import chain, repeat
+from operator import add, mul
+
+try:
+    from .catalog_registry import get_catalog
+except ImportError:  # run as a script from this directory
+    from catalog_registry import get_catalog
+
 class ClientPriorityEvolution:
     def __init__(self):
         self.priority_areas = {
@@ -45,6 +54,50 @@ class ClientPriorityEvolution:
             }
         }
 
+        # Annual rate at which importance closes the gap to 10 (or to 1 for negative rates), in fifths of the gap
+        self.trend_rate_parameters = {"Rapidly Increasing": 0.3, "Increasing": 0.15, "Stable": 0.0, "Decreasing": -0.15}
+        # Rate multipliers by client segment and region: "rate" applies to every priority area, "priority_emphasis" to named areas
+        self.segment_modifiers = {
+            "All Segments": {"rate": 1.0, "priority_emphasis": {}},
+            "Large Diversified Agribusiness": {"rate": 1.1, "priority_emphasis": {"Supply Chain Resilience Enhancement": 1.2, "Sustainability Transformation Support (ESG Integration)": 1.2}},
+            "Food Processor": {"rate": 1.0, "priority_emphasis": {"Supply Chain Resilience Enhancement": 1.3, "Market Access Strategy Development & Diversification": 0.9}},
+            "Retail & CPG": {"rate": 1.1, "priority_emphasis": {"Sustainability Transformation Support (ESG Integration)": 1.4, "Digital Transformation Enablement": 1.1}},
+            "Input Supplier": {"rate": 1.0, "priority_emphasis": {"Digital Transformation Enablement": 1.3, "Market Access Strategy Development & Diversification": 1.1}},
+            "Farmer Cooperative": {"rate": 0.8, "priority_emphasis": {"Climate Risk Assessment and Mitigation": 1.2, "Market Access Strategy Development & Diversification": 1.2}},
+            "Financial Investor": {"rate": 1.0, "priority_emphasis": {"Climate Risk Assessment and Mitigation": 1.3, "Sustainability Transformation Support (ESG Integration)": 1.3, "Market Access Strategy Development & Diversification": 0.7}},
+            "Public Sector & Development Agency": {"rate": 0.9, "priority_emphasis": {"Climate Risk Assessment and Mitigation": 1.4, "Digital Transformation Enablement": 0.8}}
+        }
+        self.region_modifiers = {
+            "Global": {"rate": 1.0, "priority_emphasis": {}},
+            "North America": {"rate": 1.0, "priority_emphasis": {"Digital Transformation Enablement": 1.2, "Sustainability Transformation Support (ESG Integration)": 0.9}},
+            "Europe": {"rate": 1.0, "priority_emphasis": {"Sustainability Transformation Support (ESG Integration)": 1.4, "Climate Risk Assessment and Mitigation": 1.2}},
+            "South America": {"rate": 1.0, "priority_emphasis": {"Market Access Strategy Development & Diversification": 1.3, "Sustainability Transformation Support (ESG Integration)": 1.1}},
+            "Asia-Pacific": {"rate": 1.1, "priority_emphasis": {"Supply Chain Resilience Enhancement": 1.2, "Digital Transformation Enablement": 1.2}},
+            "Middle East & North Africa": {"rate": 0.9, "priority_emphasis": {"Supply Chain Resilience Enhancement": 1.4, "Climate Risk Assessment and Mitigation": 1.2}},
+            "Sub-Saharan Africa": {"rate": 0.8, "priority_emphasis": {"Climate Risk Assessment and Mitigation": 1.3, "Market Access Strategy Development & Diversification": 1.3, "Digital Transformation Enablement": 0.8}}
+        }
+        self.parameter_version = 0
+        self._projection_cache = {}
+
+    def update_parameters(self, trend_rates: dict = None, segment_modifiers: dict = None, region_modifiers: dict = None,
+                          importance_scores: dict = None) -> int:
+        """
+        Updates projection parameters and bumps parameter_version, which invalidates cached projection cubes.
+        Change parameters through this method rather than editing the dicts directly so the cache stays valid.
+
+        Returns:
+            int: The new parameter version.
+        """
+        self.trend_rate_parameters.update(trend_rates or {})
+        self.segment_modifiers.update(segment_modifiers or {})
+        self.region_modifiers.update(region_modifiers or {})
+        for area, score in (importance_scores or {}).items():
+            if area in self.priority_areas:
+                self.priority_areas[area]["current_importance_score"] = score
+        self.parameter_version += 1
+        self._projection_cache.clear()
+        return self.parameter_version
+
     def model_evolution(self, priority_area: str, years_to_project: int = 5) -> dict:
         """
         Models the evolution of a client priority area over a number of years.
@@ -54,17 +107,12 @@ class ClientPriorityEvolution:
             return {"error": f"Priority area '{priority_area}' not recognized."}
 
         current_data = self.priority_areas[priority_area]
-        projected_importance_score = current_data["current_importance_score"]
-        
-        # Simplified projection logic
-        if current_data["trend_outlook"] == "Rapidly Increasing":
-            projection_factor = 0.3 * years_to_project # Faster increase
-        elif current_data["trend_outlook"] == "Increasing":
-            projection_factor = 0.15 * years_to_project # Slower increase
-        else: # Stable or Decreasing (not modeled to decrease in this simple version)
-            projection_factor = 0
-
-        projected_importance_score = min(10, current_data["current_importance_score"] + projection_factor * (10 - current_data["current_importance_score"])/5) # Approach 10, decelerating
+        score = current_data["current_importance_score"]
+
+        # Approach 10 (or 1 for declining priorities), decelerating
+        rate = self.trend_rate_parameters.get(current_data["trend_outlook"], 0.0)
+        headroom = (10 - score) if rate >= 0 else (score - 1)
+        projected_importance_score = max(1, min(10, score + rate * years_to_project * headroom / 5))
         projected_importance_score = round(projected_importance_score, 1)
 
         return {
@@ -77,13 +125,89 @@ class ClientPriorityEvolution:
             "projection_period_years": years_to_project
         }
 
+    def projection_cube(self, client_segments: list = None, regions: list = None, years: int = 10) -> dict:
+        """
+        Projected importance for every priority area x client segment x region x year 1..years.
+
+        Trend outlooks are encoded as rates from trend_rate_parameters and scaled by the segment and region
+        modifiers; the whole cube is then evaluated in one pass of array operations using the same
+        gap-closing rule as model_evolution. Cubes are cached per parameter version, segments, regions and
+        years; callers get a copy, so mutating a returned cube leaves the cache intact.
+
+        Returns:
+            dict: Axis labels, 'shape' (P, S, R, Y), 'parameter_version' and 'importance', a flat array('d')
+                  in priority-major order (index ((p * S + s) * R + r) * Y + (year - 1)).
+        """
+        client_segments = tuple(client_segments or self.segment_modifiers)
+        regions = tuple(regions or self.region_modifiers)
+        unknown = [s for s in client_segments if s not in self.segment_modifiers] + [r for r in regions if r not in self.region_modifiers]
+        if unknown:
+            return {"error": f"No modifiers for client segment/region: {', '.join(unknown)}."}
+        if years < 1:
+            return {"error": "years must be at least 1."}
+        cache_key = (self.parameter_version, client_segments, regions, years)
+        cached = self._projection_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached, importance=array('d', cached["importance"]))
+
+        areas = tuple(self.priority_areas)
+        n_segments, n_regions = len(client_segments), len(regions)
+        scores = [self.priority_areas[a]["current_importance_score"] for a in areas]
+        base_rates = [self.trend_rate_parameters.get(self.priority_areas[a]["trend_outlook"], 0.0) for a in areas]
+        segment_factors = [self.segment_modifiers[s]["rate"] * self.segment_modifiers[s]["priority_emphasis"].get(a, 1.0)
+                           for a in areas for s in client_segments]
+        region_factors = [self.region_modifiers[r]["rate"] * self.region_modifiers[r]["priority_emphasis"].get(a, 1.0)
+                          for a in areas for r in regions]
+
+        # Per (priority, segment, region) cell: effective rate and slope per year (rate x headroom / 5)
+        cells = n_segments * n_regions
+        rates = array('d', map(mul, map(mul,
+            chain.from_iterable(map(repeat, base_rates, repeat(cells))),
+            chain.from_iterable(map(repeat, segment_factors, repeat(n_regions)))),
+            chain.from_iterable(region_factors[p * n_regions:(p + 1) * n_regions] * n_segments for p in range(len(areas)))))
+        rising_headroom = chain.from_iterable(map(repeat, [(10 - s) / 5 for s in scores], repeat(cells)))
+        falling_headroom = chain.from_iterable(map(repeat, [(s - 1) / 5 for s in scores], repeat(cells)))
+        slopes = map(add, map(mul, map(max, rates, repeat(0.0)), rising_headroom),
+                     map(mul, map(min, rates, repeat(0.0)), falling_headroom))
+
+        # Expand cells across the year axis and clamp to the 1-10 scale
+        importance = array('d', map(max, repeat(1.0), map(min, repeat(10.0), map(add,
+            chain.from_iterable(map(repeat, scores, repeat(cells * years))),
+            map(mul, chain.from_iterable(map(repeat, slopes, repeat(years))), array('d', range(1, years + 1)) * (len(areas) * cells))))))
+
+        cube = {
+            "priority_areas": areas,
+            "client_segments": client_segments,
+            "regions": regions,
+            "years": tuple(range(1, years + 1)),
+            "shape": (len(areas), n_segments, n_regions, years),
+            "parameter_version": self.parameter_version,
+            "importance": importance
+        }
+        self._projection_cache[cache_key] = cube
+        return dict(cube, importance=array('d', importance))
+
+    def project_segment_region(self, client_segment: str, region: str, years: int = 10) -> dict:
+        """Projected importance by year for every priority area, for one client segment and region."""
+        cube = self.projection_cube([client_segment], [region], years)
+        if "error" in cube:
+            return cube
+        values = cube["importance"]
+        return {area: dict(zip(cube["years"], (round(v, 2) for v in values[p * years:(p + 1) * years])))
+                for p, area in enumerate(cube["priority_areas"])}
+
     def get_all_priority_details(self):
         """Returns details for all configured priority areas."""
         return self.priority_areas
 
 class DecisionMakerProfileShift:
     def __init__(self):
-        self.profiles = {
+        self.catalog = get_catalog("decision_maker_profiles", self._build_profiles)
+        self.profiles = self.catalog.records
+
+    @staticmethod
+    def _build_profiles():
+        return {
             "Chief Executive Officer (CEO)": {
                 "traditional_focus": ["Overall P&L", "Strategic Growth", "Shareholder Value"],
                 "emerging_focus": ["Long-term Resilience", "Sustainability Integration", "Stakeholder Management", "Digital Transformation Vision"],
@@ -139,7 +263,7 @@ class DecisionMakerProfileShift:
         """
         Retrieves the profile for a specific decision-maker role.
         """
-        return self.profiles.get(role_title, {"error": "Role not found"})
+        return self.catalog.get(role_title, {"error": "Role not found"})
 
     def analyze_shift_impact(self, role_title):
         """
@@ -374,12 +498,14 @@ class ClientNeedTransformation:
         """
         print(f"--- Comprehensive Client Outlook for {client_segment} in {region} ---")
 
-        priority_projection_details = self.priority_evolution.model_evolution(
-            priority_area="Supply Chain Resilience Enhancement", 
-            years_to_project=5
-        )
-        projected_importance_score = priority_projection_details.get("projected_importance_score_in_years", "N/A")
-        print(f"\nProjected Importance for Supply Chain Resilience (5 years): {projected_importance_score}")
+        # Segments/regions without modifiers are projected with the neutral ones
+        modelled_segment = client_segment if client_segment in self.priority_evolution.segment_modifiers else "All Segments"
+        modelled_region = region if region in self.priority_evolution.region_modifiers else "Global"
+        priority_outlook = self.priority_evolution.project_segment_region(modelled_segment, modelled_region, years=10)
+        print(f"\nProjected Priority Importance ({modelled_segment}, {modelled_region}):")
+        for area, by_year in priority_outlook.items():
+            print(f"  - {area}: now {self.priority_evolution.priority_areas[area]['current_importance_score']}, "
+                  f"year 5 {by_year[5]:.1f}, year 10 {by_year[10]:.1f}")
 
         cso_profile = self.decision_maker_shift.get_profile("Chief Sustainability Officer (CSO)")
         print(f"\nCSO Profile Key Concerns: {cso_profile.get('key_concerns', 'N/A')}")
@@ -399,7 +525,11 @@ class ClientNeedTransformation:
         print(f"\nImplications of Tech Blurring for {client_segment}: {blurring_implications.get('client_specific_summary', 'N/A')}")
 
         return {
-            "priority_projection": priority_projection_details, # Return the whole dict for more info
+            "priority_projection": self.priority_evolution.model_evolution(
+                priority_area="Supply Chain Resilience Enhancement", years_to_project=5), # Return the whole dict for more info
+            "priority_importance_outlook": priority_outlook,
+            "priority_outlook_basis": {"client_segment": modelled_segment, "region": modelled_region,
+                                       "parameter_version": self.priority_evolution.parameter_version},
             "cso_profile_concerns": cso_profile.get('key_concerns'),
             "systemic_framing_description": systemic_framing.get('emerging_framing'), # Changed from .get('description')
             "budget_trends_sample": dict(list(budget_trends.items())[:3]),
@@ -416,13 +546,24 @@ if __name__ == '__main__':
     )
 
     print("\n--- Example 2: Client Priority Evolution Analysis ---")
-    priority_details = client_needs_sim.priority_evolution.get_priority_details("Digital Transformation")
-    print(f"Details for Digital Transformation Priority: Current Importance {priority_details.get('current_importance_score')}, Trend: {priority_details.get('trend_outlook')}")
-    projected_importance = client_needs_sim.priority_evolution.project_priority_importance("Digital Transformation", 3)
-    print(f"Projected importance in 3 years: {projected_importance:.2f}")
+    priority_details = client_needs_sim.priority_evolution.model_evolution("Digital Transformation Enablement", 3)
+    print(f"Details for Digital Transformation Priority: Current Importance {priority_details.get('current_importance_score')}, Trend: {priority_details.get('current_trend_outlook')}")
+    print(f"Projected importance in 3 years: {priority_details.get('projected_importance_score_in_years'):.2f}")
+
+    print("\n--- Example 2b: Priority Projection Cube ---")
+    priority_cube = client_needs_sim.priority_evolution.projection_cube(years=10)
+    n_areas, n_segments, n_regions, n_years = priority_cube["shape"]
+    print(f"Cube shape (priorities x segments x regions x years): {priority_cube['shape']}, {len(priority_cube['importance'])} projections")
+    europe = priority_cube["regions"].index("Europe")
+    retail = priority_cube["client_segments"].index("Retail & CPG")
+    for p, area in enumerate(priority_cube["priority_areas"]):
+        year_10 = priority_cube["importance"][((p * n_segments + retail) * n_regions + europe) * n_years + n_years - 1]
+        print(f"  Retail & CPG, Europe, year 10 - {area}: {year_10:.1f}")
+    client_needs_sim.priority_evolution.update_parameters(trend_rates={"Increasing": 0.2})
+    print(f"Cube recomputed after parameter update: {client_needs_sim.priority_evolution.projection_cube(years=10)['parameter_version'] != priority_cube['parameter_version']}")
 
     print("\n--- Example 3: Decision Maker Profile ---")
-    ceo_profile = client_needs_sim.decision_maker_shift.get_profile_details("Chief Executive Officer (CEO)")
+    ceo_profile = client_needs_sim.decision_maker_shift.get_profile("Chief Executive Officer (CEO)")
     print(f"CEO Emerging Focus: {ceo_profile.get('emerging_focus', 'N/A')}")
 
     print("\n--- Example 4: Problem Framing Evolution ---")
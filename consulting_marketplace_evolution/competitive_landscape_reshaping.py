@@ -1,8 +1,18 @@
 # This module will cover the reshaping of the competitive landscape.
 
+try:
+    from .catalog_registry import get_catalog, resolve_anywhere
+except ImportError:  # run as a script from this directory
+    from catalog_registry import get_catalog, resolve_anywhere
+
 class StrategyConsultingFirmPositioning:
     def __init__(self):
-        self.firm_profiles = {
+        self.catalog = get_catalog("strategy_firm_profiles", self._build_firm_profiles)
+        self.firm_profiles = self.catalog.records
+
+    @staticmethod
+    def _build_firm_profiles():
+        return {
             "Global Strategy Leader (e.g., BCG, McKinsey)": {
                 "positioning_statement": "Leveraging deep global expertise and cross-sector insights to drive systemic transformation in food and agriculture for sustainability, food security, and economic growth.",
                 "key_strengths": [
@@ -77,7 +87,7 @@ class StrategyConsultingFirmPositioning:
 
     def get_firm_positioning_details(self, firm_type: str):
         """Retrieves the positioning details for a specific type of strategy consulting firm."""
-        return self.firm_profiles.get(firm_type, {"error": "Firm type not found."})
+        return self.catalog.get(firm_type, {"error": "Firm type not found."})
 
     def analyze_competitive_stance(self, firm_type1: str, firm_type2: str):
         """Analyzes the competitive stance between two types of firms (simplified)."""
@@ -113,7 +123,20 @@ class StrategyConsultingFirmPositioning:
 
 class MarketIntelligenceProviderEvolution:
     def __init__(self):
-        self.provider_types = {
+        self.catalog = get_catalog("market_intelligence_provider_types", self._build_provider_types)
+        self.provider_types = self.catalog.records
+        self.evolution_drivers = [
+            "Client demand for actionable insights, not just data",
+            "Increased market volatility (climate, geopolitical, economic)",
+            "Growing importance of sustainability and ESG factors",
+            "Advancements in AI, ML, and data analytics technologies",
+            "Proliferation of new data sources (e.g., sensors, satellites, IoT)",
+            "Need for integrated risk management across the value chain"
+        ]
+
+    @staticmethod
+    def _build_provider_types():
+        return {
             "Traditional Data Vendors (e.g., Refinitiv, S&P Global Platts for base commodity data)": {
                 "traditional_offering": [
                     "Price data feeds (spot, futures)",
@@ -173,18 +196,10 @@ class MarketIntelligenceProviderEvolution:
                 "strategic_focus_shift": "Focus on highly specialized, high-value advisory where deep domain expertise and tailored analysis are critical."
             }
         }
-        self.evolution_drivers = [
-            "Client demand for actionable insights, not just data",
-            "Increased market volatility (climate, geopolitical, economic)",
-            "Growing importance of sustainability and ESG factors",
-            "Advancements in AI, ML, and data analytics technologies",
-            "Proliferation of new data sources (e.g., sensors, satellites, IoT)",
-            "Need for integrated risk management across the value chain"
-        ]
 
     def get_provider_type_details(self, provider_type_name):
         """Retrieves details for a specific type of market intelligence provider."""
-        return self.provider_types.get(provider_type_name, "Provider type not found.")
+        return self.catalog.get(provider_type_name, "Provider type not found.")
 
     def analyze_evolution_trends(self):
         """Analyzes key evolution trends across market intelligence providers."""
@@ -212,7 +227,20 @@ class MarketIntelligenceProviderEvolution:
 
 class TechnicalAdvisoryTransformation:
     def __init__(self):
-        self.service_areas = {
+        self.catalog = get_catalog("technical_advisory_service_areas", self._build_service_areas)
+        self.service_areas = self.catalog.records
+        self.transformation_drivers = [
+            "Demand for higher efficiency and productivity.",
+            "Availability of affordable and powerful digital tools (sensors, software, connectivity).",
+            "Increased focus on sustainability and environmental stewardship.",
+            "Stringent regulatory requirements and consumer demand for transparency.",
+            "Need for climate change adaptation and resilience.",
+            "Labor shortages and rising labor costs in some regions."
+        ]
+
+    @staticmethod
+    def _build_service_areas():
+        return {
             "Precision Agronomy & Crop Management": {
                 "traditional_approach": [
                     "Scheduled field scouting, soil sampling based on standard grids.",
@@ -280,18 +308,10 @@ class TechnicalAdvisoryTransformation:
                 "key_technologies": ["Environmental sensors (CO2, humidity, light)", "Automated climate control systems", "LED lighting systems", "Water chemistry monitoring tools"]
             }
         }
-        self.transformation_drivers = [
-            "Demand for higher efficiency and productivity.",
-            "Availability of affordable and powerful digital tools (sensors, software, connectivity).",
-            "Increased focus on sustainability and environmental stewardship.",
-            "Stringent regulatory requirements and consumer demand for transparency.",
-            "Need for climate change adaptation and resilience.",
-            "Labor shortages and rising labor costs in some regions."
-        ]
 
     def get_service_area_details(self, service_area_name):
         """Retrieves details for a specific technical advisory service area."""
-        return self.service_areas.get(service_area_name, "Service area not found.")
+        return self.catalog.get(service_area_name, "Service area not found.")
 
     def analyze_transformation_impact(self, service_area_name):
         """Analyzes the impact of transformation drivers on a specific service area."""
@@ -312,7 +332,19 @@ class TechnicalAdvisoryTransformation:
 
 class SpecialistBoutiqueEmergence:
     def __init__(self):
-        self.boutique_profiles = {
+        self.catalog = get_catalog("specialist_boutique_profiles", self._build_boutique_profiles)
+        self.boutique_profiles = self.catalog.records
+        self.emergence_drivers = [
+            "Increasing complexity and specialization within agriculture (e.g., new technologies, sustainability demands).",
+            "Client demand for deeper, more focused expertise than generalist consultancies can offer.",
+            "Lower barriers to entry for small firms due to technology (remote work, digital marketing).",
+            "Desire of experienced consultants to focus on passion areas or specific client types.",
+            "Ability to offer more personalized service and direct access to senior experts."
+        ]
+
+    @staticmethod
+    def _build_boutique_profiles():
+        return {
             "AgTech Strategy & Implementation Boutique": {
                 "focus_areas": ["Advising on adoption of specific AgTech (e.g., IoT, AI, robotics)", "Digital transformation roadmaps for farms/agribusinesses", "AgTech vendor selection and integration", "Data management and analytics strategy"],
                 "value_proposition": "Deep, specialized knowledge of cutting-edge AgTech and its practical application, offering more focused expertise than generalist firms.",
@@ -338,17 +370,10 @@ class SpecialistBoutiqueEmergence:
                 "key_differentiators": ["Long-standing experience and networks within the niche", "Access to proprietary data or intelligence relevant to the niche", "Ability to provide rapid, precise advice on highly specific issues"]
             }
         }
-        self.emergence_drivers = [
-            "Increasing complexity and specialization within agriculture (e.g., new technologies, sustainability demands).",
-            "Client demand for deeper, more focused expertise than generalist consultancies can offer.",
-            "Lower barriers to entry for small firms due to technology (remote work, digital marketing).",
-            "Desire of experienced consultants to focus on passion areas or specific client types.",
-            "Ability to offer more personalized service and direct access to senior experts."
-        ]
 
     def get_boutique_profile(self, boutique_type_name):
         """Retrieves the profile for a specific type of specialist boutique firm."""
-        return self.boutique_profiles.get(boutique_type_name, "Boutique type not found.")
+        return self.catalog.get(boutique_type_name, "Boutique type not found.")
 
     def analyze_competitive_advantage(self, boutique_type_name):
         """Analyzes the competitive advantages of a specific type of boutique firm."""
@@ -366,7 +391,12 @@ class SpecialistBoutiqueEmergence:
 
 class NewEntrantThreatAssessment:
     def __init__(self):
-        self.new_entrant_types = {
+        self.catalog = get_catalog("new_entrant_types", self._build_new_entrant_types)
+        self.new_entrant_types = self.catalog.records
+
+    @staticmethod
+    def _build_new_entrant_types():
+        return {
             "Technology & Data Analytics Firms (e.g., ClimateAI, EOS Data Analytics)": {
                 "primary_offerings": [
                     "SaaS platforms for precision agriculture (remote sensing, VRT, predictive analytics).",
@@ -434,7 +464,7 @@ class NewEntrantThreatAssessment:
 
     def get_entrant_type_details(self, entrant_type_name):
         """Retrieves details for a specific new entrant type."""
-        return self.new_entrant_types.get(entrant_type_name, "Entrant type not found.")
+        return self.catalog.get(entrant_type_name, "Entrant type not found.")
 
     def assess_threat_to_traditional_model(self, entrant_type_name):
         """Assesses the threat level and nature posed by a new entrant type to traditional agricultural consulting."""
@@ -458,6 +488,15 @@ class CompetitiveLandscapeReshaping:
         self.specialist_boutiques = SpecialistBoutiqueEmergence()
         self.new_entrants_assessment = NewEntrantThreatAssessment()
 
+    def resolve_query(self, query: str, limit: int = 5):
+        """
+        Resolves a free-text name (exact, any case, without the "(e.g., ...)" examples, partial words or
+        small misspellings) against the firm, provider, advisory, boutique and entrant catalogs.
+        """
+        components = (self.strategy_positioning, self.market_intelligence_evolution, self.technical_advisory_transformation,
+                      self.specialist_boutiques, self.new_entrants_assessment)
+        return resolve_anywhere(query, limit, names=[component.catalog.name for component in components])
+
     def analyze_firm_positioning(self, firm_type: str):
         print(f"--- Analyzing Strategy Firm Positioning for: {firm_type} ---")
         details = self.strategy_positioning.get_firm_positioning_details(firm_type)
@@ -527,6 +566,12 @@ if __name__ == '__main__':
     landscape_analyzer.analyze_firm_positioning("Technology & Digital Transformation Focused Firm (e.g., Accenture, Capgemini)")
     landscape_analyzer.compare_firm_stances("Global Strategy Leader (e.g., BCG, McKinsey)", "Boutique/Specialist Agribusiness Consultancy (e.g., Strategia Ag, Food Systems Foresight)")
 
+    print("\\n========= Catalog Name Resolution =========")
+    for catalog_query in ["global strategy leader", "mckinsey", "agtech boutique", "precision agronomy", "sustainabilty esg advisory"]:
+        best_match = landscape_analyzer.resolve_query(catalog_query, limit=1)
+        if best_match:
+            print(f"  '{catalog_query}' -> {best_match[0]['name']} [{best_match[0]['catalog']}, {best_match[0]['match']}, score {best_match[0]['score']}]")
+
     print("\\n========= Market Intelligence Provider Evolution Analysis =========")
     landscape_analyzer.analyze_market_intelligence_trends()
     provider_details = landscape_analyzer.market_intelligence_evolution.get_provider_type_details("Specialized Agri-Intelligence Firms (e.g., Gro Intelligence, Informa Agribusiness Intelligence/IEG, Mintec)")
@@ -1,5 +1,10 @@
 # This module will cover the evolution of consulting service portfolios.
 
+try:
+    from .catalog_registry import get_catalog
+except ImportError:  # run as a script from this directory
+    from catalog_registry import get_catalog
+
 class ServiceOfferingDevelopment:
     def __init__(self):
         self.offerings = {
@@ -257,7 +262,12 @@ class ServiceDeliveryModelTransformation:
 
 class PricingModelInnovation:
     def __init__(self):
-        self.pricing_models = {
+        self.catalog = get_catalog("pricing_models", self._build_pricing_models)
+        self.pricing_models = self.catalog.records
+
+    @staticmethod
+    def _build_pricing_models():
+        return {
             "Hourly Rate": {
                 "description": "Client is billed for each hour of work performed at a pre-agreed rate.",
                 "characteristics": ["Simple to understand and track", "Transparent effort billing"],
@@ -326,7 +336,7 @@ class PricingModelInnovation:
 
     def get_model_details(self, model_name):
         """Returns details of a specific pricing model."""
-        return self.pricing_models.get(model_name, "Pricing model not found.")
+        return self.catalog.get(model_name, "Pricing model not found.")
 
     def compare_pricing_models(self, model1_name, model2_name):
         """Compares two pricing models based on their characteristics."""
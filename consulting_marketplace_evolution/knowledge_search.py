@@ -0,0 +1,384 @@
+# This module provides ranked full-text search over the knowledge catalogs held in the simulation's modules.
+
+import ast
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import zlib
+from array import array
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class KnowledgeSearchIndex:
+    """
+    BM25F index over the dict/list catalogs (drivers, impacts, needs, competencies, offerings, ...) in the
+    simulation's source modules.
+
+    Catalogs are read from the source with ast.literal_eval, so nothing is imported or instantiated. Each
+    entry of a catalog dict (or each list catalog as a whole) is one document with three fields: its title
+    (the entry name), the catalog it belongs to and the text of all its string values. Terms are lower-cased
+    and stemmed; field term frequencies are length-normalised and weighted before BM25 saturation.
+
+    The index is kept as one segment per source module. build() re-reads a module only when its size or
+    mtime changed, and re-indexes it only when the catalogs it contains changed, so edits to code elsewhere
+    in a module leave its segment untouched.
+
+    File layout: an 8-byte magic, a length-prefixed zlib-compressed JSON header (the source root and, per source: fingerprints,
+    documents and a term -> (offset, count) table) and then all postings as little-endian uint16
+    quadruples (document, title tf, catalog tf, text tf).
+    """
+    magic = b'KNOWIDX1'
+    default_sources = (
+        "consulting_marketplace_evolution/client_need_transformation.py",
+        "consulting_marketplace_evolution/competitive_landscape_reshaping.py",
+        "consulting_marketplace_evolution/consulting_service_portfolio_evolution.py",
+        "consulting_marketplace_evolution/talent_capability_requirements.py",
+        "value_chain_reconfiguration/production_system_transformation.py"
+    )
+    fields = ("title", "catalog", "text")
+    field_weights = {"title": 3.0, "catalog": 1.0, "text": 1.0}
+    field_length_normalisation = {"title": 0.5, "catalog": 0.3, "text": 0.75}
+    k1 = 1.2
+    min_text_words = 3  # catalogs without any string of at least this many words (e.g. numeric tables) are skipped
+    stopwords = frozenset("a an and are as at be by e eg etc for from g has in into is it its of on or that the their this to with".split())
+    token_pattern = re.compile(r"[a-z0-9]+")
+    # Longest suffix first; a light stemmer so "traceability", "traceable" and "trace" share a stem
+    suffixes = ("izations", "ization", "ational", "ibility", "ability", "fulness", "iveness", "ousness", "ations", "ation",
+                "ements", "ement", "ments", "ment", "ities", "ness", "ings", "ically", "ical", "ity", "ing", "ies", "ied",
+                "ive", "ous", "ful", "able", "ible", "ers", "er", "ed", "ly", "al", "es", "s")
+
+    def __init__(self, root: str = None, index_path: str = None, sources=None):
+        self.root = root or PROJECT_ROOT
+        self.index_path = index_path or self.default_index_path(self.root)
+        self.sources = tuple(sources or self.default_sources)
+        self.segments = {}  # source -> {'fingerprint', 'documents', 'terms', 'postings'}
+        self._statistics = None
+        self._stems = {}
+        self._loaded_root = None
+
+    @staticmethod
+    def default_index_path(root: str) -> str:
+        """Index file in the temp directory named by a hash of the source root and user, so checkouts don't share one."""
+        owner = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "")
+        digest = hashlib.sha1(f"{os.path.realpath(root)}\0{owner}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(tempfile.gettempdir(), f"agri_knowledge_index_{digest}.bin")
+
+    @classmethod
+    def stem(cls, word: str) -> str:
+        if len(word) <= 3 or word.isdigit():
+            return word
+        if word.endswith("sses") or word.endswith("ss"):
+            return word[:-2] if word.endswith("sses") else word
+        for suffix in cls.suffixes:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)] + ("y" if suffix in ("ies", "ied") else "")
+                break
+        if word.endswith("e") and len(word) > 4:
+            word = word[:-1]
+        return word
+
+    def tokenize(self, text: str) -> list:
+        stems = self._stems
+        terms = []
+        for token in self.token_pattern.findall(text.lower()):
+            if token in self.stopwords:
+                continue
+            term = stems.get(token)
+            if term is None:
+                term = stems[token] = self.stem(token)
+            terms.append(term)
+        return terms
+
+    # --- Catalog extraction ---------------------------------------------------------------
+
+    @staticmethod
+    def _strings(value):
+        if isinstance(value, str):
+            yield value
+        elif isinstance(value, dict):
+            for item in value.values():
+                yield from KnowledgeSearchIndex._strings(item)
+        elif isinstance(value, (list, tuple, set)):
+            for item in value:
+                yield from KnowledgeSearchIndex._strings(item)
+
+    def _is_catalog(self, value) -> bool:
+        return isinstance(value, (dict, list)) and len(value) > 0 and \
+            any(len(text.split()) >= self.min_text_words for text in self._strings(value))
+
+    def extract_catalogs(self, source_text: str) -> dict:
+        """{'Class.attribute': literal value} for every text-bearing dict/list literal assigned or returned in a class."""
+        catalogs = {}
+        index = self
+
+        class Collector(ast.NodeVisitor):
+            def __init__(self):
+                self.scope = []
+
+            def _visit_scope(self, node):
+                self.scope.append(node.name)
+                self.generic_visit(node)
+                self.scope.pop()
+
+            visit_ClassDef = visit_FunctionDef = _visit_scope
+
+            def _record(self, name, value_node):
+                if not isinstance(value_node, (ast.Dict, ast.List)):
+                    return False
+                try:
+                    value = ast.literal_eval(value_node)
+                except (ValueError, TypeError, SyntaxError):
+                    return False
+                if not index._is_catalog(value):
+                    return False
+                owner = next((s for s in reversed(self.scope) if s[:1].isupper()), self.scope[0] if self.scope else "module")
+                catalogs[f"{owner}.{name}"] = value
+                return True
+
+            def visit_Assign(self, node):
+                target = node.targets[0]
+                name = target.attr if isinstance(target, ast.Attribute) else getattr(target, "id", None)
+                if name is None or not self._record(name, node.value):
+                    self.generic_visit(node)
+
+            def visit_Return(self, node):
+                function = self.scope[-1] if self.scope else ""
+                if not function.startswith("_build_") or not self._record(function[len("_build_"):], node.value):
+                    self.generic_visit(node)
+
+        Collector().visit(ast.parse(source_text))
+        return catalogs
+
+    @staticmethod
+    def _humanise(name: str) -> str:
+        return re.sub(r"(?<=[a-z])(?=[A-Z])", " ", name).replace("_", " ").replace(".", " ")
+
+    def _documents(self, catalogs: dict) -> list:
+        documents = []
+        for catalog, value in catalogs.items():
+            if isinstance(value, dict):
+                entries = [(" ".join(map(str, key)) if isinstance(key, tuple) else str(key), item) for key, item in value.items()]
+            else:
+                entries = [(self._humanise(catalog.split(".")[-1]), value)]
+            for title, item in entries:
+                leaves = [text for text in self._strings(item) if text.strip()]
+                if leaves:
+                    documents.append({"title": title, "catalog": catalog, "leaves": leaves})
+        return documents
+
+    # --- Segments -------------------------------------------------------------------------
+
+    def _index_segment(self, documents: list):
+        """Term table and packed postings for one source's documents."""
+        by_term = {}
+        for doc_id, document in enumerate(documents):
+            field_terms = (self.tokenize(document["title"]), self.tokenize(self._humanise(document["catalog"])),
+                           self.tokenize(" ".join(document["leaves"])))
+            document["lengths"] = [len(terms) for terms in field_terms]
+            counts = {}
+            for f, terms in enumerate(field_terms):
+                for term in terms:
+                    counts.setdefault(term, [0, 0, 0])[f] += 1
+            for term, tf in counts.items():
+                by_term.setdefault(term, []).append((doc_id, *(min(v, 65535) for v in tf)))
+        postings, terms = array('H'), {}
+        for term in sorted(by_term):
+            rows = by_term[term]
+            terms[term] = [len(postings) // 4, len(rows)]
+            for row in rows:
+                postings.extend(row)
+        return terms, postings
+
+    def _fingerprint(self, path):
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def build(self, force: bool = False) -> dict:
+        """
+        Brings the index up to date with the source modules, loading the saved index first if present.
+        The index file is rewritten only when a segment was re-indexed or dropped.
+
+        Returns:
+            dict: Sources 'reindexed' (catalogs changed), 'unchanged' (stat or catalogs identical) and 'missing'.
+        """
+        if not self.segments and not force and os.path.exists(self.index_path):
+            try:
+                self.load()
+            except (OSError, ValueError, KeyError, zlib.error):
+                self.segments = {}
+            if self._loaded_root != os.path.realpath(self.root):
+                self.segments = {}  # Index built from another checkout
+        report = {"reindexed": [], "unchanged": [], "missing": []}
+        dropped = False
+        for source in self.sources:
+            path = os.path.join(self.root, source)
+            if not os.path.exists(path):
+                dropped = self.segments.pop(source, None) is not None or dropped
+                report["missing"].append(source)
+                continue
+            fingerprint = self._fingerprint(path)
+            segment = self.segments.get(source)
+            if segment and not force and all(segment["fingerprint"].get(k) == v for k, v in fingerprint.items()):
+                report["unchanged"].append(source)
+                continue
+            with open(path, encoding="utf-8") as fh:
+                text = fh.read()
+            fingerprint["source_sha1"] = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            catalogs = self.extract_catalogs(text)
+            fingerprint["catalog_sha1"] = hashlib.sha1(json.dumps(catalogs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+            if segment and not force and segment["fingerprint"].get("catalog_sha1") == fingerprint["catalog_sha1"]:
+                segment["fingerprint"] = fingerprint
+                report["unchanged"].append(source)
+                continue
+            documents = self._documents(catalogs)
+            terms, postings = self._index_segment(documents)
+            self.segments[source] = {"fingerprint": fingerprint, "documents": documents, "terms": terms, "postings": postings}
+            report["reindexed"].append(source)
+        for source in [s for s in self.segments if s not in self.sources]:
+            del self.segments[source]
+            dropped = True
+        self._statistics = None
+        if report["reindexed"] or dropped:
+            self.save()  # An up-to-date index is left as is, so queries don't write
+        report["documents"] = sum(len(segment["documents"]) for segment in self.segments.values())
+        return report
+
+    # --- Persistence ----------------------------------------------------------------------
+
+    def save(self, path: str = None):
+        path = path or self.index_path
+        header, offset = {"root": os.path.realpath(self.root), "sources": {}}, 0
+        for source, segment in self.segments.items():
+            header["sources"][source] = {"fingerprint": segment["fingerprint"], "documents": segment["documents"],
+                                         "terms": segment["terms"], "postings_offset": offset, "postings_count": len(segment["postings"])}
+            offset += len(segment["postings"])
+        packed = zlib.compress(json.dumps(header, separators=(",", ":")).encode("utf-8"), 9)
+        # A freshly created (O_EXCL) temp file renamed over the target: no symlink at a predictable name is followed
+        descriptor, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                                dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(descriptor, "wb") as fh:
+                fh.write(self.magic)
+                fh.write(len(packed).to_bytes(8, "little"))
+                fh.write(packed)
+                for segment in self.segments.values():
+                    postings = segment["postings"]
+                    if sys.byteorder != "little":
+                        postings = array('H', postings)
+                        postings.byteswap()
+                    postings.tofile(fh)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def load(self, path: str = None):
+        path = path or self.index_path
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if data[:8] != self.magic:
+            raise ValueError(f"{path} is not a knowledge search index.")
+        header_length = int.from_bytes(data[8:16], "little")
+        header = json.loads(zlib.decompress(data[16:16 + header_length]).decode("utf-8"))
+        postings_bytes = memoryview(data)[16 + header_length:]
+        self._loaded_root = header.get("root")
+        self.segments = {}
+        for source, stored in header["sources"].items():
+            postings = array('H')
+            start = 2 * stored["postings_offset"]
+            postings.frombytes(postings_bytes[start:start + 2 * stored["postings_count"]])
+            if sys.byteorder != "little":
+                postings.byteswap()
+            self.segments[source] = {"fingerprint": stored["fingerprint"], "documents": stored["documents"],
+                                     "terms": stored["terms"], "postings": postings}
+        self._statistics = None
+        return self
+
+    # --- Search ---------------------------------------------------------------------------
+
+    def _collection_statistics(self):
+        if self._statistics is None:
+            documents = [d for segment in self.segments.values() for d in segment["documents"]]
+            n = len(documents)
+            average = [sum(d["lengths"][f] for d in documents) / n if n else 0.0 for f in range(len(self.fields))]
+            document_frequency = {}
+            for segment in self.segments.values():
+                for term, (_, count) in segment["terms"].items():
+                    document_frequency[term] = document_frequency.get(term, 0) + count
+            self._statistics = (n, average, document_frequency)
+        return self._statistics
+
+    def search(self, query: str, limit: int = 10, catalog: str = None) -> list:
+        """
+        Ranked documents for a free-text query.
+
+        Args:
+            catalog (str, optional): Only return documents from catalogs whose name contains this text.
+
+        Returns:
+            list: Hits with 'score', 'title', 'catalog', 'source' and a 'snippet' (the best matching text).
+        """
+        if not self.segments:
+            self.build()
+        n, average, document_frequency = self._collection_statistics()
+        query_terms = set(self.tokenize(query))
+        weights = [self.field_weights[f] for f in self.fields]
+        normalisation = [self.field_length_normalisation[f] for f in self.fields]
+        scores = {}
+        for source, segment in self.segments.items():
+            documents, postings = segment["documents"], segment["postings"]
+            for term in query_terms:
+                entry = segment["terms"].get(term)
+                if entry is None:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                offset, count = entry
+                for k in range(4 * offset, 4 * (offset + count), 4):
+                    doc_id = postings[k]
+                    lengths = documents[doc_id]["lengths"]
+                    tf = 0.0
+                    for f in range(3):
+                        raw = postings[k + 1 + f]
+                        if raw:
+                            tf += weights[f] * raw / (1 - normalisation[f] + normalisation[f] * lengths[f] / (average[f] or 1))
+                    key = (source, doc_id)
+                    scores[key] = scores.get(key, 0.0) + idf * tf / (self.k1 + tf)
+        if catalog:
+            needle = catalog.lower()
+            scores = {key: s for key, s in scores.items() if needle in self.segments[key[0]]["documents"][key[1]]["catalog"].lower()}
+        hits = []
+        for (source, doc_id), score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+            document = self.segments[source]["documents"][doc_id]
+            snippet = max(document["leaves"], key=lambda leaf: len(query_terms.intersection(self.tokenize(leaf))))
+            hits.append({"score": round(score, 4), "title": document["title"], "catalog": document["catalog"],
+                         "source": source, "snippet": snippet if len(snippet) <= 200 else snippet[:197] + "..."})
+        return hits
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as index_dir:
+        knowledge_index = KnowledgeSearchIndex(index_path=os.path.join(index_dir, "knowledge_index.bin"))
+        print("========= Knowledge Search Index =========")
+        build_report = knowledge_index.build()
+        print(f"Indexed {build_report['documents']} catalog entries; reindexed: {len(build_report['reindexed'])}, unchanged: {len(build_report['unchanged'])}")
+        print(f"Index file: {os.path.getsize(knowledge_index.index_path):,} bytes")
+        rebuild_report = knowledge_index.build()
+        print(f"Second build (no source changes): reindexed {rebuild_report['reindexed']}, unchanged {len(rebuild_report['unchanged'])}")
+
+        for knowledge_query in ["traceability", "climate risk adaptation", "precision agriculture adoption drivers", "data science skills"]:
+            print(f"\n--- Query: '{knowledge_query}' ---")
+            for hit in knowledge_index.search(knowledge_query, limit=3):
+                print(f"  {hit['score']:.2f}  {hit['title']}  [{hit['catalog']}]")
+                print(f"        {hit['snippet']}")
+
+        reloaded = KnowledgeSearchIndex(index_path=knowledge_index.index_path).load()
+        print(f"\nReloaded index returns the same top hit for 'traceability': {reloaded.search('traceability', 1) == knowledge_index.search('traceability', 1)}")
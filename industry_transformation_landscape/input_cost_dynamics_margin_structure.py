@@ -1,4 +1,11 @@
-# This module will handle simulations related to Input Cost Dynamics & Margin Structure. 
+# This module will handle simulations related to Input Cost Dynamics & Margin Structure.
+
+import math
+import operator
+import random
+from array import array
+from itertools import accumulate, chain, combinations, cycle, repeat
+from typing import NamedTuple
 
 class FertilizerPricePassThrough:
     def model_elasticity(self, fertilizer_type: str, crop: str):
@@ -120,6 +127,28 @@ class FertilizerCostImpact:
         cost_details['total_fertilizer_cost_usd_per_ha'] = round(total_cost, 2)
         return cost_details
 
+    def calculate_product_rates_t_per_ha(self, crop, application_rates_kg_per_ha=None):
+        """
+        Tonnes of each fertilizer product applied per hectare under the same urea/DAP/potash
+        sourcing as calculate_fertilizer_cost_per_ha. Cost per ha is then linear in product prices,
+        which lets batch and Monte Carlo callers price many scenarios without re-running the lookup.
+
+        Returns:
+            dict: e.g. {'urea': 0.217, 'dap': 0.043, 'potash': 0.05}, or {"error": ...}.
+        """
+        if crop not in self.crop_nutrient_needs_kg_per_ha:
+            return {"error": f"Crop '{crop}' not found in nutrient needs data."}
+        needs = application_rates_kg_per_ha if application_rates_kg_per_ha else self.crop_nutrient_needs_kg_per_ha[crop]
+
+        rates = {}
+        if 'N' in needs and self.nutrient_composition['urea']['N'] > 0:
+            rates['urea'] = (needs['N'] / self.nutrient_composition['urea']['N']) / 1000
+        if 'P' in needs and self.nutrient_composition['dap']['P2O5'] > 0:
+            rates['dap'] = (needs['P'] / self.nutrient_composition['dap']['P2O5']) / 1000
+        if 'K' in needs and self.nutrient_composition['potash']['K2O'] > 0:
+            rates['potash'] = (needs['K'] / self.nutrient_composition['potash']['K2O']) / 1000
+        return rates
+
     def simulate_price_impact_on_farm_costs(self, crop, percentage_change_urea=0, percentage_change_dap=0, percentage_change_potash=0):
         """
         Simulates the impact of percentage changes in fertilizer prices on per-hectare costs for a crop.
@@ -195,6 +224,174 @@ class FertilizerCostImpact:
             "fertilizer_cost_as_percent_of_total_cost": round((fertilizer_cost_usd_per_ha / total_costs_per_ha) * 100, 1) if total_costs_per_ha > 0 else 0
         }
 
+def _solve_linear_system(matrix, rhs):
+    """Gaussian elimination with partial pivoting for a small dense system; returns None if singular."""
+    n = len(rhs)
+    aug = [list(row) + [rhs[i]] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(aug[r][col]))
+        if abs(aug[pivot][col]) < 1e-12:
+            return None
+        aug[col], aug[pivot] = aug[pivot], aug[col]
+        for r in range(n):
+            if r != col:
+                factor = aug[r][col] / aug[col][col]
+                if factor:
+                    aug[r] = [a - factor * b for a, b in zip(aug[r], aug[col])]
+    return [aug[i][n] / aug[i][i] for i in range(n)]
+
+class FertilizerBlendOptimizer:
+    """
+    Least-cost fertilizer blend for a crop's N/P/K needs over every product in
+    FertilizerCostImpact.nutrient_composition, crediting all nutrients a product supplies (e.g. the N in DAP).
+
+    The LP  min price.x  s.t.  A.x >= needs, x >= 0  has its optimum at a vertex of the feasible region,
+    and that region depends only on nutrient contents and needs. Vertices are enumerated once per crop
+    and cached, so each price scenario is just a minimum over a handful of dot products.
+    """
+    # Crop needs use P and K on a P2O5 / K2O basis (see FertilizerCostImpact)
+    nutrient_keys = {'N': 'N', 'P': 'P2O5', 'K': 'K2O'}
+
+    def __init__(self, fertilizer_model: FertilizerCostImpact):
+        self.fertilizer_model = fertilizer_model
+        self._vertex_cache = {}
+
+    def add_product(self, product_name, composition, price_usd_per_tonne):
+        """
+        Registers an extra fertilizer product, e.g. add_product('map', {'N': 0.11, 'P2O5': 0.52}, 650).
+        """
+        self.fertilizer_model.nutrient_composition[product_name] = dict(composition)
+        self.fertilizer_model.baseline_prices[f'{product_name}_usd_per_tonne'] = price_usd_per_tonne
+        self._vertex_cache.clear()
+
+    def get_products(self):
+        return list(self.fertilizer_model.nutrient_composition.keys())
+
+    def _feasible_vertices(self, needs):
+        """Basic feasible solutions (tonnes/ha per product) of A.x - s = needs, x >= 0, s >= 0."""
+        products = self.get_products()
+        nutrients = [n for n in self.nutrient_keys if needs.get(n, 0) > 0]
+        cache_key = (tuple(products), tuple((n, needs[n]) for n in nutrients),
+                     tuple(tuple(sorted(self.fertilizer_model.nutrient_composition[p].items())) for p in products))
+        if cache_key in self._vertex_cache:
+            return self._vertex_cache[cache_key]
+
+        m = len(nutrients)
+        # Columns: one per product (kg nutrient per kg product), then one surplus column per nutrient
+        columns = [[self.fertilizer_model.nutrient_composition[p].get(self.nutrient_keys[n], 0.0) for n in nutrients] for p in products]
+        columns += [[-1.0 if i == k else 0.0 for i in range(m)] for k in range(m)]
+        rhs = [needs[n] for n in nutrients]
+
+        vertices = []
+        seen = set()
+        for basis in combinations(range(len(columns)), m):
+            matrix = [[columns[c][r] for c in basis] for r in range(m)]
+            solution = _solve_linear_system(matrix, rhs) if m else []
+            if solution is None or any(v < -1e-9 for v in solution):
+                continue
+            rates = [0.0] * len(products)
+            for c, v in zip(basis, solution):
+                if c < len(products):
+                    rates[c] = max(v, 0.0) / 1000  # kg -> tonnes
+            key = tuple(round(r, 9) for r in rates)
+            if key not in seen:
+                seen.add(key)
+                vertices.append(rates)
+        self._vertex_cache[cache_key] = vertices
+        return vertices
+
+    def _price_vector(self, prices):
+        return [prices.get(f'{p}_usd_per_tonne') for p in self.get_products()]
+
+    def _cheapest_vertex(self, vertices, price_vector):
+        """Returns (cost, index into vertices) of the cheapest blend."""
+        best_cost, best = float('inf'), None
+        for idx, rates in enumerate(vertices):
+            cost = 0.0
+            for r, p in zip(rates, price_vector):
+                if r:
+                    if p is None:  # No price quoted for a product the blend needs
+                        cost = float('inf')
+                        break
+                    cost += r * p
+            if cost < best_cost:
+                best_cost, best = cost, idx
+        return best_cost, best
+
+    def optimize_blend(self, crop, current_prices=None, application_rates_kg_per_ha=None):
+        """
+        Least-cost blend for one crop and one price set. Products missing from current_prices are
+        priced at baseline, as in optimize_batch.
+
+        Returns:
+            dict: Product rates and costs, nutrients delivered, and the saving against the
+                  fixed urea/DAP/potash costing of calculate_fertilizer_cost_per_ha.
+        """
+        if crop not in self.fertilizer_model.crop_nutrient_needs_kg_per_ha and not application_rates_kg_per_ha:
+            return {"error": f"Crop '{crop}' not found in nutrient needs data."}
+        prices = {**self.fertilizer_model.baseline_prices, **(current_prices or {})}
+        needs = application_rates_kg_per_ha if application_rates_kg_per_ha else self.fertilizer_model.crop_nutrient_needs_kg_per_ha[crop]
+
+        vertices = self._feasible_vertices(needs)
+        if not vertices:
+            return {"error": f"No combination of available products meets the nutrient needs for '{crop}'."}
+        products = self.get_products()
+        cost, best = self._cheapest_vertex(vertices, self._price_vector(prices))
+        if best is None:
+            return {"error": "Prices missing for every feasible blend."}
+        rates = vertices[best]
+
+        composition = self.fertilizer_model.nutrient_composition
+        delivered = {n: round(sum(r * 1000 * composition[p].get(key, 0.0) for p, r in zip(products, rates)), 2)
+                     for n, key in self.nutrient_keys.items()}
+        result = {
+            "crop": crop,
+            "blend_t_per_ha": {p: round(r, 4) for p, r in zip(products, rates) if r > 0},
+            "blend_cost_usd_per_ha": {p: round(r * prices[f'{p}_usd_per_tonne'], 2) for p, r in zip(products, rates) if r > 0},
+            "nutrients_delivered_kg_per_ha": delivered,
+            "total_fertilizer_cost_usd_per_ha": round(cost, 2)
+        }
+        if crop in self.fertilizer_model.crop_nutrient_needs_kg_per_ha:
+            fixed_sourcing = self.fertilizer_model.calculate_fertilizer_cost_per_ha(crop, prices, application_rates_kg_per_ha)
+            if "error" not in fixed_sourcing:
+                result["fixed_sourcing_cost_usd_per_ha"] = fixed_sourcing['total_fertilizer_cost_usd_per_ha']
+                result["saving_vs_fixed_sourcing_usd_per_ha"] = round(fixed_sourcing['total_fertilizer_cost_usd_per_ha'] - cost, 2)
+        return result
+
+    def optimize_batch(self, crops, price_scenarios):
+        """
+        Least-cost blends for every crop x price scenario. Vertices are built once per crop and
+        reused across all scenarios.
+
+        Args:
+            crops (list): Crop keys from crop_nutrient_needs_kg_per_ha.
+            price_scenarios (list): Price dicts keyed like baseline_prices; missing keys fall back to baseline.
+
+        Returns:
+            dict: Per crop, the minimum cost per scenario and the index of the chosen blend in 'blends'.
+        """
+        products = self.get_products()
+        baseline = self.fertilizer_model.baseline_prices
+        price_vectors = [self._price_vector({**baseline, **scenario}) for scenario in price_scenarios]
+        results = {}
+        for crop in crops:
+            needs = self.fertilizer_model.crop_nutrient_needs_kg_per_ha.get(crop)
+            if needs is None:
+                results[crop] = {"error": f"Crop '{crop}' not found in nutrient needs data."}
+                continue
+            vertices = self._feasible_vertices(needs)
+            costs, choice = [], []
+            for pv in price_vectors:
+                cost, best = self._cheapest_vertex(vertices, pv)
+                costs.append(round(cost, 2) if best is not None else 'N/A')
+                choice.append(best)
+            results[crop] = {
+                "blends": [{p: round(r, 4) for p, r in zip(products, v) if r > 0} for v in vertices],
+                "min_cost_usd_per_ha": costs,
+                "chosen_blend_index": choice
+            }
+        return results
+
 class EnergyCostAnalysis:
     """
     Analyzes the impact of energy price changes (fuel, electricity, gas) on farm operational costs.
@@ -228,23 +425,40 @@ class EnergyCostAnalysis:
         # Profile per hectare or per unit of production for representative farm types
         self.farm_energy_consumption_profile = farm_energy_consumption_profile if farm_energy_consumption_profile else {
             'large_scale_grain_farm_midwest_usa_ha': {
+                'typical_yield_t_per_ha': 10, # Corn; scales the per-tonne drying energy
                 'diesel_operations_liter': 120, # Tillage, planting, spraying, harvest
                 'electricity_irrigation_kwh': 300, # For a portion of land that is irrigated
                 'natural_gas_drying_mbtu_per_tonne_corn': 0.6,
                 'indirect_fertilizer_energy_equivalent_mbtu': 5 # Energy embedded in typical fertilizer application
             },
             'brazilian_sugarcane_farm_ha': {
+                'typical_yield_t_per_ha': 80, # Cane; scales the per-tonne cogeneration credit
                 'diesel_operations_liter': 150,
                 'bagasse_cogeneration_kwh_surplus_per_tonne_cane': -20 # Negative indicates energy production
             },
             'indian_wheat_farm_smallholder_ha':{
+                'typical_yield_t_per_ha': 3.5,
                 'diesel_operations_liter': 60,
                 'electricity_irrigation_kwh': 800 # Often heavily subsidized
             }
         }
         self.energy_sources = ['diesel', 'electricity', 'natural_gas', 'lpg', 'indirect_fertilizer_energy']
+        self._consumption_table = None
+        self._consumption_table_key = None
+
+    # Direct energy sources priced in the portfolio engine (columns of the price matrix) and their price keys
+    portfolio_sources = ('diesel', 'electricity', 'natural_gas', 'lpg')
+    portfolio_price_keys = ('diesel_usd_per_liter', 'electricity_usd_per_kwh', 'natural_gas_usd_per_mbtu', 'lpg_usd_per_gallon')
+    # Profile key -> (source, basis); 'per_tonne' quantities scale with actual production
+    consumption_basis = {
+        'diesel_operations_liter': ('diesel', 'per_ha'),
+        'electricity_irrigation_kwh': ('electricity', 'per_ha'),
+        'natural_gas_drying_mbtu_per_tonne_corn': ('natural_gas', 'per_tonne'),
+        'bagasse_cogeneration_kwh_surplus_per_tonne_cane': ('electricity', 'per_tonne'),  # Negative: credited at the power price
+        'lpg_drying_gallon_per_tonne': ('lpg', 'per_tonne')
+    }
 
-    def calculate_direct_energy_cost(self, farm_type, area_ha, current_energy_prices):
+    def calculate_direct_energy_cost(self, farm_type, area_ha, current_energy_prices, yield_t_per_ha=None):
         """
         Calculates the direct energy cost for a given farm type and area based on current prices.
 
@@ -253,15 +467,22 @@ class EnergyCostAnalysis:
             area_ha (float): Total area in hectares.
             current_energy_prices (dict): Current prices for energy sources.
                                           Example: {'diesel_usd_per_liter': 1.2, 'electricity_usd_per_kwh': 0.18}
+            yield_t_per_ha (float, optional): Harvested yield for per-tonne energy (drying, cogeneration);
+                                              defaults to the profile's 'typical_yield_t_per_ha'.
 
         Returns:
-            dict: Detailed direct energy costs and total.
+            dict: Detailed direct energy costs and total, or an error if the profile has per-tonne energy
+                  but no yield is given or profiled.
                   Example: {'diesel_cost': 12000, 'electricity_cost': 2700, 'total_direct_cost': 14700}
         """
         if farm_type not in self.farm_energy_consumption_profile:
             return {"error": f"Farm type '{farm_type}' not found in profile."}
 
         profile = self.farm_energy_consumption_profile[farm_type]
+        if yield_t_per_ha is None:
+            yield_t_per_ha = profile.get('typical_yield_t_per_ha')
+        if yield_t_per_ha is None and any(self.consumption_basis.get(k, (None, None))[1] == 'per_tonne' for k in profile):
+            return {"error": f"Farm type '{farm_type}' has per-tonne energy use; pass yield_t_per_ha or profile 'typical_yield_t_per_ha'."}
         costs = {'total_direct_cost_usd': 0} # Ensure key exists
 
         # Diesel for operations
@@ -279,17 +500,29 @@ class EnergyCostAnalysis:
         # Natural gas for drying (example for corn)
         # This calculation would need production estimates (tonnes) rather than just area for accuracy
         if 'natural_gas_drying_mbtu_per_tonne_corn' in profile and 'natural_gas_usd_per_mbtu' in current_energy_prices:
-            # Placeholder: Assume a yield for calculation, e.g., 10 tonnes/ha for corn
-            assumed_yield_tonnes_per_ha = 10 # This should ideally be an input or from a crop model
-            total_production_tonnes = assumed_yield_tonnes_per_ha * area_ha
+            total_production_tonnes = yield_t_per_ha * area_ha
             drying_cost = profile['natural_gas_drying_mbtu_per_tonne_corn'] * total_production_tonnes * current_energy_prices['natural_gas_usd_per_mbtu']
             costs['natural_gas_drying_cost_usd'] = round(drying_cost, 2)
             costs['total_direct_cost_usd'] += drying_cost
 
+        # LPG for drying, per tonne harvested
+        if 'lpg_drying_gallon_per_tonne' in profile and 'lpg_usd_per_gallon' in current_energy_prices:
+            lpg_cost = profile['lpg_drying_gallon_per_tonne'] * yield_t_per_ha * area_ha * current_energy_prices['lpg_usd_per_gallon']
+            costs['lpg_drying_cost_usd'] = round(lpg_cost, 2)
+            costs['total_direct_cost_usd'] += lpg_cost
+
+        # Surplus bagasse cogeneration power (negative kWh per tonne of cane) is credited at the electricity price,
+        # as in calculate_portfolio_energy_costs
+        if 'bagasse_cogeneration_kwh_surplus_per_tonne_cane' in profile and 'electricity_usd_per_kwh' in current_energy_prices:
+            cogeneration_credit = profile['bagasse_cogeneration_kwh_surplus_per_tonne_cane'] * yield_t_per_ha * area_ha * current_energy_prices['electricity_usd_per_kwh']
+            costs['bagasse_cogeneration_credit_usd'] = round(cogeneration_credit, 2)
+            costs['total_direct_cost_usd'] += cogeneration_credit
+
         costs['total_direct_cost_usd'] = round(costs['total_direct_cost_usd'], 2)
         return costs
 
-    def analyze_price_change_impact(self, farm_type, area_ha, percentage_change_diesel=0, percentage_change_electricity=0, percentage_change_natural_gas=0):
+    def analyze_price_change_impact(self, farm_type, area_ha, percentage_change_diesel=0, percentage_change_electricity=0, percentage_change_natural_gas=0,
+                                    yield_t_per_ha=None):
         """
         Analyzes the impact of percentage changes in key energy prices on direct costs.
 
@@ -299,12 +532,13 @@ class EnergyCostAnalysis:
             percentage_change_diesel (float): Percentage change in diesel price (e.g., 10 for 10% increase).
             percentage_change_electricity (float): Percentage change in electricity price.
             percentage_change_natural_gas (float): Percentage change in natural gas price.
+            yield_t_per_ha (float, optional): Harvested yield, as for calculate_direct_energy_cost.
 
         Returns:
             dict: Cost impact analysis.
                   Example: {'baseline_costs': {...}, 'new_costs': {...}, 'cost_increase_usd': ..., 'cost_increase_percent': ...}
         """
-        baseline_direct_costs = self.calculate_direct_energy_cost(farm_type, area_ha, self.baseline_energy_prices)
+        baseline_direct_costs = self.calculate_direct_energy_cost(farm_type, area_ha, self.baseline_energy_prices, yield_t_per_ha)
         if "error" in baseline_direct_costs:
             return baseline_direct_costs
 
@@ -316,7 +550,7 @@ class EnergyCostAnalysis:
         if 'natural_gas_usd_per_mbtu' in new_prices:
             new_prices['natural_gas_usd_per_mbtu'] *= (1 + percentage_change_natural_gas / 100)
 
-        new_direct_costs = self.calculate_direct_energy_cost(farm_type, area_ha, new_prices)
+        new_direct_costs = self.calculate_direct_energy_cost(farm_type, area_ha, new_prices, yield_t_per_ha)
         if "error" in new_direct_costs:
              return new_direct_costs
 
@@ -378,6 +612,223 @@ class EnergyCostAnalysis:
             'estimated_change_in_indirect_cost_usd': round(change_in_indirect_cost, 2)
         }
 
+    def get_consumption_table(self):
+        """
+        Array-backed view of farm_energy_consumption_profile for the portfolio engine.
+
+        Returns:
+            dict: 'farm_types' (row order, i.e. the integer farm-type codes), 'sources' (column order),
+                  flat array('d') tables 'per_ha' and 'per_tonne' indexed [code * n_sources + source] and
+                  'typical_yield' per code (NaN if not profiled). Rebuilt only when the profile dict changes.
+        """
+        key = tuple((ft, tuple(sorted(p.items()))) for ft, p in self.farm_energy_consumption_profile.items())
+        if self._consumption_table_key != key:
+            farm_types = list(self.farm_energy_consumption_profile)
+            n_src = len(self.portfolio_sources)
+            per_ha = array('d', bytes(8 * n_src * len(farm_types)))
+            per_tonne = array('d', per_ha)
+            for code, farm_type in enumerate(farm_types):
+                for profile_key, qty in self.farm_energy_consumption_profile[farm_type].items():
+                    if profile_key in self.consumption_basis:
+                        source, basis = self.consumption_basis[profile_key]
+                        table = per_ha if basis == 'per_ha' else per_tonne
+                        table[code * n_src + self.portfolio_sources.index(source)] += qty
+            typical_yield = array('d', (self.farm_energy_consumption_profile[ft].get('typical_yield_t_per_ha', math.nan)
+                                        for ft in farm_types))
+            self._consumption_table = {'farm_types': farm_types, 'sources': list(self.portfolio_sources),
+                                       'per_ha': per_ha, 'per_tonne': per_tonne, 'typical_yield': typical_yield}
+            self._consumption_table_key = key
+        return self._consumption_table
+
+    def _farm_type_codes(self, farm_types, areas_ha, yields_t_per_ha):
+        """Integer farm-type codes for the portfolio, or an error dict."""
+        n = len(areas_ha)
+        if len(farm_types) != n or (yields_t_per_ha is not None and len(yields_t_per_ha) != n):
+            return {"error": "farm_types, areas_ha and yields_t_per_ha must have the same length."}
+        farm_type_list = self.get_consumption_table()['farm_types']
+        lookup = {ft: code for code, ft in enumerate(farm_type_list)}
+        codes = []
+        for ft in farm_types:
+            code = lookup.get(ft, ft)
+            if not isinstance(code, int) or not 0 <= code < len(farm_type_list):
+                return {"error": f"Farm type '{ft}' not found in profile."}
+            codes.append(code)
+        return codes
+
+    def _portfolio_yields(self, codes, yields_t_per_ha):
+        """Yield per farm, with None entries (or no list) taken from the farm type's typical yield; or an error dict."""
+        table = self.get_consumption_table()
+        typical, per_tonne, n_src = table['typical_yield'], table['per_tonne'], len(self.portfolio_sources)
+        if yields_t_per_ha is None:
+            yields_t_per_ha = repeat(None, len(codes))
+        yields = array('d')
+        for code, y in zip(codes, yields_t_per_ha):
+            if y is None:
+                y = typical[code]
+                if math.isnan(y):
+                    if any(per_tonne[code * n_src:(code + 1) * n_src]):
+                        return {"error": f"Farm type '{table['farm_types'][code]}' has per-tonne energy use; "
+                                         "pass its yield or profile 'typical_yield_t_per_ha'."}
+                    y = 0.0
+            yields.append(y)
+        return yields
+
+    def _portfolio_quantities(self, codes, areas_ha, yields_t_per_ha):
+        """Energy quantities per farm and source (columns of length n_farms; None where no farm type uses the source)."""
+        table = self.get_consumption_table()
+        n_src = len(self.portfolio_sources)
+        mul, add = operator.mul, operator.add
+        columns = []
+        for s in range(n_src):
+            per_ha = table['per_ha'][s::n_src]
+            per_tonne = table['per_tonne'][s::n_src]
+            if not any(per_ha) and not any(per_tonne):
+                columns.append(None)  # Source unused by every farm type
+                continue
+            per_ha_farm = map(per_ha.__getitem__, codes)
+            if any(per_tonne):
+                per_ha_farm = map(add, per_ha_farm, map(mul, map(per_tonne.__getitem__, codes), yields_t_per_ha))
+            columns.append(array('d', map(mul, per_ha_farm, areas_ha)))
+        return columns
+
+    def _price_rows(self, price_matrix):
+        """Flattens scenarios x sources prices; rows may be sequences in portfolio_sources order or price dicts."""
+        flat = array('d')
+        for row in price_matrix:
+            if isinstance(row, dict):
+                row = [row.get(k, self.baseline_energy_prices.get(k, 0.0)) for k in self.portfolio_price_keys]
+            elif len(row) != len(self.portfolio_sources):
+                return None
+            flat.extend(row)
+        return flat
+
+    def iter_portfolio_energy_cost_chunks(self, farm_types, areas_ha, yields_t_per_ha, price_matrix,
+                                          reduce='tensor', scenario_chunk_size=None, max_chunk_bytes=256 * 2**20):
+        """
+        Streams portfolio energy costs one block of price scenarios at a time.
+
+        cost[f, k, s] = area[f] * (per_ha[type_f, s] + yield[f] * per_tonne[type_f, s]) * price[k, s].
+        The farm-side factor is built once; each chunk is then an outer product against that block of price rows.
+
+        Args:
+            farm_types (list): Farm-type keys or integer codes (row order of get_consumption_table()).
+            areas_ha (list): Area per farm.
+            yields_t_per_ha (list): Actual yield per farm, used for per-tonne (drying, cogeneration) energy. None
+                                    (for the list or an entry) uses the farm type's 'typical_yield_t_per_ha'.
+            price_matrix (list): Scenarios x sources, in portfolio_sources order, or one price dict per scenario.
+            reduce (str): 'tensor' (farms x scenarios x sources) or 'farm_scenario' (farms x scenarios, summed over sources).
+            scenario_chunk_size (int, optional): Scenarios per chunk; by default sized to stay under max_chunk_bytes.
+
+        Yields:
+            dict: 'scenario_start', 'scenario_stop' and 'costs', a flat array('d') in farm-major order.
+        """
+        codes = self._farm_type_codes(farm_types, areas_ha, yields_t_per_ha)
+        if isinstance(codes, dict):
+            yield codes
+            return
+        yields_t_per_ha = self._portfolio_yields(codes, yields_t_per_ha)
+        if isinstance(yields_t_per_ha, dict):
+            yield yields_t_per_ha
+            return
+        prices = self._price_rows(price_matrix)
+        if prices is None:
+            yield {"error": f"Price rows must have {len(self.portfolio_sources)} entries ({', '.join(self.portfolio_sources)})."}
+            return
+        if reduce not in ('tensor', 'farm_scenario'):
+            yield {"error": f"Unknown reduce '{reduce}'. Use 'tensor' or 'farm_scenario'."}
+            return
+        n_farms, n_src = len(areas_ha), len(self.portfolio_sources)
+        n_scen = len(prices) // n_src
+        per_scenario = n_farms * (n_src if reduce == 'tensor' else 1) * 8
+        chunk = scenario_chunk_size or max(1, max_chunk_bytes // max(per_scenario, 1))
+        zero = array('d', bytes(8 * n_farms))
+        mul, add = operator.mul, operator.add
+        table = self.get_consumption_table()
+        if reduce == 'tensor':
+            # Farm-major quantity rows; each farm's block is its row cycled against the flat price block
+            columns = self._portfolio_quantities(codes, areas_ha, yields_t_per_ha)
+            quantities = array('d', chain.from_iterable(zip(*[c if c is not None else zero for c in columns])))
+
+        for k0 in range(0, n_scen, chunk):
+            k1 = min(k0 + chunk, n_scen)
+            costs = array('d')
+            if reduce == 'tensor':
+                block = prices[k0 * n_src:k1 * n_src]
+                for f in range(n_farms):
+                    costs.extend(map(mul, block, cycle(quantities[f * n_src:(f + 1) * n_src])))
+            else:
+                # Summed over sources: cost[f, k] = area[f] * unit_ha[type_f, k] + area[f] * yield[f] * unit_t[type_f, k],
+                # with the per-type unit costs (price rows . consumption rows) computed once per chunk
+                unit = {}
+                for code in set(codes):
+                    rows = []
+                    for basis in ('per_ha', 'per_tonne'):
+                        coeffs = table[basis][code * n_src:(code + 1) * n_src]
+                        if any(coeffs):
+                            block = prices[k0 * n_src:k1 * n_src]
+                            terms = map(mul, block, cycle(coeffs))
+                            rows.append(array('d', map(sum, zip(*[terms] * n_src))))
+                        else:
+                            rows.append(None)
+                    unit[code] = rows
+                for f in range(n_farms):
+                    per_ha_cost, per_tonne_cost = unit[codes[f]]
+                    area = areas_ha[f]
+                    if per_tonne_cost is None:
+                        costs.extend(map(mul, per_ha_cost, repeat(area)) if per_ha_cost is not None else repeat(0.0, k1 - k0))
+                    elif per_ha_cost is None:
+                        costs.extend(map(mul, per_tonne_cost, repeat(area * yields_t_per_ha[f])))
+                    else:
+                        costs.extend(map(add, map(mul, per_ha_cost, repeat(area)), map(mul, per_tonne_cost, repeat(area * yields_t_per_ha[f]))))
+            yield {"scenario_start": k0, "scenario_stop": k1, "costs": costs}
+
+    def calculate_portfolio_energy_costs(self, farm_types, areas_ha, yields_t_per_ha, price_matrix,
+                                         reduce='portfolio'):
+        """
+        Direct energy costs for a farm portfolio under many price scenarios.
+
+        Args:
+            reduce (str): 'portfolio' (scenarios x sources totals over all farms; memory independent of farm count),
+                          'farm_scenario' (farms x scenarios) or 'tensor' (farms x scenarios x sources).
+                          The last two are materialized in full, so large runs should use
+                          iter_portfolio_energy_cost_chunks instead.
+            Other args as for iter_portfolio_energy_cost_chunks.
+
+        Returns:
+            dict: 'costs' as a flat array('d') with its 'shape' and axis labels, or an error.
+        """
+        if reduce == 'portfolio':
+            # Summing over farms first collapses the contraction to (sum_f q[f, s]) * price[k, s]
+            codes = self._farm_type_codes(farm_types, areas_ha, yields_t_per_ha)
+            if isinstance(codes, dict):
+                return codes
+            yields_t_per_ha = self._portfolio_yields(codes, yields_t_per_ha)
+            if isinstance(yields_t_per_ha, dict):
+                return yields_t_per_ha
+            columns = self._portfolio_quantities(codes, areas_ha, yields_t_per_ha)
+            prices = self._price_rows(price_matrix)
+            if prices is None:
+                return {"error": f"Price rows must have {len(self.portfolio_sources)} entries ({', '.join(self.portfolio_sources)})."}
+            totals = [math.fsum(c) if c is not None else 0.0 for c in columns]
+            costs = array('d', map(operator.mul, prices, cycle(totals)))
+            shape = (len(prices) // len(totals), len(totals))
+            axes = ('scenario', 'source')
+        else:
+            # One chunk spanning every scenario keeps the flat result in farm-major order
+            part = next(self.iter_portfolio_energy_cost_chunks(farm_types, areas_ha, yields_t_per_ha, price_matrix,
+                                                               reduce, scenario_chunk_size=max(len(price_matrix), 1)), None)
+            if part is None:
+                part = {"costs": array('d'), "scenario_stop": 0}
+            if "error" in part:
+                return part
+            costs = part['costs']
+            shape = (len(areas_ha), part['scenario_stop'])
+            axes = ('farm', 'scenario')
+            if reduce == 'tensor':
+                shape += (len(self.portfolio_sources),)
+                axes += ('source',)
+        return {"shape": shape, "axes": axes, "sources": list(self.portfolio_sources), "costs": costs}
+
 class SeedCostTechnologyImpact: # Placeholder
     def simulate_impact(self, seed_type: str, crop: str):
         pass
@@ -533,10 +984,385 @@ class LabourCostDynamics:
             'overall_est_h2a_cost_usd': round(overall_total, 2)
         }
 
+class MechanizationFleetEvaluator:
+    """
+    Discounted NPV / IRR / payback for farm profiles x mechanization options x wage-growth paths.
+
+    For a machine with lifespan L the year-t cash flow is
+        cf_t = labour_savings * G_t - fixed_costs  (+ salvage in year L),
+    where labour_savings is the year-1 net wage saving of assess_mechanization_roi (skilled operator
+    wages netted off), fixed_costs are maintenance and running costs, and G_t is the cumulative wage
+    index of the growth path (G_1 = 1). For each (machine, path) pair the cash flows are columns over
+    all farms, so NPV and every Newton step of the IRR solve are Horner evaluations of the cash-flow
+    polynomial in x = 1 / (1 + r) run across the whole fleet at once.
+    """
+    default_wage_growth_paths = {'flat': 0.0, 'steady_3pct': 0.03, 'tight_market_6pct': 0.06}
+
+    def __init__(self, labour_model: LabourCostDynamics):
+        self.labour_model = labour_model
+
+    @staticmethod
+    def _wage_index(growth, years):
+        """Cumulative wage index G_1..G_years for a constant rate or a list of annual rates (last rate repeats)."""
+        rates = list(growth) if isinstance(growth, (list, tuple)) else [growth]
+        index, level = [], 1.0
+        for t in range(years):
+            index.append(level)
+            level *= 1 + rates[min(t, len(rates) - 1)]
+        return index
+
+    def _farm_terms(self, machine, farm_profiles):
+        """Year-1 labour savings and fixed annual costs per farm, mirroring assess_mechanization_roi."""
+        mech_key, spec = machine
+        reduction = spec.get('labor_reduction_percent', spec.get('efficiency_gain_percent', 0)) / 100
+        savings, fixed = array('d'), array('d')
+        for farm in farm_profiles:
+            labour = self.labour_model.calculate_labor_cost_per_ha(farm['crop_key'], farm['wage_key'])
+            op_hrs = farm.get('annual_op_hrs') or 0
+            if isinstance(op_hrs, dict):
+                op_hrs = op_hrs.get(mech_key, 0)
+            wage = labour['wage_rate_usd_per_hr']
+            saving = labour['labor_hrs_per_ha'] * farm['area_ha'] * reduction * wage
+            if 'skilled_op_hr_day' in spec and op_hrs:
+                saving -= op_hrs * spec.get('skilled_op_wage_hr_usd', wage * 1.5)
+            savings.append(saving)
+            fixed.append(spec['maint_usd_annual'] + op_hrs * spec.get('ops_cost_hr_usd', 0))
+        return savings, fixed
+
+    @staticmethod
+    def _polynomial(coefficients, x, derivative=False):
+        """Sum_t c_t x^t (or its derivative in x) for columns coefficients[0..L-1] = c_1..c_L, elementwise over x."""
+        mul, add = operator.mul, operator.add
+        top = len(coefficients)
+        if derivative:
+            acc = list(map(mul, coefficients[-1], repeat(float(top))))
+            for t in range(top - 1, 0, -1):
+                acc = list(map(add, map(mul, acc, x), map(mul, coefficients[t - 1], repeat(float(t)))))
+            return acc
+        acc = list(coefficients[-1])
+        for t in range(top - 1, 0, -1):
+            acc = list(map(add, map(mul, acc, x), coefficients[t - 1]))
+        return list(map(mul, acc, x))
+
+    def _batched_irr(self, coefficients, investment, tol=1e-10, max_iter=60):
+        """Newton iteration on NPV(x) = P(x) - I for every farm at once; None where no IRR exists."""
+        n = len(coefficients[0])
+        x = [1 / 1.1] * n
+        active = list(range(n))
+        for _ in range(max_iter):
+            if not active:
+                break
+            xs = [x[i] for i in active]
+            cols = [[c[i] for i in active] for c in coefficients]
+            values = self._polynomial(cols, xs)
+            slopes = self._polynomial(cols, xs, derivative=True)
+            still_active = []
+            for i, xi, v, d in zip(active, xs, values, slopes):
+                if d == 0:
+                    continue
+                step = (v - investment) / d
+                x_new = min(max(xi - step, 1e-6), 1e3)  # r between -99.9% and 10^6 %
+                x[i] = x_new
+                if abs(x_new - xi) > tol * max(1.0, xi):
+                    still_active.append(i)
+            active = still_active
+        residuals = self._polynomial(coefficients, x)
+        scale = max(abs(investment), 1.0)
+        return [1 / xi - 1 if abs(v - investment) <= 1e-6 * scale and 1e-6 < xi < 1e3 else None
+                for xi, v in zip(x, residuals)]
+
+    @staticmethod
+    def _payback(coefficients, investment, discount=None):
+        """Years until cumulative (optionally discounted) cash flow recovers the investment, interpolated within the year."""
+        years = len(coefficients)
+        result = []
+        for flows in zip(*coefficients):
+            cumulative, payback = 0.0, None
+            for t, cf in enumerate(flows, start=1):
+                cf = cf * discount ** t if discount is not None else cf
+                if cf > 0 and cumulative + cf >= investment:
+                    payback = t - 1 + (investment - cumulative) / cf
+                    break
+                cumulative += cf
+            result.append(round(payback, 2) if payback is not None and payback <= years else 'N/A')
+        return result
+
+    def evaluate_fleet(self, farm_profiles, machine_keys=None, wage_growth_paths=None, discount_rate=0.07,
+                       salvage_value_percent=0.0, top_n=None):
+        """
+        Evaluates every farm x machine x wage path combination and ranks the options per farm.
+
+        Args:
+            farm_profiles (list): Dicts with 'crop_key', 'wage_key', 'area_ha', optional 'farm_id' and
+                                  'annual_op_hrs' (a number, or a dict per machine key).
+            machine_keys (list, optional): Keys of labour_model.mechanization_options; defaults to all.
+            wage_growth_paths (dict, optional): Path name -> annual wage growth (float) or list of annual rates.
+            discount_rate (float): Discount rate for NPV and discounted payback, e.g. 0.07.
+            salvage_value_percent (float): Resale value at end of life, % of purchase cost.
+            top_n (int, optional): Keep only the best n options per farm and path.
+
+        Returns:
+            dict: Per farm and wage path, options ranked by NPV with IRR, payback and first-year ROI,
+                  plus the best option per farm and path (None where no option has a positive NPV).
+        """
+        options = self.labour_model.mechanization_options
+        machine_keys = machine_keys if machine_keys else list(options)
+        paths = wage_growth_paths if wage_growth_paths else self.default_wage_growth_paths
+        for key in machine_keys:
+            if key not in options:
+                return {"error": f"Mechanization key '{key}' not found."}
+        farm_ids = []
+        for idx, farm in enumerate(farm_profiles):
+            if farm.get('crop_key') not in self.labour_model.regional_labor_profile or farm.get('wage_key') not in self.labour_model.baseline_wage_rates:
+                return {"error": f"Invalid crop profile or wage key for farm {farm.get('farm_id', idx)}."}
+            farm_ids.append(farm.get('farm_id', idx))
+
+        mul, sub = operator.mul, operator.sub
+        x_discount = 1 / (1 + discount_rate)
+        n_farms = len(farm_profiles)
+        ranked = {fid: {p: [] for p in paths} for fid in farm_ids}
+        for mech_key in machine_keys:
+            spec = options[mech_key]
+            investment = spec['cost_usd']
+            lifespan = int(spec['lifespan_yr'])
+            salvage = investment * salvage_value_percent / 100
+            savings, fixed = self._farm_terms((mech_key, spec), farm_profiles)
+            for path_name, growth in paths.items():
+                # Cash-flow matrix: one column per year of the machine's life, one row per farm
+                coefficients = [list(map(sub, map(mul, savings, repeat(g)), fixed)) for g in self._wage_index(growth, lifespan)]
+                if salvage:
+                    coefficients[-1] = [cf + salvage for cf in coefficients[-1]]
+                npv = self._polynomial(coefficients, [x_discount] * n_farms)
+                irr = self._batched_irr(coefficients, investment)
+                payback = self._payback(coefficients, investment)
+                discounted_payback = self._payback(coefficients, investment, x_discount)
+                for f, fid in enumerate(farm_ids):
+                    ranked[fid][path_name].append({
+                        'mech_option': mech_key,
+                        'npv_usd': round(npv[f] - investment, 2),
+                        'irr_percent': round(irr[f] * 100, 2) if irr[f] is not None else 'N/A',
+                        'payback_years': payback[f],
+                        'discounted_payback_years': discounted_payback[f],
+                        'first_year_net_savings_usd': round(coefficients[0][f], 2),
+                        'first_year_roi_pct': round(coefficients[0][f] / investment * 100, 2) if investment > 0 else 'N/A'
+                    })
+
+        best = {}
+        for fid, by_path in ranked.items():
+            best[fid] = {}
+            for path_name, rows in by_path.items():
+                rows.sort(key=lambda r: r['npv_usd'], reverse=True)
+                if top_n:
+                    del rows[top_n:]
+                best[fid][path_name] = rows[0]['mech_option'] if rows and rows[0]['npv_usd'] > 0 else None
+        return {
+            'discount_rate': discount_rate,
+            'wage_growth_paths': {k: v if isinstance(v, (int, float)) else list(v) for k, v in paths.items()},
+            'machines': machine_keys,
+            'num_combinations': n_farms * len(machine_keys) * len(paths),
+            'ranked_options_by_farm': ranked,
+            'best_option_by_farm': best
+        }
+
+class H2AWorkforcePlanner:
+    """
+    Cheapest weekly mix of domestic and H-2A workers over a 52-week horizon.
+
+    Weekly labour need comes from the crop's regional_labor_profile (pre-harvest and harvest hours per ha)
+    spread over its calendar weeks. Domestic workers are hired week by week at the domestic wage up to the
+    local availability; H-2A workers are paid the AEWR for a full week plus housing while on contract, and
+    each arrival carries the fixed transport and admin overheads of LabourCostDynamics.
+    The plan is a dynamic program over the number of H-2A workers on site: arrivals pay the overhead,
+    releases are free, and the minimum over predecessors is a prefix/suffix minimum, so each week costs
+    O(max headcount).
+    """
+    weeks_per_year = 52
+    hours_per_worker_week = 40
+    # Calendar weeks (inclusive, 1-based) over which each labour profile's hours are spread
+    default_crop_calendar = {
+        'grain_avg': {'pre_harvest_weeks': (14, 22), 'harvest_weeks': (38, 44)},
+        'fruit_manual_hg': {'pre_harvest_weeks': (8, 24), 'harvest_weeks': (25, 38)},
+        'veg_mixed_hg': {'pre_harvest_weeks': (6, 18), 'harvest_weeks': (19, 40)}
+    }
+
+    def __init__(self, labour_model: LabourCostDynamics):
+        self.labour_model = labour_model
+        self._plan_cache = {}
+
+    def weekly_labour_hours(self, crop_profile_key, area_ha, calendar=None):
+        """Hours of field labour needed in each of the 52 weeks for a crop profile and area."""
+        if crop_profile_key not in self.labour_model.regional_labor_profile:
+            return {"error": f"Crop profile '{crop_profile_key}' not found."}
+        calendar = calendar if calendar else self.default_crop_calendar.get(crop_profile_key)
+        if not calendar:
+            return {"error": f"No crop calendar for '{crop_profile_key}'; pass pre_harvest_weeks and harvest_weeks."}
+        profile = self.labour_model.regional_labor_profile[crop_profile_key]
+        hours = [0.0] * self.weeks_per_year
+        for phase, key in (('pre_harvest_weeks', 'pre_harvest_hrs'), ('harvest_weeks', 'harvest_hrs')):
+            start, end = calendar[phase]
+            span = end - start + 1
+            if not 1 <= start <= end <= self.weeks_per_year:
+                return {"error": f"Invalid {phase} {calendar[phase]}; weeks run 1-{self.weeks_per_year}."}
+            per_week = profile.get(key, 0) * area_ha / span
+            for w in range(start - 1, end):
+                hours[w] += per_week
+        return hours
+
+    def _solve(self, need, domestic_cap, domestic_week_cost, h2a_week_cost, arrival_cost, max_h2a):
+        """DP over H-2A headcount; returns (total cost, weekly H-2A headcounts) or (None, failing week)."""
+        inf = float('inf')
+        top = min(max(need), max_h2a) if need else 0
+        heads = range(top + 1)
+        sub, mul = operator.sub, operator.mul
+        arrival_line = [arrival_cost * h for h in heads]
+        values = [0.0] + [inf] * top  # Nobody on contract before week 1
+        history = []
+        for w, n_w in enumerate(need):
+            # Best way to reach h workers: release down from any hp >= h for free, or bring in h - hp arrivals
+            ramp_up = list(accumulate(map(sub, values, arrival_line), min))
+            keep_or_release = list(accumulate(reversed(values), min))[::-1]
+            cap = domestic_cap[w]
+            values = [
+                (d if d < u + a else u + a) + (short * domestic_week_cost if short > 0 else 0.0) + h * h2a_week_cost
+                if short <= cap else inf
+                for h, d, u, a, short in zip(heads, keep_or_release, ramp_up, arrival_line, map(sub, repeat(n_w), heads))
+            ]
+            history.append(values)
+            if min(values) == inf:
+                return None, w + 1
+
+        # Backtrack: at each week pick the predecessor headcount that attains the recorded value
+        h = min(heads, key=values.__getitem__)
+        total = values[h]
+        plan = [0] * len(need)
+        for w in range(len(need) - 1, -1, -1):
+            plan[w] = h
+            if w == 0:
+                break
+            short = need[w] - h
+            weekly = (short * domestic_week_cost if short > 0 else 0.0) + h * h2a_week_cost
+            target = history[w][h] - weekly
+            previous = history[w - 1]
+            if abs(min(previous[h:]) - target) <= 1e-6 * max(1.0, abs(target)):
+                h = min(range(h, top + 1), key=previous.__getitem__)
+            else:
+                h = min(range(h), key=lambda hp: previous[hp] + arrival_cost * (h - hp))
+        return total, plan
+
+    def plan_farm(self, farm):
+        """
+        Optimal weekly staffing for one farm.
+
+        Args:
+            farm (dict): 'crop_key' (regional_labor_profile key) and 'area_ha', or 'weekly_hours' (52 values);
+                         optional 'farm_id', 'pre_harvest_weeks'/'harvest_weeks' (start, end) calendar overrides,
+                         'domestic_wage_key' (default 'us_avg_field_worker'), 'aewr_wage_key'
+                         (default 'ca_aewr_general_2023'), 'domestic_workers_available' (int or 52 values, default 0)
+                         and 'max_h2a_workers' (default unlimited).
+
+        Returns:
+            dict: Weekly labour need, domestic and H-2A headcounts, H-2A arrivals, the cost breakdown and the
+                  cost of the flat plan assumed by estimate_h2a_labor_cost (peak H-2A crew for the whole season),
+                  or an error dict.
+        """
+        wages = self.labour_model.baseline_wage_rates
+        domestic_key = farm.get('domestic_wage_key', 'us_avg_field_worker')
+        aewr_key = farm.get('aewr_wage_key', 'ca_aewr_general_2023')
+        if domestic_key not in wages or aewr_key not in wages:
+            return {"error": "Domestic wage or AEWR key not found."}
+        if 'weekly_hours' in farm:
+            hours = list(farm['weekly_hours'])
+            if len(hours) != self.weeks_per_year:
+                return {"error": f"weekly_hours must have {self.weeks_per_year} values."}
+        else:
+            calendar = None
+            if 'pre_harvest_weeks' in farm or 'harvest_weeks' in farm:
+                calendar = dict(self.default_crop_calendar.get(farm.get('crop_key'), {}))
+                calendar.update({k: farm[k] for k in ('pre_harvest_weeks', 'harvest_weeks') if k in farm})
+            hours = self.weekly_labour_hours(farm.get('crop_key'), farm.get('area_ha', 0), calendar)
+            if isinstance(hours, dict):
+                return hours
+        available = farm.get('domestic_workers_available', 0)
+        domestic_cap = list(available) if isinstance(available, (list, tuple)) else [available] * self.weeks_per_year
+        if len(domestic_cap) != len(hours):
+            return {"error": f"domestic_workers_available has {len(domestic_cap)} values; the plan covers {len(hours)} weeks."}
+        max_h2a = farm.get('max_h2a_workers')
+        max_h2a = max_h2a if max_h2a is not None else 10**9
+
+        hpw = self.hours_per_worker_week
+        overheads = self.labour_model.h2a_additional_costs_per_worker_usd
+        domestic_week_cost = hpw * wages[domestic_key]
+        housing_week = overheads['housing_monthly'] * 12 / self.weeks_per_year
+        h2a_week_cost = hpw * wages[aewr_key] + housing_week
+        arrival_cost = overheads['transport_intl_roundtrip'] + overheads['admin_fees_total']
+        need = [math.ceil(h / hpw - 1e-9) for h in hours]  # Worker-weeks
+
+        cache_key = (tuple(need), tuple(domestic_cap), domestic_week_cost, h2a_week_cost, arrival_cost, max_h2a)
+        if cache_key not in self._plan_cache:
+            self._plan_cache[cache_key] = self._solve(need, domestic_cap, domestic_week_cost, h2a_week_cost, arrival_cost, max_h2a)
+        total, plan = self._plan_cache[cache_key]
+        if total is None:
+            return {"error": f"Week {plan}: domestic availability and max_h2a_workers cannot cover the labour need."}
+
+        domestic = [max(n - h, 0) for n, h in zip(need, plan)]
+        arrivals = [max(h - prev, 0) for prev, h in zip([0] + plan[:-1], plan)]
+        h2a_worker_weeks = sum(plan)
+        busy = [w for w, n in enumerate(need) if n > 0]
+        flat_crew = max((max(n - c, 0) for n, c in zip(need, domestic_cap)), default=0)
+        flat_weeks = busy[-1] - busy[0] + 1 if busy else 0
+        flat_cost = flat_crew * (flat_weeks * h2a_week_cost + arrival_cost) + sum(
+            min(n, c) * domestic_week_cost for n, c in zip(need, domestic_cap))
+        return {
+            'farm_id': farm.get('farm_id'),
+            'weekly_labour_hrs': [round(h, 1) for h in hours],
+            'weekly_domestic_headcount': domestic,
+            'weekly_h2a_headcount': plan,
+            'weekly_h2a_arrivals': arrivals,
+            'peak_h2a_headcount': max(plan) if plan else 0,
+            'total_cost_usd': round(total, 2),
+            'cost_breakdown_usd': {
+                'domestic_wages': round(sum(domestic) * domestic_week_cost, 2),
+                'h2a_wages': round(h2a_worker_weeks * hpw * wages[aewr_key], 2),
+                'h2a_housing': round(h2a_worker_weeks * housing_week, 2),
+                'h2a_transport_admin': round(sum(arrivals) * arrival_cost, 2)
+            },
+            'flat_season_plan_cost_usd': round(flat_cost, 2),
+            'saving_vs_flat_season_plan_usd': round(flat_cost - total, 2)
+        }
+
+    def plan_farms(self, farms):
+        """
+        Plans a list of farms. Farms with identical weekly need, availability and wage inputs share one solve.
+
+        Returns:
+            dict: Plans keyed by farm_id (list position if absent), portfolio total cost and H-2A arrivals.
+        """
+        plans = {}
+        for idx, farm in enumerate(farms):
+            plans[farm.get('farm_id', idx)] = self.plan_farm(farm)
+        solved = [p for p in plans.values() if "error" not in p]
+        return {
+            'plans': plans,
+            'num_farms': len(farms),
+            'num_infeasible': len(plans) - len(solved),
+            'total_cost_usd': round(math.fsum(p['total_cost_usd'] for p in solved), 2),
+            'total_h2a_arrivals': sum(sum(p['weekly_h2a_arrivals']) for p in solved)
+        }
+
 class AgriInputPriceIndex:
     """
     Models an agricultural input price index.
+    The live index is kept as a running weighted sum, so a component update is an O(1) delta.
+    Full component price series can be ingested in bulk and turned into Laspeyres, Fisher
+    or chain-linked index series.
     """
+    # Common alternative names (e.g. from run_simulation.py scenarios) mapped onto weight keys
+    component_aliases = {
+        "fertilizers": "fertilizer", "seeds": "seed", "chemicals": "pesticides", "pesticides_herbicides": "pesticides",
+        "energy": "fuel", "fuel_machinery": "fuel", "machinery": "machinery_purchase_repair",
+        "labor": "labour", "utilities": "utilities_other"
+    }
+
     def __init__(self, baseline_year=2023):
         self.baseline_year = baseline_year
         self.weights = {
@@ -544,28 +1370,159 @@ class AgriInputPriceIndex:
             "machinery_purchase_repair": 0.15, "labour": 0.15, "utilities_other": 0.10
         }
         self.component_prices = {cat: 100.0 for cat in self.weights.keys()}
+        self._link_factor = 1.0  # Carries the index level across weight rebasings
+        self._weighted_sum = sum(self.component_prices[c] * w for c, w in self.weights.items())
         self.current_index_value = self._calculate_index()
+        self.history = []  # (period_label, index_value) snapshots, kept across resets
+        self.price_series = {}
+        self.period_labels = []
 
     def _calculate_index(self):
-        val = sum(self.component_prices.get(comp, 100.0) * wt for comp, wt in self.weights.items())
+        val = self._link_factor * sum(self.component_prices.get(comp, 100.0) * wt for comp, wt in self.weights.items())
         return round(val, 2)
 
+    def resolve_component(self, component_name):
+        """Maps a component name or alias onto a key of self.weights, or None."""
+        if component_name in self.weights:
+            return component_name
+        key = str(component_name).lower()
+        if key in self.weights:
+            return key
+        alias = self.component_aliases.get(key)
+        return alias if alias in self.weights else None
+
     def update_component_price(self, component_name, new_price_index):
-        if component_name in self.component_prices:
-            self.component_prices[component_name] = new_price_index
-            self.current_index_value = self._calculate_index()
+        component = self.resolve_component(component_name)
+        if component is not None:
+            old_price = self.component_prices[component]
+            self.component_prices[component] = new_price_index
+            self._weighted_sum += self.weights[component] * (new_price_index - old_price)
+            self.current_index_value = round(self._link_factor * self._weighted_sum, 2)
             # print(f"Updated {component_name} to {new_price_index}. New index: {self.current_index_value}")
             return self.current_index_value
         # print(f"Warning: Component '{component_name}' not found.")
         return self.current_index_value
 
+    def record_period(self, period_label=None):
+        """Appends the current index value to the history and returns it."""
+        label = period_label if period_label is not None else len(self.history)
+        self.history.append((label, self.current_index_value))
+        return self.current_index_value
+
+    def rebase_weights(self, new_weights, chain_link=True):
+        """
+        Replaces the weights (normalized to sum to 1). With chain_link, component prices restart at 100
+        and the current index level is carried forward so the series has no break.
+        """
+        total = sum(new_weights.values())
+        if total <= 0:
+            return {"error": "Weights must sum to a positive value."}
+        level = self._link_factor * self._weighted_sum
+        self.weights = {c: w / total for c, w in new_weights.items()}
+        if chain_link:
+            self.component_prices = {c: 100.0 for c in self.weights}
+            self._link_factor = level / 100.0
+        else:
+            self.component_prices = {c: self.component_prices.get(c, 100.0) for c in self.weights}
+        self._weighted_sum = sum(self.component_prices[c] * w for c, w in self.weights.items())
+        self.current_index_value = round(self._link_factor * self._weighted_sum, 2)
+        return self.current_index_value
+
     def get_index_value(self): return self.current_index_value
     def get_component_prices(self): return self.component_prices
+    def get_index_history(self): return list(self.history)
     def reset_to_baseline(self):
         self.component_prices = {cat: 100.0 for cat in self.weights.keys()}
+        self._link_factor = 1.0
+        self._weighted_sum = sum(self.component_prices[c] * w for c, w in self.weights.items())
         self.current_index_value = self._calculate_index()
         # print(f"Index reset. Value: {self.current_index_value}")
 
+    def ingest_price_series(self, series, period_labels=None):
+        """
+        Loads component price series in bulk (prices or price indices, any units; one list per component,
+        all the same length). Components not in the weights are stored but ignored by the formulas.
+        Each call replaces the series and period labels from earlier calls.
+        """
+        lengths = {len(v) for v in series.values()}
+        if len(lengths) > 1:
+            return {"error": "All component series must have the same number of periods."}
+        n_periods = lengths.pop() if lengths else 0
+        if period_labels is not None and len(period_labels) != n_periods:
+            return {"error": f"Got {len(period_labels)} period labels for series of {n_periods} periods."}
+        self.price_series = {}
+        for name, values in series.items():
+            component = self.resolve_component(name) or name
+            self.price_series[component] = array('d', values)
+        self.period_labels = list(period_labels) if period_labels is not None else list(range(n_periods))
+        return {"components_loaded": len(series), "periods": n_periods}
+
+    def compute_index_series(self, formula="laspeyres", base_period=0, rebase_every=None, weights_schedule=None):
+        """
+        Computes the index for every ingested period (base period = 100) in one pass per component.
+
+        Args:
+            formula (str): 'laspeyres' (fixed base weights), 'fisher' (geometric mean of Laspeyres and the
+                           Paasche index implied by constant expenditure shares) or 'chained'
+                           (links of rebase_every periods, each weighted by the basket in effect at its start).
+            base_period (int): Period whose prices are the reference (laspeyres/fisher).
+            rebase_every (int, optional): Link length in periods for 'chained' (default 1); expenditure
+                                          shares are reset to the basket at every link.
+            weights_schedule (dict, optional): {period_index: weights} baskets for 'chained', effective from
+                                               the first link starting at or after that period.
+
+        Returns:
+            array: Index values ('d' array), or a dict with an "error" key.
+        """
+        components = [c for c in self.weights if c in self.price_series]
+        if not components:
+            return {"error": "No ingested series match the index components."}
+        n = len(self.price_series[components[0]])
+        if not 0 <= base_period < n:
+            return {"error": f"Base period {base_period} outside series of length {n}."}
+        total_w = sum(self.weights[c] for c in components)
+        weights = {c: self.weights[c] / total_w for c in components}
+        mul, add, div = operator.mul, operator.add, operator.truediv
+
+        if formula in ("laspeyres", "fisher"):
+            arithmetic = [0.0] * n
+            harmonic = [0.0] * n
+            for c in components:
+                values = self.price_series[c]
+                base = values[base_period]
+                arithmetic = list(map(add, arithmetic, map(mul, repeat(100.0 * weights[c] / base, n), values)))
+                if formula == "fisher":
+                    harmonic = list(map(add, harmonic, map(div, repeat(weights[c] * base / 100.0, n), values)))
+            if formula == "laspeyres":
+                return array('d', arithmetic)
+            paasche = map(div, repeat(1.0, n), harmonic)
+            return array('d', map(math.sqrt, map(mul, arithmetic, paasche)))
+
+        if formula == "chained":
+            step = rebase_every if rebase_every else 1
+            # Weight baskets by the link they take effect in; schedule entries snap to the next link start
+            baskets = {0: weights}
+            for period, sched in (weights_schedule or {}).items():
+                sched_total = sum(sched.get(c, 0.0) for c in components)
+                if sched_total > 0:
+                    baskets[-(-period // step) * step] = {c: sched.get(c, 0.0) / sched_total for c in components}
+            bounds = sorted(s for s in baskets if s < n - 1) + [n - 1]
+            result = [100.0] * n
+            for seg_start, seg_end in zip(bounds, bounds[1:]):
+                basket = baskets[seg_start]
+                periods = range(seg_start + 1, seg_end + 1)
+                link_starts = [((t - 1) // step) * step for t in periods]
+                relatives = [0.0] * len(periods)
+                for c in components:
+                    values = self.price_series[c]
+                    ratios = map(div, values[seg_start + 1:seg_end + 1], map(values.__getitem__, link_starts))
+                    relatives = list(map(add, relatives, map(mul, repeat(basket[c], len(periods)), ratios)))
+                for t, s, rel in zip(periods, link_starts, relatives):
+                    result[t] = result[s] * rel
+            return array('d', result)
+
+        return {"error": f"Unknown index formula '{formula}'. Use 'laspeyres', 'fisher' or 'chained'."}
+
 class FarmMarginModel:
     """
     Calculates farm margins (gross and net) and break-even points for a specific crop enterprise.
@@ -611,7 +1568,62 @@ class FarmMarginModel:
         y = yield_t_per_ha if yield_t_per_ha is not None else self.expected_yield_t_per_ha
         return self.total_costs_usd_per_ha / y if y != 0 else float('inf')
 
-    def get_full_margin_analysis(self, yield_t_per_ha=None, price_usd_per_t=None):
+    def calculate_margin_sensitivities(self, yield_t_per_ha=None, price_usd_per_t=None):
+        """
+        Exact partial derivatives and elasticities of net margin per hectare.
+        Net margin = yield * price - sum(variable costs) - fixed costs, so the gradient is closed-form
+        and replaces finite-difference runs through InputCostSensitivityAnalysis.
+
+        Returns:
+            dict: Derivatives (USD/ha per unit of input) and elasticities (% change in net margin per 1% change in input).
+        """
+        y = yield_t_per_ha if yield_t_per_ha is not None else self.expected_yield_t_per_ha
+        p = price_usd_per_t if price_usd_per_t is not None else self.market_price_usd_per_t
+        nm = self.calculate_net_margin_per_ha(self.calculate_gross_revenue_per_ha(y, p))
+
+        def _elasticity(derivative, level):
+            return round(derivative * level / nm, 4) if nm != 0 else 'N/A'
+
+        # d(net margin)/d(cost) is -1 for every cost line; elasticities differ by the size of the line.
+        cost_derivatives = {k: -1.0 for k in self.variable_costs_usd_per_ha}
+        cost_elasticities = {k: _elasticity(-1.0, v) for k, v in self.variable_costs_usd_per_ha.items()}
+        return {
+            "net_margin_usd_per_ha": round(nm, 2),
+            "d_net_margin_d_price": y,  # USD/ha per USD/t
+            "d_net_margin_d_yield": p,  # USD/ha per t/ha
+            "d_net_margin_d_variable_costs": cost_derivatives,
+            "d_net_margin_d_fixed_costs": -1.0,
+            "price_elasticity": _elasticity(y, p),
+            "yield_elasticity": _elasticity(p, y),
+            "variable_cost_elasticities": cost_elasticities,
+            "fixed_cost_elasticity": _elasticity(-1.0, self.fixed_costs_usd_per_ha),
+            # Break-even points move linearly with total cost
+            "d_break_even_price_d_cost": round(1 / y, 6) if y != 0 else 'N/A',
+            "d_break_even_yield_d_cost": round(1 / p, 6) if p != 0 else 'N/A'
+        }
+
+    def generate_break_even_surface(self, yield_grid_t_per_ha=None, price_grid_usd_per_t=None):
+        """
+        Evaluates break-even price over a yield grid and break-even yield over a price grid in one pass,
+        plus the net margin surface (rows = yields, columns = prices).
+        Grids default to +/-30% around expected yield and market price in 10% steps.
+        """
+        steps = [0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3]
+        yields = list(yield_grid_t_per_ha) if yield_grid_t_per_ha is not None else [self.expected_yield_t_per_ha * s for s in steps]
+        prices = list(price_grid_usd_per_t) if price_grid_usd_per_t is not None else [self.market_price_usd_per_t * s for s in steps]
+        total_costs = self.total_costs_usd_per_ha
+
+        return {
+            "crop_name": self.crop_name,
+            "total_costs_usd_per_ha": round(total_costs, 2),
+            "yield_grid_t_per_ha": [round(y, 4) for y in yields],
+            "price_grid_usd_per_t": [round(p, 2) for p in prices],
+            "break_even_price_usd_per_t": [round(total_costs / y, 2) if y != 0 else 'N/A' for y in yields],
+            "break_even_yield_t_per_ha": [round(total_costs / p, 4) if p != 0 else 'N/A' for p in prices],
+            "net_margin_surface_usd_per_ha": [[round(y * p - total_costs, 2) for p in prices] for y in yields]
+        }
+
+    def get_full_margin_analysis(self, yield_t_per_ha=None, price_usd_per_t=None, include_sensitivities=False):
         cy = yield_t_per_ha if yield_t_per_ha is not None else self.expected_yield_t_per_ha
         cp = price_usd_per_t if price_usd_per_t is not None else self.market_price_usd_per_t
         gr = self.calculate_gross_revenue_per_ha(cy, cp)
@@ -620,7 +1632,7 @@ class FarmMarginModel:
         nmp = self.calculate_net_margin_percent(gr)
         bey = self.calculate_break_even_yield_t_per_ha(cp)
         bep = self.calculate_break_even_price_usd_per_t(cy)
-        return {
+        analysis = {
             "crop_name": self.crop_name, "yield_t_per_ha": cy, "price_usd_per_t": cp,
             "gross_revenue_usd_per_ha": round(gr, 2),
             "variable_costs_detail_usd_per_ha": {k: round(v,2) for k,v in self.variable_costs_usd_per_ha.items()},
@@ -632,6 +1644,9 @@ class FarmMarginModel:
             "break_even_yield_t_per_ha": round(bey, 2) if bey != float('inf') else 'N/A',
             "break_even_price_usd_per_t": round(bep, 2) if bep != float('inf') else 'N/A'
         }
+        if include_sensitivities:
+            analysis["sensitivities"] = self.calculate_margin_sensitivities(cy, cp)
+        return analysis
 
 class InputCostSensitivityAnalysis:
     """
@@ -711,6 +1726,216 @@ class InputCostSensitivityAnalysis:
             "full_new_analysis": new_analysis
         }
 
+def _cholesky(matrix):
+    """Lower-triangular Cholesky factor of a symmetric positive definite matrix (list of lists)."""
+    n = len(matrix)
+    lower = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1):
+            s = matrix[i][j] - sum(lower[i][k] * lower[j][k] for k in range(j))
+            if i == j:
+                if s <= 0:
+                    return None
+                lower[i][j] = math.sqrt(s)
+            else:
+                lower[i][j] = s / lower[j][j]
+    return lower
+
+def _standard_normals(rng, n):
+    """n standard normal draws via Box-Muller, vectorized over a list."""
+    half = (n + 1) // 2
+    rand = rng.random
+    mul = operator.mul
+    u1 = [rand() for _ in range(half)]
+    u2 = [rand() for _ in range(half)]
+    # 1 - u keeps log() away from zero
+    radius = list(map(math.sqrt, map(mul, repeat(-2.0, half), map(math.log, map(operator.sub, repeat(1.0, half), u1)))))
+    angle = list(map(mul, repeat(2.0 * math.pi, half), u2))
+    draws = list(map(mul, radius, map(math.cos, angle)))
+    draws.extend(map(operator.mul, radius, map(math.sin, angle)))
+    return draws[:n]
+
+class MarginAtRiskSimulator:
+    """
+    Monte Carlo distribution of net margin per hectare under joint uncertainty in fertilizer,
+    energy and wage prices, crop price and yield.
+    Factors are correlated through a Gaussian copula (Cholesky factor of the correlation matrix);
+    prices are lognormal around their baselines and yield is normal, floored at zero.
+    """
+    factors = ('urea', 'dap', 'potash', 'diesel', 'electricity', 'natural_gas', 'wage', 'crop_price', 'yield')
+
+    def __init__(self, fertilizer_model: FertilizerCostImpact, energy_model: EnergyCostAnalysis, labour_model: LabourCostDynamics,
+                 volatilities=None, correlations=None):
+        """
+        Args:
+            volatilities (dict, optional): Annual log-volatility per factor (coefficient of variation for yield).
+            correlations (dict, optional): Pairwise correlations keyed by (factor_a, factor_b); unspecified pairs are 0.
+        """
+        self.fertilizer_model = fertilizer_model
+        self.energy_model = energy_model
+        self.labour_model = labour_model
+        self.volatilities = volatilities if volatilities else {
+            'urea': 0.35, 'dap': 0.30, 'potash': 0.30,
+            'diesel': 0.25, 'electricity': 0.10, 'natural_gas': 0.40,
+            'wage': 0.05, 'crop_price': 0.20, 'yield': 0.15
+        }
+        # Illustrative: nitrogen tracks gas, fertilizers co-move, poor harvests lift prices (natural hedge)
+        self.correlations = correlations if correlations else {
+            ('urea', 'dap'): 0.6, ('urea', 'potash'): 0.4, ('dap', 'potash'): 0.5,
+            ('urea', 'natural_gas'): 0.6, ('diesel', 'natural_gas'): 0.4,
+            ('urea', 'crop_price'): 0.3, ('diesel', 'crop_price'): 0.2,
+            ('crop_price', 'yield'): -0.3
+        }
+
+    def _correlation_matrix(self):
+        idx = {f: i for i, f in enumerate(self.factors)}
+        matrix = [[1.0 if i == j else 0.0 for j in range(len(self.factors))] for i in range(len(self.factors))]
+        for (a, b), rho in self.correlations.items():
+            if a in idx and b in idx and a != b:
+                matrix[idx[a]][idx[b]] = matrix[idx[b]][idx[a]] = rho
+        return matrix
+
+    def simulate(self, crop='corn_grain', farm_type='large_scale_grain_farm_midwest_usa_ha', labour_profile_key='grain_avg',
+                 wage_key='us_avg_field_worker', expected_yield_t_per_ha=10.0, market_price_usd_per_t=180.0,
+                 other_variable_costs_usd_per_ha=155.0, fixed_costs_usd_per_ha=150.0,
+                 num_draws=1000000, seed=42, chunk_size=50000, confidence_level=0.95):
+        """
+        Runs the simulation in chunks and summarizes the margin distribution.
+
+        Returns:
+            dict: Mean/percentiles of net margin, margin-at-risk (mean minus the (1 - confidence) quantile),
+                  expected shortfall, probability of a loss and the factors/cost lines driving the tail.
+        """
+        if not isinstance(num_draws, int) or num_draws < 1 or not isinstance(chunk_size, int) or chunk_size < 1:
+            return {"error": f"num_draws and chunk_size must be positive integers, got {num_draws!r} and {chunk_size!r}."}
+        fert_rates = self.fertilizer_model.calculate_product_rates_t_per_ha(crop)
+        if "error" in fert_rates:
+            return fert_rates
+        if farm_type not in self.energy_model.farm_energy_consumption_profile:
+            return {"error": f"Farm type '{farm_type}' not found in profile."}
+        if labour_profile_key not in self.labour_model.regional_labor_profile or wage_key not in self.labour_model.baseline_wage_rates:
+            return {"error": "Invalid crop profile or wage key."}
+        lower = _cholesky(self._correlation_matrix())
+        if lower is None:
+            return {"error": "Correlation matrix is not positive definite."}
+
+        fert_prices = self.fertilizer_model.baseline_prices
+        energy_prices = self.energy_model.baseline_energy_prices
+        profile = self.energy_model.farm_energy_consumption_profile[farm_type]
+        # Per-ha quantities; the cost engine below is a dot product of these with sampled prices
+        urea_t, dap_t, potash_t = fert_rates.get('urea', 0), fert_rates.get('dap', 0), fert_rates.get('potash', 0)
+        diesel_l = profile.get('diesel_operations_liter', 0)
+        power_kwh = profile.get('electricity_irrigation_kwh', 0)
+        drying_mbtu_per_t = profile.get('natural_gas_drying_mbtu_per_tonne_corn', 0)
+        labour_hrs = self.labour_model.regional_labor_profile[labour_profile_key]['total_hrs']
+        base = (fert_prices.get('urea_usd_per_tonne', 0), fert_prices.get('dap_usd_per_tonne', 0), fert_prices.get('potash_usd_per_tonne', 0),
+                energy_prices.get('diesel_usd_per_liter', 0), energy_prices.get('electricity_usd_per_kwh', 0), energy_prices.get('natural_gas_usd_per_mbtu', 0),
+                self.labour_model.baseline_wage_rates[wage_key], market_price_usd_per_t)
+        sig = [self.volatilities.get(f, 0.0) for f in self.factors]
+        # Lognormal prices with mean equal to the baseline
+        drift = [-0.5 * s * s for s in sig[:8]]
+        yield_cv = sig[8]
+        fixed_total = other_variable_costs_usd_per_ha + fixed_costs_usd_per_ha
+
+        rng = random.Random(seed)
+        mul, add, sub = operator.mul, operator.add, operator.sub
+        n_factors = len(self.factors)
+        # Drop structural zeros of the Cholesky factor so uncorrelated factors cost one scaling only
+        terms = [[(j, c) for j, c in enumerate(row[:i + 1]) if abs(c) > 1e-12] for i, row in enumerate(lower)]
+
+        margins = array('d')
+        shocks = [array('f') for _ in range(n_factors)]
+        components = {k: array('f') for k in ('revenue', 'fertilizer', 'energy', 'labour')}
+        remaining = num_draws
+        while remaining > 0:
+            # Column-wise chunk: each factor is a list of n draws and arithmetic runs through map()
+            n = min(chunk_size, remaining)
+            remaining -= n
+            z = [_standard_normals(rng, n) for _ in range(n_factors)]
+            e = []
+            for row_terms in terms:
+                j0, c0 = row_terms[0]
+                acc = list(map(mul, repeat(c0, n), z[j0]))
+                for j, c in row_terms[1:]:
+                    acc = list(map(add, acc, map(mul, repeat(c, n), z[j])))
+                e.append(acc)
+            pu, pd, pk, pdl, pel, png, pw, pc = [
+                list(map(mul, repeat(b, n), map(math.exp, map(add, repeat(d, n), map(mul, repeat(s, n), x)))))
+                for b, d, s, x in zip(base, drift, sig, e)
+            ]
+            y = [expected_yield_t_per_ha * (1 + yield_cv * x) for x in e[8]]
+            y = [v if v > 0 else 0.0 for v in y]
+            rev = list(map(mul, y, pc))
+            fert = [urea_t * a + dap_t * b + potash_t * c for a, b, c in zip(pu, pd, pk)]
+            energy = [diesel_l * a + power_kwh * b + drying_mbtu_per_t * t * c for a, b, t, c in zip(pdl, pel, y, png)]
+            labour = list(map(mul, repeat(labour_hrs, n), pw))
+            costs = map(add, map(add, fert, energy), labour)
+            margins.extend(map(sub, map(sub, rev, costs), repeat(fixed_total, n)))
+            components['revenue'].extend(rev)
+            components['fertilizer'].extend(fert)
+            components['energy'].extend(energy)
+            components['labour'].extend(labour)
+            for k in range(n_factors):
+                shocks[k].extend(e[k])
+
+        return self._summarize(margins, shocks, components, confidence_level, crop, num_draws, seed)
+
+    def _summarize(self, margins, shocks, components, confidence_level, crop, num_draws, seed):
+        n = len(margins)
+        if n == 0:
+            return {"error": "No draws requested."}
+        ordered = sorted(margins)
+        mean = math.fsum(margins) / n
+        std = math.sqrt(max(math.fsum((m - mean) ** 2 for m in margins) / n, 0.0))
+
+        def quantile(q):
+            return ordered[min(int(q * n), n - 1)]
+
+        tail_cut = quantile(1 - confidence_level)
+        tail_idx = [i for i, m in enumerate(margins) if m <= tail_cut]
+        tail_n = len(tail_idx)
+        expected_shortfall = math.fsum(margins[i] for i in tail_idx) / tail_n
+        losses = sum(1 for m in margins if m < 0)
+
+        # Tail drivers: average correlated shock (in std devs) and cost-line shift inside the tail vs all draws
+        tail_factor_z = {f: round(math.fsum(shocks[k][i] for i in tail_idx) / tail_n, 3) for k, f in enumerate(self.factors)}
+        tail_component_shift = {}
+        for name, values in components.items():
+            overall = math.fsum(values) / n
+            in_tail = math.fsum(values[i] for i in tail_idx) / tail_n
+            # Revenue falling and costs rising both push margin down; sign so positive = hurts margin
+            shift = overall - in_tail if name == 'revenue' else in_tail - overall
+            tail_component_shift[name] = round(shift, 2)
+
+        return {
+            "crop": crop, "num_draws": num_draws, "seed": seed, "confidence_level": confidence_level,
+            "mean_net_margin_usd_per_ha": round(mean, 2),
+            "std_net_margin_usd_per_ha": round(std, 2),
+            "percentiles_usd_per_ha": {f"p{int(q * 100)}": round(quantile(q), 2) for q in (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)},
+            "margin_at_risk_usd_per_ha": round(mean - tail_cut, 2),
+            "tail_quantile_net_margin_usd_per_ha": round(tail_cut, 2),
+            "expected_shortfall_usd_per_ha": round(expected_shortfall, 2),
+            "probability_of_loss": round(losses / n, 4),
+            "tail_factor_mean_shock_sd": tail_factor_z,
+            "tail_margin_erosion_by_component_usd_per_ha": tail_component_shift,
+            "top_tail_driver": max(tail_component_shift, key=tail_component_shift.get)
+        }
+
+class InputPriceScenarioResult(NamedTuple):
+    """Headline margin metrics for one scenario of InputCostDynamicsMarginStructure.evaluate_input_price_scenarios."""
+    crop_name: str
+    cost_changes_pct: dict
+    price_change_pct: float
+    price_usd_per_t: float
+    gross_revenue_usd_per_ha: float
+    total_costs_usd_per_ha: float
+    base_net_margin_usd_ha: float
+    new_net_margin_usd_ha: float
+    change_net_margin_usd_ha: float
+    net_margin_percent: float
+    break_even_price_usd_per_t: float
+    break_even_yield_t_per_ha: float
+
 class InputCostDynamicsMarginStructure:
     """
     Orchestrates analysis of input costs, farm margins, and their sensitivities.
@@ -719,27 +1944,46 @@ class InputCostDynamicsMarginStructure:
         self.baseline_year = baseline_year
         self.region = region
         self.fertilizer_model = FertilizerCostImpact()
+        self.fertilizer_blend_optimizer = FertilizerBlendOptimizer(self.fertilizer_model)
         self.energy_model = EnergyCostAnalysis()
         self.labour_model = LabourCostDynamics()
         self.agri_input_index = AgriInputPriceIndex(baseline_year=baseline_year)
+        self.margin_risk_simulator = MarginAtRiskSimulator(self.fertilizer_model, self.energy_model, self.labour_model)
+        self.mechanization_fleet_evaluator = MechanizationFleetEvaluator(self.labour_model)
+        self.h2a_workforce_planner = H2AWorkforcePlanner(self.labour_model)
         self.current_farm_margin_model = None
         self.sensitivity_analyzer = None
+        self._baseline_budget_cache = {}
 
-    def setup_farm_scenario(self, crop_name, expected_yield, market_price, variable_costs, fixed_costs):
+    def setup_farm_scenario(self, crop_name, expected_yield, market_price, variable_costs, fixed_costs, verbose=True):
         self.current_farm_margin_model = FarmMarginModel(
             crop_name, expected_yield, market_price, variable_costs, fixed_costs
         )
         self.sensitivity_analyzer = InputCostSensitivityAnalysis(self.current_farm_margin_model)
-        print(f"Farm scenario for '{crop_name}' set up. Base net margin: ${self.sensitivity_analyzer.base_net_margin:.2f}/ha")
+        if verbose:
+            print(f"Farm scenario for '{crop_name}' set up. Base net margin: ${self.sensitivity_analyzer.base_net_margin:.2f}/ha")
         return self.current_farm_margin_model
 
-    def simulate_input_price_scenario(self, crop_name="wheat_grain", fertilizer_changes=None, energy_changes=None, labour_changes=None, commodity_price_change_percent=None):
-        print(f"\nSimulating scenario for '{crop_name}'...")
-        
+    def _baseline_budget(self, crop_name):
+        """
+        Per-ha baseline budget (variable costs, fixed costs, yield, price) for a crop. Built from the
+        fertilizer, energy and labour models once and cached until any of their baseline inputs change.
+        """
+        cache_key = (
+            crop_name,
+            tuple(sorted(self.fertilizer_model.baseline_prices.items())),
+            tuple(sorted(self.fertilizer_model.crop_nutrient_needs_kg_per_ha.get(crop_name, {}).items())),
+            tuple(sorted(self.energy_model.baseline_energy_prices.items())),
+            tuple(sorted(self.energy_model.farm_energy_consumption_profile.get('large_scale_grain_farm_midwest_usa_ha', {}).items())),
+            self.labour_model.baseline_wage_rates.get('us_avg_field_worker'),
+            self.labour_model.regional_labor_profile.get('grain_avg', {}).get('total_hrs')
+        )
+        if cache_key in self._baseline_budget_cache:
+            return self._baseline_budget_cache[cache_key]
+
         # Determine baseline costs for the specific crop for the farm model
         fert_costs_details = self.fertilizer_model.calculate_fertilizer_cost_per_ha(crop_name)
         if "error" in fert_costs_details:
-            print(f"Error in fertilizer calc for {crop_name}: {fert_costs_details['error']}")
             return fert_costs_details
         baseline_fert_total_ha = fert_costs_details.get('total_fertilizer_cost_usd_per_ha', 0)
 
@@ -776,24 +2020,18 @@ class InputCostDynamicsMarginStructure:
         elif crop_name == "soybeans":
             default_yield_t_ha, default_price_usd_t = (3.0, 450)
 
-        self.setup_farm_scenario(
-            crop_name,
-            default_yield_t_ha,
-            default_price_usd_t,
-            default_variable_costs_ha,
-            default_fixed_costs_ha
-        )
-        
-        print("Base Farm Analysis for Scenario:")
-        for k, v_val in self.current_farm_margin_model.get_full_margin_analysis().items():
-            if isinstance(v_val, dict):
-                print(f"  {k}:")
-                for sk, sv in v_val.items(): print(f"    {sk}: {sv}")
-            else:
-                print(f"  {k}: {v_val}")
-
-        if not self.sensitivity_analyzer: return {"error": "Farm scenario not set up for sensitivity."}
+        budget = {
+            "variable_costs": default_variable_costs_ha,
+            "fixed_costs": default_fixed_costs_ha,
+            "expected_yield": default_yield_t_ha,
+            "market_price": default_price_usd_t
+        }
+        self._baseline_budget_cache[cache_key] = budget
+        return budget
 
+    @staticmethod
+    def _scenario_cost_changes(fertilizer_changes=None, energy_changes=None, labour_changes=None):
+        """Maps scenario inputs onto % changes of the farm budget's variable cost lines."""
         scenario_cost_changes_pct = {}
         if fertilizer_changes and 'total_impact_percent' in fertilizer_changes:
             scenario_cost_changes_pct['fertilizer_total'] = fertilizer_changes['total_impact_percent']
@@ -801,15 +2039,99 @@ class InputCostDynamicsMarginStructure:
              scenario_cost_changes_pct['fuel_machinery_ops'] = energy_changes['diesel'] # Assumes diesel % change applies to this category
         if labour_changes and 'field_worker_percent_change' in labour_changes:
             scenario_cost_changes_pct['labor'] = labour_changes['field_worker_percent_change']
+        return scenario_cost_changes_pct
+
+    def simulate_input_price_scenario(self, crop_name="wheat_grain", fertilizer_changes=None, energy_changes=None, labour_changes=None, commodity_price_change_percent=None, verbose=True):
+        if verbose:
+            print(f"\nSimulating scenario for '{crop_name}'...")
+
+        budget = self._baseline_budget(crop_name)
+        if "error" in budget:
+            if verbose:
+                print(f"Error in fertilizer calc for {crop_name}: {budget['error']}")
+            return budget
+
+        self.setup_farm_scenario(
+            crop_name,
+            budget["expected_yield"],
+            budget["market_price"],
+            budget["variable_costs"],
+            budget["fixed_costs"],
+            verbose=verbose
+        )
+        
+        if verbose:
+            print("Base Farm Analysis for Scenario:")
+            for k, v_val in self.current_farm_margin_model.get_full_margin_analysis().items():
+                if isinstance(v_val, dict):
+                    print(f"  {k}:")
+                    for sk, sv in v_val.items(): print(f"    {sk}: {sv}")
+                else:
+                    print(f"  {k}: {v_val}")
+
+        if not self.sensitivity_analyzer: return {"error": "Farm scenario not set up for sensitivity."}
+
+        scenario_cost_changes_pct = self._scenario_cost_changes(fertilizer_changes, energy_changes, labour_changes)
         
-        print(f"\nRunning Scenario with Cost Changes (%): {scenario_cost_changes_pct}, Price Change (%): {commodity_price_change_percent}")
+        if verbose:
+            print(f"\nRunning Scenario with Cost Changes (%): {scenario_cost_changes_pct}, Price Change (%): {commodity_price_change_percent}")
         results = self.sensitivity_analyzer.run_scenario_analysis(scenario_cost_changes_pct, commodity_price_change_percent)
         
-        print("\nSensitivity Scenario Analysis Results:")
-        print(f"  Base Net Margin: ${results['base_net_margin_usd_ha']:.2f}/ha")
-        print(f"  New Net Margin: ${results['new_net_margin_usd_ha']:.2f}/ha")
-        print(f"  Change in Net Margin: ${results['change_net_margin_usd_ha']:.2f}/ha")
-        print(f"  Full analysis under scenario: {results['full_new_analysis']}")
+        if verbose:
+            print("\nSensitivity Scenario Analysis Results:")
+            print(f"  Base Net Margin: ${results['base_net_margin_usd_ha']:.2f}/ha")
+            print(f"  New Net Margin: ${results['new_net_margin_usd_ha']:.2f}/ha")
+            print(f"  Change in Net Margin: ${results['change_net_margin_usd_ha']:.2f}/ha")
+            print(f"  Full analysis under scenario: {results['full_new_analysis']}")
+        return results
+
+    def evaluate_input_price_scenarios(self, crop_name, scenarios):
+        """
+        Print-free batch version of simulate_input_price_scenario. The crop's baseline budget is built
+        (or taken from cache) once and every scenario is a few additions against it; no farm model or
+        sensitivity analyzer is constructed per scenario and current_farm_margin_model is left untouched.
+
+        Args:
+            crop_name (str): Crop key, as for simulate_input_price_scenario.
+            scenarios (list): Dicts with any of 'fertilizer_changes', 'energy_changes', 'labour_changes'
+                              and 'commodity_price_change_percent' (same meaning as the keyword arguments).
+
+        Returns:
+            list: One InputPriceScenarioResult per scenario, or an error dict if the baseline cannot be built.
+        """
+        budget = self._baseline_budget(crop_name)
+        if "error" in budget:
+            return budget
+        variable_costs = budget["variable_costs"]
+        fixed_costs = budget["fixed_costs"]
+        yield_t = budget["expected_yield"]
+        base_price = budget["market_price"]
+        base_total_variable = sum(variable_costs.values())
+        base_net_margin = round(yield_t * base_price - base_total_variable - fixed_costs, 2)
+
+        results = []
+        for scenario in scenarios:
+            changes = self._scenario_cost_changes(scenario.get('fertilizer_changes'), scenario.get('energy_changes'),
+                                                  scenario.get('labour_changes'))
+            price_change = scenario.get('commodity_price_change_percent')
+            price = base_price * (1 + price_change / 100) if price_change is not None else base_price
+            total_costs = base_total_variable + fixed_costs + sum(variable_costs[k] * c / 100 for k, c in changes.items())
+            revenue = yield_t * price
+            net_margin = round(revenue - total_costs, 2)
+            results.append(InputPriceScenarioResult(
+                crop_name=crop_name,
+                cost_changes_pct=changes,
+                price_change_pct=price_change,
+                price_usd_per_t=round(price, 2),
+                gross_revenue_usd_per_ha=round(revenue, 2),
+                total_costs_usd_per_ha=round(total_costs, 2),
+                base_net_margin_usd_ha=base_net_margin,
+                new_net_margin_usd_ha=net_margin,
+                change_net_margin_usd_ha=round(net_margin - base_net_margin, 2),
+                net_margin_percent=round((revenue - total_costs) / revenue * 100, 2) if revenue else 0.0,
+                break_even_price_usd_per_t=round(total_costs / yield_t, 2) if yield_t else None,
+                break_even_yield_t_per_ha=round(total_costs / price, 2) if price else None
+            ))
         return results
 
     def get_current_input_price_index(self):
@@ -827,6 +2149,8 @@ if __name__ == '__main__':
     print(f"WHEAT fertilizer cost after +20% Urea price: ${urea_price_shock_effect.get('new_total_cost_usd_per_ha', 0):.2f}/ha (Change: ${urea_price_shock_effect.get('change_in_cost_usd_per_ha',0):.2f}/ha)")
     corn_fert_costs = fertilizer_module.calculate_fertilizer_cost_per_ha('corn_grain')
     print(f"Baseline fertilizer cost for CORN: ${corn_fert_costs.get('total_fertilizer_cost_usd_per_ha', 0):.2f}/ha")
+    corn_blend = dynamics_orchestrator.fertilizer_blend_optimizer.optimize_blend('corn_grain')
+    print(f"Least-cost blend for CORN: {corn_blend['blend_t_per_ha']} t/ha -> ${corn_blend['total_fertilizer_cost_usd_per_ha']:.2f}/ha (Saving: ${corn_blend['saving_vs_fixed_sourcing_usd_per_ha']:.2f}/ha)")
 
     print("\n--- Section 2: Energy Cost Analysis ---")
     energy_module = dynamics_orchestrator.energy_model
@@ -834,6 +2158,12 @@ if __name__ == '__main__':
     print(f"Baseline direct energy cost for 100ha Midwest Grain Farm: ${midwest_farm_energy_cost.get('total_direct_cost_usd',0):.2f}")
     energy_price_shock_effect = energy_module.analyze_price_change_impact('large_scale_grain_farm_midwest_usa_ha', 100, percentage_change_diesel=25, percentage_change_electricity=10)
     print(f"Midwest Farm energy cost after diesel +25%, electricity +10%: ${energy_price_shock_effect.get('new_total_direct_cost_usd',0):.2f} (Change: ${energy_price_shock_effect.get('change_in_total_direct_cost_usd',0):.2f})")
+    portfolio_energy = energy_module.calculate_portfolio_energy_costs(
+        ['large_scale_grain_farm_midwest_usa_ha', 'brazilian_sugarcane_farm_ha', 'indian_wheat_farm_smallholder_ha'],
+        [100, 250, 2], [11.5, 80, 3.2],
+        [energy_module.baseline_energy_prices, {'diesel_usd_per_liter': 1.20, 'electricity_usd_per_kwh': 0.18, 'natural_gas_usd_per_mbtu': 7.0}],
+        reduce='farm_scenario')
+    print(f"Portfolio direct energy cost per farm (baseline, shock): {[round(c, 2) for c in portfolio_energy['costs']]}")
 
     print("\n--- Section 3: Labour Cost Analysis ---")
     labour_module = dynamics_orchestrator.labour_model
@@ -843,6 +2173,19 @@ if __name__ == '__main__':
     print(f"US grain farm labor cost after +15% field worker wage: ${wage_hike_effect.get('new_cost_usd_ha',0):.2f}/ha")
     h2a_estimate = labour_module.estimate_h2a_labor_cost(num_workers=10, wage_key_aewr='ca_aewr_general_2023', season_months_override=6)
     print(f"Estimated H2A cost for 10 workers in CA (6 months): ${h2a_estimate.get('overall_est_h2a_cost_usd', 0):.2f}")
+    orchard_staffing = dynamics_orchestrator.h2a_workforce_planner.plan_farm(
+        {'farm_id': 'ca_orchard_25ha', 'crop_key': 'fruit_manual_hg', 'area_ha': 25, 'domestic_workers_available': 12})
+    print(f"Optimized H2A/domestic staffing for 25ha CA orchard: ${orchard_staffing['total_cost_usd']:,.2f} "
+          f"(peak H2A crew {orchard_staffing['peak_h2a_headcount']}, saves ${orchard_staffing['saving_vs_flat_season_plan_usd']:,.2f} vs flat season crew)")
+    fleet_evaluation = dynamics_orchestrator.mechanization_fleet_evaluator.evaluate_fleet([
+        {'farm_id': 'ca_orchard_40ha', 'crop_key': 'fruit_manual_hg', 'wage_key': 'ca_aewr_general_2023', 'area_ha': 40,
+         'annual_op_hrs': {'robotic_harvester_prototype': 1200, 'fruit_harvest_assist': 600}},
+        {'farm_id': 'fl_veg_6ha', 'crop_key': 'veg_mixed_hg', 'wage_key': 'fl_aewr_custom_harvesters_2024', 'area_ha': 6,
+         'annual_op_hrs': {'robotic_harvester_prototype': 900, 'fruit_harvest_assist': 300}}
+    ], salvage_value_percent=10)
+    for farm_id, best_by_path in fleet_evaluation['best_option_by_farm'].items():
+        top = fleet_evaluation['ranked_options_by_farm'][farm_id]['steady_3pct'][0]
+        print(f"Mechanization for {farm_id}: best by wage path {best_by_path}; 3% path top NPV ${top['npv_usd']:,.0f}, IRR {top['irr_percent']}%")
 
     print("\n--- Section 4: Agri-Input Price Index ---")
     input_index_model = dynamics_orchestrator.agri_input_index
@@ -851,6 +2194,11 @@ if __name__ == '__main__':
     input_index_model.update_component_price("fuel", 125)
     print(f"Updated Input Price Index: {input_index_model.get_index_value()}")
     print(f"Current component prices (indexed): {input_index_model.get_component_prices()}")
+    input_index_model.ingest_price_series({
+        "fertilizer": [100, 112, 130, 118, 105], "fuel": [100, 104, 121, 115, 109], "labour": [100, 102, 104, 107, 110]
+    }, period_labels=[2020, 2021, 2022, 2023, 2024])
+    print(f"Laspeyres index series 2020-2024: {[round(v, 2) for v in input_index_model.compute_index_series('laspeyres')]}")
+    print(f"Chained index series 2020-2024: {[round(v, 2) for v in input_index_model.compute_index_series('chained')]}")
 
     print("\n--- Section 5: Farm Margin Model & Sensitivity Analysis (WHEAT Example) ---")
     wheat_variable_costs_ha = {
@@ -896,6 +2244,14 @@ if __name__ == '__main__':
         price_sensitivity_res = wheat_sensitivity_module.analyze_price_sensitivity(8)
         print("Sensitivity to +8% Market Price (Wheat):")
         print(f"  New Net Margin: ${price_sensitivity_res.get('new_net_margin_usd_ha', 'N/A'):.2f}/ha (Change: ${price_sensitivity_res.get('change_net_margin_usd_ha', 'N/A'):.2f}/ha)")
+
+        wheat_margin_model = dynamics_orchestrator.current_farm_margin_model
+        wheat_gradients = wheat_margin_model.calculate_margin_sensitivities()
+        print("Analytic Margin Sensitivities (Wheat):")
+        print(f"  dNM/dPrice: {wheat_gradients['d_net_margin_d_price']} | dNM/dYield: {wheat_gradients['d_net_margin_d_yield']}")
+        print(f"  Price elasticity: {wheat_gradients['price_elasticity']} | Fertilizer cost elasticity: {wheat_gradients['variable_cost_elasticities']['fertilizer_total']}")
+        wheat_surface = wheat_margin_model.generate_break_even_surface()
+        print(f"  Break-even price over yield grid {wheat_surface['yield_grid_t_per_ha']}: {wheat_surface['break_even_price_usd_per_t']}")
     else:
         print("Error: Wheat FarmMarginModel or SensitivityAnalyzer not initialized for detailed tests.")
 
@@ -909,5 +2265,19 @@ if __name__ == '__main__':
         commodity_price_change_percent=-5
     )
     # The simulate_input_price_scenario method already prints its summary
+    corn_scenario_grid = [
+        {'fertilizer_changes': {'total_impact_percent': fert}, 'energy_changes': {'diesel': diesel}, 'commodity_price_change_percent': price}
+        for fert in (0, 15, 30) for diesel in (0, 20) for price in (-10, 0, 10)
+    ]
+    corn_grid_results = dynamics_orchestrator.evaluate_input_price_scenarios("corn_grain", corn_scenario_grid)
+    worst_corn_case = min(corn_grid_results, key=lambda r: r.new_net_margin_usd_ha)
+    print(f"Quiet batch of {len(corn_grid_results)} corn scenarios: worst net margin ${worst_corn_case.new_net_margin_usd_ha:.2f}/ha "
+          f"(cost changes {worst_corn_case.cost_changes_pct}, price change {worst_corn_case.price_change_pct}%)")
+
+    print("\n--- Section 7: Margin-at-Risk Monte Carlo (CORN) ---")
+    corn_mar = dynamics_orchestrator.margin_risk_simulator.simulate(crop='corn_grain', num_draws=100000, seed=7)
+    print(f"Mean net margin: ${corn_mar['mean_net_margin_usd_per_ha']:.2f}/ha | 95% Margin-at-Risk: ${corn_mar['margin_at_risk_usd_per_ha']:.2f}/ha")
+    print(f"Expected shortfall: ${corn_mar['expected_shortfall_usd_per_ha']:.2f}/ha | P(loss): {corn_mar['probability_of_loss']}")
+    print(f"Tail drivers (mean shock in SD): {corn_mar['tail_factor_mean_shock_sd']}")
 
     print("\n--------- Simulation Complete ---------") 
\ No newline at end of file
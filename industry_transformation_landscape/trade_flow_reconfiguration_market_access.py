@@ -1,9 +1,79 @@
 # This module will handle simulations related to Trade Flow Reconfiguration & Market Access.
 
+import calendar
+import heapq
+import json
+import math
+import mmap
+import operator
+import os
+import random
+import re
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import accumulate, repeat
+
 class BilateralRelationshipEvolution:
     """
     Models the evolution of bilateral trade relationships and their impact on agricultural commodity flows.
     """
+    # Event type -> keywords. Earlier types win where phrases overlap ("tariff reduction" before "tariffs",
+    # "easing of sanctions" before "sanction"), so the classifier is one compiled alternation. Keywords match
+    # whole words, optionally pluralised; a trailing "*" marks a stem ("retaliat*" matches "retaliation").
+    event_keywords = {
+        "tariff_reduction": ["tariff reduction", "tariff cut", "lower tariffs", "tariff exemption"],
+        "quota_expansion": ["increased import quotas", "quota expansion", "quota increase"],
+        "sanction_relief": ["easing of sanctions", "sanctions relief", "lifting of sanctions"],
+        "sps_resolution": ["resolution of sps", "sps issues resolved", "market reopening"],
+        "retaliation": ["retaliat*"],
+        "tariff_increase": ["tariffs", "tariff hike", "duty increase", "anti-dumping"],
+        "sanction": ["sanction", "embargo"],
+        "export_restriction": ["export ban", "export restriction"],
+        "sps_barrier": ["sps", "phytosanitary", "animal disease", "pest"],
+        "geopolitical_flare_up": ["geopolitical flare-ups", "geopolitical", "conflict", "instability"],
+        "agreement_signed": ["trade agreement", "free trade", "cepa", "phase one"],
+        "negotiation": ["talks", "negotiation", "dialogue"],
+    }
+    event_pattern = re.compile("|".join(
+        f"(?P<{event_type}>" + "|".join(
+            rf"\b{re.escape(keyword[:-1])}\w*" if keyword.endswith("*") else rf"\b{re.escape(keyword)}(?:e?s)?\b"
+            for keyword in sorted(keywords, key=len, reverse=True)) + ")"
+        for event_type, keywords in event_keywords.items()), re.IGNORECASE)
+    # model_impact's scoring rules per scenario type, first match wins: (substrings, score multiplier, summary)
+    impact_rules = {
+        "positive": ((("tariff reduction",), 1.2, "Lower prices for consumers in importing country, higher volumes."),
+                     (("increased import quotas",), 1.1, "Increased market access for exporting country.")),
+        "negative": ((("tariffs", "sanction"), 1.5, "Higher prices for consumers, trade diversion, potential supply shortages."),
+                     (("geopolitical flare-ups",), 1.3, "Supply chain disruptions, increased risk premium, reduced investment."))
+    }
+    # One pass for model_impact: at each position, zero-width groups '<scenario>_rule_<k>' flag rule substrings
+    # and 'event_span' wraps event_pattern, so rules found inside an event phrase are not skipped
+    impact_pattern = re.compile(
+        "(?:(?=" + "|".join(f"(?P<{scenario}_rule_{k}>{'|'.join(map(re.escape, rule[0]))})"
+                            for scenario, rules in impact_rules.items() for k, rule in enumerate(rules)) + "))?"
+        "(?:(?=(?P<event_span>" + event_pattern.pattern + ")))?", re.IGNORECASE)
+    barrier_kinds = ("tariff", "quota", "sps", "export_restriction", "sanction")
+    # Event type -> (tension change, tariff change %, barriers raised, barriers lifted), before magnitude scaling
+    event_effects = {
+        "tariff_increase": (15, 10, ("tariff",), ()),
+        "retaliation": (20, 10, ("tariff",), ()),
+        "sanction": (25, 0, ("sanction",), ()),
+        "export_restriction": (15, 0, ("export_restriction",), ()),
+        "sps_barrier": (10, 0, ("sps",), ()),
+        "geopolitical_flare_up": (12, 0, (), ()),
+        "tariff_reduction": (-10, -10, (), ()),
+        "quota_expansion": (-6, 0, (), ("quota",)),
+        "sps_resolution": (-8, 0, (), ("sps",)),
+        "sanction_relief": (-15, 0, (), ("sanction",)),
+        "agreement_signed": (-20, -5, (), ("tariff", "quota")),
+        "negotiation": (-5, 0, (), ()),
+    }
+    baseline_tension = 25.0
+    max_tariff_level_percent = 100.0
+
     def __init__(self):
         self.trade_relationships = {
             "US-China": {
@@ -48,6 +118,7 @@ class BilateralRelationshipEvolution:
                 "impact_potential": "high"
             }
         }
+        self.relationship_state = {}  # country pair -> evolving state, see replay_events
 
     def get_relationship_details(self, country_pair_key: str):
         """
@@ -76,26 +147,27 @@ class BilateralRelationshipEvolution:
         # Generic impact logic, can be expanded
         base_impact_score = 10 * magnitude_factor # Arbitrary base score
 
-        if scenario_type == "positive":
-            change_direction = "increase"
-            effect_on_commodities = f"Potential {change_direction} in trade for {', '.join(relationship['key_commodities'])}."
-            if "tariff reduction" in specific_event.lower():
-                potential_impacts.append(f"Lower prices for consumers in importing country, higher volumes.")
-                base_impact_score *= 1.2
-            elif "increased import quotas" in specific_event.lower():
-                potential_impacts.append(f"Increased market access for exporting country.")
-                base_impact_score *= 1.1
-        elif scenario_type == "negative":
-            change_direction = "decrease"
-            effect_on_commodities = f"Potential {change_direction} in trade for {', '.join(relationship['key_commodities'])}."
-            if "tariffs" in specific_event.lower() or "sanction" in specific_event.lower():
-                potential_impacts.append(f"Higher prices for consumers, trade diversion, potential supply shortages.")
-                base_impact_score *= 1.5
-            elif "geopolitical flare-ups" in specific_event.lower():
-                 potential_impacts.append(f"Supply chain disruptions, increased risk premium, reduced investment.")
-                 base_impact_score *= 1.3
-        else:
+        if scenario_type not in self.impact_rules:
             return {"error": "Invalid scenario_type. Must be 'positive' or 'negative'."}
+        rule_prefix = f"{scenario_type}_rule_"
+        rules_found, event_types, event_end = set(), set(), 0
+        for match in self.impact_pattern.finditer(specific_event):
+            for name, value in match.groupdict().items():
+                if value is None:
+                    continue
+                if name.startswith(rule_prefix):
+                    rules_found.add(int(name[len(rule_prefix):]))
+                elif name in self.event_keywords and match.start() >= event_end:
+                    event_types.add(name)  # Event phrases don't overlap, as in classify_event
+            if match.group("event_span") is not None and match.start() >= event_end:
+                event_end = match.end("event_span")
+
+        change_direction = "increase" if scenario_type == "positive" else "decrease"
+        effect_on_commodities = f"Potential {change_direction} in trade for {', '.join(relationship['key_commodities'])}."
+        if rules_found:
+            _, multiplier, summary = self.impact_rules[scenario_type][min(rules_found)]
+            potential_impacts.append(summary)
+            base_impact_score *= multiplier
 
         potential_impacts.append(effect_on_commodities)
         final_impact_score = base_impact_score * (2 if relationship['impact_potential'] == 'high' else (1.5 if relationship['impact_potential'] == 'medium_high' else 1))
@@ -107,8 +179,117 @@ class BilateralRelationshipEvolution:
             "description": impact_description,
             "potential_impacts_summary": potential_impacts,
             "affected_commodities": relationship['key_commodities'],
-            "estimated_impact_score": round(final_impact_score, 2) # Higher score = more significant impact
+            "estimated_impact_score": round(final_impact_score, 2), # Higher score = more significant impact
+            "classified_event_types": sorted(event_types)
+        }
+
+    def classify_event(self, text: str):
+        """Event types named in free text, from one pass of the compiled keyword pattern."""
+        return {match.lastgroup for match in self.event_pattern.finditer(text)}
+
+    def replay_events(self, events: dict, reset: bool = False, record_history: bool = False, tension_half_life_days: float = 365.0):
+        """
+        Replays a typed event stream into each country pair's relationship state.
+
+        State per pair is a tension index (0-100), an additional tariff level (%, capped) and the set of active
+        barriers. Between events tension decays toward baseline_tension with the given half-life; each event
+        moves it by its event_effects entry scaled by magnitude and the relationship's impact_potential (as in
+        model_impact). Events are grouped by pair and sorted by date once, then each pair's events run through
+        a tight update loop over local state. A free-text event takes the type of the first keyword found in it,
+        with one regex search per distinct text.
+
+        Args:
+            events (dict): Equal-length columns 'date' (date or ISO string) and 'country_pair_key', plus
+                           'event_type' and/or 'text' (used where event_type is missing), optional 'magnitude'.
+            reset (bool): Start from baseline instead of the current state.
+            record_history (bool): Also return each pair's (date, event type, tension, tariff) trajectory.
+
+        Returns:
+            dict: Final state per pair touched, events applied, and events that could not be classified.
+        """
+        if 'date' not in events or 'country_pair_key' not in events or ('event_type' not in events and 'text' not in events):
+            return {"error": "Events need 'date', 'country_pair_key' and 'event_type' or 'text' columns."}
+        if reset:
+            self.relationship_state = {}
+        pairs = events['country_pair_key']
+        n = len(pairs)
+        type_names = list(self.event_effects)
+        type_code = {name: k for k, name in enumerate(type_names)}
+        declared = events.get('event_type') or [None] * n
+        texts = events.get('text') or [None] * n
+        classified = {}
+        codes = array('b', repeat(-1, n))
+        for k, (declared_type, text) in enumerate(zip(declared, texts)):
+            if declared_type is None and text is not None:
+                if text not in classified:
+                    match = self.event_pattern.search(text)
+                    classified[text] = match.lastgroup if match else None
+                declared_type = classified[text]
+            codes[k] = type_code.get(declared_type, -1)
+        day_cache = {}
+        ordinals = array('l')
+        for d in events['date']:
+            if d not in day_cache:
+                day_cache[d] = d.toordinal() if isinstance(d, date) else date.fromisoformat(d).toordinal()
+            ordinals.append(day_cache[d])
+        magnitudes = events.get('magnitude') or [1.0] * n
+
+        bit = {kind: 1 << k for k, kind in enumerate(self.barrier_kinds)}
+        effects = []
+        for name in type_names:
+            tension_change, tariff_change, raised, lifted = self.event_effects[name]
+            effects.append((tension_change, tariff_change, sum(bit[b] for b in raised), sum(bit[b] for b in lifted)))
+        tariff_bit = bit["tariff"]
+        decay_rate = math.log(2) / tension_half_life_days
+        potential_multiplier = {"high": 2.0, "medium_high": 1.5}
+        baseline, ceiling = self.baseline_tension, self.max_tariff_level_percent
+
+        by_pair = {}
+        for k in sorted(range(n), key=ordinals.__getitem__):
+            by_pair.setdefault(pairs[k], []).append(k)
+        applied = unclassified = 0
+        history = {}
+        for pair, indices in by_pair.items():
+            state = self.relationship_state.get(pair)
+            if state is None:
+                tension, tariff, barriers, last = baseline, 0.0, 0, 0
+            else:
+                tension, tariff, last = state["tension_index"], state["tariff_level_percent"], state["_last_ordinal"]
+                barriers = sum(bit[b] for b in state["active_barriers"])
+            weight = potential_multiplier.get(self.trade_relationships.get(pair, {}).get("impact_potential"), 1.0)
+            trajectory = history.setdefault(pair, []) if record_history else None
+            for k in indices:
+                code = codes[k]
+                if code < 0:
+                    unclassified += 1
+                    continue
+                day = ordinals[k]
+                if last and day > last:
+                    tension = baseline + (tension - baseline) * math.exp(-decay_rate * (day - last))
+                tension_change, tariff_change, raised, lifted = effects[code]
+                scale = magnitudes[k] * weight
+                tension = min(100.0, max(0.0, tension + tension_change * scale))
+                tariff = min(ceiling, max(0.0, tariff + tariff_change * scale))
+                barriers = (barriers | raised) & ~lifted
+                barriers = barriers | tariff_bit if tariff > 0 else barriers & ~tariff_bit
+                last = day
+                applied += 1
+                if trajectory is not None:
+                    trajectory.append((date.fromordinal(day).isoformat(), type_names[code], round(tension, 2), round(tariff, 2)))
+            self.relationship_state[pair] = {
+                "tension_index": tension, "tariff_level_percent": tariff,
+                "active_barriers": [kind for kind in self.barrier_kinds if barriers & bit[kind]],
+                "last_event_date": date.fromordinal(last).isoformat() if last else None, "_last_ordinal": last
+            }
+        result = {
+            "pairs": {pair: {key: (round(value, 2) if isinstance(value, float) else value)
+                             for key, value in self.relationship_state[pair].items() if not key.startswith("_")}
+                      for pair in by_pair},
+            "events_applied": applied, "unclassified_events": unclassified
         }
+        if record_history:
+            result["history"] = history
+        return result
 
 class BarrierDevelopment:
     """
@@ -166,32 +347,201 @@ class BarrierDevelopment:
 
         return {
             "scenario": impact_description,
+            "region": region,
+            "commodity": commodity,
+            "barrier_type": barrier_type_key,
             "trigger": trigger_event,
             "barrier_details": barrier_spec,
             "vulnerability_score_used": vulnerability,
             "potential_impact": potential_impact
         }
 
-    def assess_escalation_risk(self, initial_barrier: dict, retaliation_probability: float = 0.3):
+    # Retaliation propensity by relationship impact_potential
+    escalation_intensity = {"high": 1.0, "medium_high": 0.8, "medium": 0.6, "low": 0.4}
+
+    def _barrier_effects(self, commodity: str):
+        """
+        (barrier types, tariff-equivalent %, trade reduction %, selection weight) for a commodity.
+
+        Effects follow simulate_new_barrier: tariffs and SPS compliance costs act as tariff equivalents
+        with half their rate lost in trade, quotas cost the market share loss, TBT difficulty and export
+        restrictions (share of the year under restriction) cut trade directly. Weights are the commodity's
+        vulnerability to each barrier type.
+        """
+        vulnerability = self.commodity_vulnerability.get(commodity, {})
+        types, tariff_equivalent, trade_reduction, weights = [], [], [], []
+        for barrier_type, spec in self.barrier_types.items():
+            v = vulnerability.get(barrier_type, vulnerability.get(barrier_type.replace("_measure", ""), 0.5))
+            if barrier_type == "tariff":
+                tariff, reduction = spec["max_increase_percent"] * v, spec["max_increase_percent"] * v * 0.5
+            elif barrier_type == "quota":
+                tariff, reduction = 0.0, spec["max_reduction_percent"] * v * 0.6
+            elif barrier_type == "sps_measure":
+                tariff = spec["complexity_increase_factor"] * v * 10
+                reduction = tariff * 0.5
+            elif barrier_type == "tbt_measure":
+                tariff, reduction = 0.0, spec["stringency_increase_factor"] * v * 0.3 * 100 * 0.5
+            else:
+                months = spec["duration_months"][min(int(v * len(spec["duration_months"])), len(spec["duration_months"]) - 1)]
+                tariff, reduction = 0.0, months / 12 * 100 * v
+            types.append(barrier_type)
+            tariff_equivalent.append(tariff)
+            trade_reduction.append(reduction)
+            weights.append(v)
+        return types, tariff_equivalent, trade_reduction, weights
+
+    @staticmethod
+    def _distribution(values):
+        ordered = sorted(values)
+        n = len(ordered)
+        pick = lambda q: ordered[min(int(q * n), n - 1)]
+        return {"mean": round(sum(ordered) / n, 2), "p5": round(pick(0.05), 2), "p50": round(pick(0.5), 2),
+                "p95": round(pick(0.95), 2), "max": round(ordered[-1], 2)}
+
+    def _simulate_pair_paths(self, task):
+        """Escalation paths for one country pair; task = (pair key, settings). Runs in a worker process when parallel."""
+        pair_key, impact_potential, settings = task
+        rng = random.Random(settings["seed"])
+        types, tariff_eq, reduction, weights = self._barrier_effects(settings["commodity"])
+        cumulative = list(accumulate(weights))
+        total_weight = cumulative[-1]
+        intensity = self.escalation_intensity.get(impact_potential, 0.6)
+        n, strategy = settings["n_paths"], settings["strategy"]
+        respond = (1 - settings["settlement_probability"]) if strategy == "tit_for_tat" else settings["retaliation_probability"] * intensity
+
+        # Round 0: the initiator (the barrier's region if it is a side of the pair, else the first side)
+        # imposes the initial barrier on its imports from the other side
+        sides = pair_key.split("-", 1) if "-" in pair_key else ["initiator", "target"]
+        initiator = 1 if settings["initial_region"] == sides[1] else 0
+        first = types.index(settings["initial_barrier_type"]) if settings["initial_barrier_type"] in types else 0
+        tariff = [array('d', repeat(0.0, n)), array('d', repeat(0.0, n))]  # tariff equivalent on each side's imports
+        remaining = array('d', repeat(1.0 - reduction[first] / 100, n))   # share of bilateral trade still flowing
+        tariff[initiator] = array('d', repeat(tariff_eq[first], n))
+        last_type = array('b', repeat(first, n))
+        rounds = array('i', repeat(0, n))
+        active = list(range(n))
+        for round_number in range(1, settings["max_rounds"] + 1):
+            side = (initiator + round_number) % 2  # the side hit last round answers
+            draws = [rng.random() for _ in active]
+            still_active = []
+            for path, draw in zip(active, draws):
+                if draw >= respond:
+                    continue
+                if strategy == "tit_for_tat":
+                    choice = last_type[path]
+                else:
+                    choice = bisect_right(cumulative, rng.random() * total_weight)
+                    choice = min(choice, len(types) - 1)
+                scale = 0.5 + 0.5 * rng.random()
+                tariff[side][path] += tariff_eq[choice] * scale
+                remaining[path] *= 1 - reduction[choice] * scale / 100
+                last_type[path] = choice
+                rounds[path] = round_number
+                still_active.append(path)
+            active = still_active
+            if not active:
+                break
+        return pair_key, {
+            "initiator": sides[initiator],
+            "final_tariff_percent": {f"on_{sides[0]}_imports": self._distribution(tariff[0]),
+                                     f"on_{sides[1]}_imports": self._distribution(tariff[1])},
+            "trade_reduction_percent": self._distribution([100 * (1 - r) for r in remaining]),
+            "retaliation_rounds": self._distribution(rounds),
+            "probability_of_retaliation": round(sum(1 for r in rounds if r) / n, 4),
+            "probability_unresolved_at_horizon": round(len(active) / n, 4),
+        }
+
+    def simulate_escalation(self, trade_relationships: dict, initial_barrier: dict, country_pairs: list = None, n_paths: int = 5000,
+                            max_rounds: int = 8, strategy: str = "probabilistic", retaliation_probability: float = 0.3,
+                            settlement_probability: float = 0.25, seed: int = 0, processes: int = None):
+        """
+        Monte Carlo of retaliation dynamics between country pairs after an initial barrier.
+
+        Each path starts with the initial barrier imposed by its region (or the first country of the pair when
+        the region is not a side) on imports from the other side; the sides then alternate. Under 'probabilistic' the side just hit retaliates with retaliation_probability
+        scaled by the relationship's impact_potential, choosing a barrier type weighted by the commodity's
+        vulnerability; under 'tit_for_tat' it answers in kind unless the dispute settles (settlement_probability
+        per round). Paths stop at the first round without retaliation or at max_rounds. All paths advance one
+        round at a time, and pairs can be spread across worker processes; every pair has its own seed, so
+        results do not depend on the process count.
+
+        Args:
+            trade_relationships (dict): BilateralRelationshipEvolution.trade_relationships.
+            initial_barrier (dict): Output of simulate_new_barrier.
+            country_pairs (list, optional): Relationship keys to simulate; defaults to all.
+
+        Returns:
+            dict: Per pair, distributions of final tariff equivalents on each side, trade reduction and rounds.
+        """
+        if strategy not in ("probabilistic", "tit_for_tat"):
+            return {"error": f"Unknown strategy '{strategy}'. Use 'probabilistic' or 'tit_for_tat'."}
+        if not initial_barrier or "error" in initial_barrier:
+            return {"error": "Invalid initial barrier data for escalation simulation."}
+        if not isinstance(n_paths, int) or n_paths < 1:
+            return {"error": f"n_paths must be a positive integer, got {n_paths!r}."}
+        pairs = country_pairs or list(trade_relationships)
+        unknown = [pair for pair in pairs if pair not in trade_relationships]
+        if unknown:
+            return {"error": f"Trade relationships not found: {unknown}"}
+        tasks = []
+        for k, pair in enumerate(pairs):
+            tasks.append((pair, trade_relationships[pair].get("impact_potential", "medium"), {
+                "commodity": initial_barrier.get("commodity"), "initial_barrier_type": initial_barrier.get("barrier_type"),
+                "initial_region": initial_barrier.get("region"),
+                "n_paths": n_paths, "max_rounds": max_rounds, "strategy": strategy,
+                "retaliation_probability": retaliation_probability, "settlement_probability": settlement_probability,
+                "seed": seed * 1000003 + k
+            }))
+        if processes and processes > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                outcomes = list(pool.map(self._simulate_pair_paths, tasks))
+        else:
+            outcomes = list(map(self._simulate_pair_paths, tasks))
+        return {"strategy": strategy, "n_paths": n_paths, "max_rounds": max_rounds,
+                "initial_barrier": initial_barrier.get("scenario"), "pairs": dict(outcomes)}
+
+    def assess_escalation_risk(self, initial_barrier: dict, retaliation_probability: float = 0.3, trade_relationships: dict = None,
+                               country_pairs: list = None, n_paths: int = 2000):
         """
         Assesses the risk of retaliatory barriers or escalation.
+
+        Severity is the share of bilateral trade value lost at the end of the simulated escalation,
+        1 - (1 - trade reduction) / (1 + tariff equivalent), from the mean simulated trade reduction and the
+        larger side's mean tariff equivalent, averaged over the simulated pairs. Without trade_relationships a
+        single generic pair of 'medium' impact potential is simulated. With them, the result also carries the
+        simulate_escalation run for the given pairs.
         """
-        if initial_barrier.get("potential_impact"):
-            # Simplified: higher impact -> higher retaliation risk
-            severity_factor = sum(initial_barrier["potential_impact"].values()) / 100 # Rough measure
-            escalation_risk_score = severity_factor * retaliation_probability
-            return {
-                "initial_barrier_summary": initial_barrier.get("scenario"),
-                "retaliation_probability": retaliation_probability,
-                "estimated_escalation_risk_score": min(escalation_risk_score, 1.0), # Cap at 1.0
-                "possible_retaliation_measures": ["counter-tariffs", "alternative_sps_claims", "import_slowdowns"]
-            }
-        return {"error": "Invalid initial barrier data for escalation assessment."}
+        if not initial_barrier.get("potential_impact"):
+            return {"error": "Invalid initial barrier data for escalation assessment."}
+        relationships = trade_relationships or {"counterpart": {"impact_potential": "medium"}}
+        simulation = self.simulate_escalation(relationships, initial_barrier, country_pairs if trade_relationships else None,
+                                              n_paths=n_paths, retaliation_probability=retaliation_probability)
+        if "error" in simulation:
+            return simulation
+        severities = []
+        for outcome in simulation["pairs"].values():
+            tariff_equivalent = max(d["mean"] for d in outcome["final_tariff_percent"].values()) / 100
+            trade_reduction = outcome["trade_reduction_percent"]["mean"] / 100
+            severities.append(1 - (1 - trade_reduction) / (1 + tariff_equivalent))
+        severity_factor = sum(severities) / len(severities)
+        escalation_risk_score = severity_factor * retaliation_probability
+        assessment = {
+            "initial_barrier_summary": initial_barrier.get("scenario"),
+            "retaliation_probability": retaliation_probability,
+            "severity_factor": round(severity_factor, 4),
+            "estimated_escalation_risk_score": round(min(escalation_risk_score, 1.0), 4), # Cap at 1.0
+            "possible_retaliation_measures": ["counter-tariffs", "alternative_sps_claims", "import_slowdowns"]
+        }
+        if trade_relationships:
+            assessment["escalation_simulation"] = simulation
+        return assessment
 
 class TradeAgreementImpact:
     """
     Analyzes the impact of major multilateral and bilateral trade agreements.
     """
+    reference_date = "2025-01-01"  # Membership date used when no on_date is given, so results don't move with the clock
+
     def __init__(self):
         self.agreements = {
             "CPTPP": { # Comprehensive and Progressive Agreement for Trans-Pacific Partnership
@@ -225,6 +575,42 @@ class TradeAgreementImpact:
                 "example_commodities_benefiting": ["US dairy to Canada", "corn/soybeans (US to Mexico)"]
             }
         }
+        # Country groups expanded when an agreement names the group as a party
+        self.country_groups = {
+            "ASEAN": ["Indonesia", "Thailand", "Vietnam", "Malaysia", "Philippines", "Singapore", "Brunei", "Cambodia", "Laos", "Myanmar"],
+            "EU": ["Austria", "Belgium", "Bulgaria", "Croatia", "Cyprus", "Czechia", "Denmark", "Estonia", "Finland", "France", "Germany",
+                   "Greece", "Hungary", "Ireland", "Italy", "Latvia", "Lithuania", "Luxembourg", "Malta", "Netherlands", "Poland",
+                   "Portugal", "Romania", "Slovakia", "Slovenia", "Spain", "Sweden"],
+            "AU": ["Algeria", "Angola", "Benin", "Botswana", "Burkina Faso", "Burundi", "Cabo Verde", "Cameroon", "Central African Republic",
+                   "Chad", "Comoros", "DR Congo", "Republic of the Congo", "Djibouti", "Egypt", "Equatorial Guinea", "Eritrea", "Eswatini",
+                   "Ethiopia", "Gabon", "Gambia", "Ghana", "Guinea", "Guinea-Bissau", "Ivory Coast", "Kenya", "Lesotho", "Liberia", "Libya",
+                   "Madagascar", "Malawi", "Mali", "Mauritania", "Mauritius", "Morocco", "Mozambique", "Namibia", "Niger", "Nigeria", "Rwanda",
+                   "Sahrawi Republic", "Sao Tome and Principe", "Senegal", "Seychelles", "Sierra Leone", "Somalia", "South Africa",
+                   "South Sudan", "Sudan", "Tanzania", "Togo", "Tunisia", "Uganda", "Zambia", "Zimbabwe"],
+            "Mercosur": ["Argentina", "Brazil", "Paraguay", "Uruguay"]
+        }
+        self.country_aliases = {"US": "USA", "United States": "USA", "United Kingdom": "UK", "Korea": "South Korea",
+                                "Cote d'Ivoire": "Ivory Coast", "Côte d'Ivoire": "Ivory Coast"}
+        # Party -> date the agreement applies to it ((start, end) for a limited range, None for not in force).
+        # Individual entries override the group they belong to. Hub-and-spoke agreements list their
+        # components separately so that two spokes are not treated as covering each other.
+        self.agreement_membership = {
+            "CPTPP": {"parties": {"Australia": "2018-12-30", "Canada": "2018-12-30", "Japan": "2018-12-30", "Mexico": "2018-12-30",
+                                  "New Zealand": "2018-12-30", "Singapore": "2018-12-30", "Vietnam": "2019-01-14", "Peru": "2021-09-19",
+                                  "Malaysia": "2022-11-29", "Chile": "2023-02-21", "Brunei": "2023-07-12", "UK": "2024-12-15"}},
+            "RCEP": {"parties": {"ASEAN": "2022-01-01", "China": "2022-01-01", "Japan": "2022-01-01", "Australia": "2022-01-01",
+                                 "New Zealand": "2022-01-01", "South Korea": "2022-02-01", "Malaysia": "2022-03-18",
+                                 "Indonesia": "2023-01-02", "Philippines": "2023-06-02", "Myanmar": None}},
+            "AfCFTA": {"parties": {"AU": "2021-01-01", "Eritrea": None}},
+            "EU_Bilateral_FTAs": {"components": {
+                "EU-Canada (CETA)": {"EU": "2017-09-21", "Canada": "2017-09-21", "UK": ("2017-09-21", "2020-12-31")},
+                "EU-Japan (EPA)": {"EU": "2019-02-01", "Japan": "2019-02-01", "UK": ("2019-02-01", "2020-12-31")},
+                "EU-Vietnam (EVFTA)": {"EU": "2020-08-01", "Vietnam": "2020-08-01"},
+                "EU-Mercosur (pending ratification)": {"EU": None, "Mercosur": None}
+            }},
+            "USMCA": {"parties": {"USA": "2020-07-01", "Canada": "2020-07-01", "Mexico": "2020-07-01"}}
+        }
+        self._membership_index = None
 
     def get_agreement_details(self, agreement_name: str):
         """
@@ -232,47 +618,125 @@ class TradeAgreementImpact:
         """
         return self.agreements.get(agreement_name, {"error": f"Agreement {agreement_name} not found."})
 
-    def analyze_impact_on_commodity_flow(self, agreement_name: str, commodity: str, exporting_country: str, importing_country: str):
+    def rebuild_membership_index(self):
+        """
+        Builds the country -> agreement bitset index, one bitset per date epoch.
+
+        Each agreement component gets a bit. Epoch boundaries are every accession or expiry date, so within
+        an epoch membership is constant and "which agreements cover X and Y on D" is one bisect plus an AND
+        of the two countries' bitsets. Agreements without membership data fall back to their 'members' list,
+        treated as always in force. Call again after editing agreements or membership data.
+        """
+        never = date.max.toordinal() + 1
+        components, spans = [], {}  # spans: (country, bit) -> (start ordinal, end ordinal)
+        for name, agreement in self.agreements.items():
+            membership = self.agreement_membership.get(name)
+            if membership is None:
+                members = agreement.get("members")
+                if not isinstance(members, list):
+                    continue
+                membership = {"parties": {member.split(" (")[0]: "0001-01-01" for member in members}}
+            parts = membership.get("components", {name: membership.get("parties", {})})
+            for component, parties in parts.items():
+                bit = len(components)
+                components.append((name, component))
+                # Groups first so that individual entries override them
+                for party in sorted(parties, key=lambda p: p not in self.country_groups):
+                    span = parties[party]
+                    if isinstance(span, tuple):
+                        start, end = date.fromisoformat(span[0]).toordinal(), date.fromisoformat(span[1]).toordinal() + 1
+                    elif span is None:
+                        start = end = never
+                    else:
+                        start, end = date.fromisoformat(span).toordinal(), never
+                    for country in [party] + self.country_groups.get(party, []):
+                        spans[(country, bit)] = (start, end)
+
+        boundaries = sorted({ordinal for span in spans.values() for ordinal in span if ordinal < never} | {1})
+        epochs = []
+        for ordinal in boundaries:
+            masks = {}
+            for (country, bit), (start, end) in spans.items():
+                if start <= ordinal < end:
+                    masks[country] = masks.get(country, 0) | (1 << bit)
+            epochs.append(masks)
+        agreement_names = list(dict.fromkeys(name for name, _ in components))
+        agreement_bits = {name: 0 for name in agreement_names}
+        for bit, (name, _) in enumerate(components):
+            agreement_bits[name] |= 1 << bit
+        self._membership_index = {"components": components, "boundaries": boundaries, "epochs": epochs,
+                                  "agreement_names": agreement_names, "agreement_bits": agreement_bits}
+        return self._membership_index
+
+    def _country_masks(self, on_date=None):
+        index = self._membership_index or self.rebuild_membership_index()
+        on_date = self.reference_date if on_date is None else on_date
+        day = on_date if isinstance(on_date, date) else date.fromisoformat(on_date)
+        return index["epochs"][bisect_right(index["boundaries"], day.toordinal()) - 1]
+
+    def agreements_covering(self, exporting_country: str, importing_country: str, on_date=None):
+        """
+        Agreements in force between two countries on a date (default reference_date).
+
+        Returns:
+            dict: Agreement names and, for hub-and-spoke agreements, the covering components.
+        """
+        masks = self._country_masks(on_date)
+        canonical = self.country_aliases.get
+        shared = masks.get(canonical(exporting_country, exporting_country), 0) & masks.get(canonical(importing_country, importing_country), 0)
+        components = [self._membership_index["components"][bit] for bit in range(shared.bit_length()) if shared >> bit & 1]
+        return {"agreements": list(dict.fromkeys(name for name, _ in components)),
+                "components": [component for name, component in components if component != name]}
+
+    def coverage_matrix(self, countries: list, on_date=None):
+        """
+        Agreement coverage for every ordered country pair in one pass (on_date defaults to reference_date).
+
+        Returns:
+            dict: 'countries', 'agreements' (bit order) and 'coverage', a row-major list where entry
+                  i * n + j has bit k set when agreements[k] covers exports from countries[i] to countries[j].
+                  The diagonal (a country with itself) is 0.
+        """
+        masks = self._country_masks(on_date)
+        index = self._membership_index
+        row_masks = [masks.get(self.country_aliases.get(c, c), 0) for c in countries]
+        # Component bits -> agreement bits, memoised per distinct shared mask
+        component_to_agreement = [index["agreement_names"].index(name) for name, _ in index["components"]]
+        translated = {0: 0}
+
+        def to_agreement_bits(shared):
+            value = translated.get(shared)
+            if value is None:
+                value = 0
+                for bit in range(shared.bit_length()):
+                    if shared >> bit & 1:
+                        value |= 1 << component_to_agreement[bit]
+                translated[shared] = value
+            return value
+        coverage = []
+        for mask in row_masks:
+            coverage.extend(map(to_agreement_bits, map(operator.and_, row_masks, repeat(mask))))
+        coverage[::len(row_masks) + 1] = repeat(0, len(row_masks))
+        return {"countries": list(countries), "agreements": index["agreement_names"], "coverage": coverage}
+
+    def analyze_impact_on_commodity_flow(self, agreement_name: str, commodity: str, exporting_country: str, importing_country: str, on_date=None):
         """
         Analyzes the potential impact of an agreement on a specific commodity flow.
-        This is a simplified qualitative analysis.
+        This is a simplified qualitative analysis. Membership (including ASEAN, EU and AU group expansion and
+        accession dates) comes from the precomputed membership index; on_date defaults to reference_date.
         """
         agreement = self.agreements.get(agreement_name)
         if not agreement:
             return {"error": f"Agreement {agreement_name} not found."}
 
         impact_statement = f"Analysis for {commodity} from {exporting_country} to {importing_country} under {agreement_name}: "
-        
-        exporter_is_member = False
-        importer_is_member = False
-        
-        asean_countries = ["Indonesia", "Thailand", "Vietnam", "Malaysia", "Philippines", "Singapore", "Brunei", "Cambodia", "Laos", "Myanmar"]
-        # Temp list for current agreement's members, resolving groups like ASEAN
-        resolved_members = []
-        if isinstance(agreement["members"], list):
-            for member_entry in agreement["members"]:
-                if isinstance(member_entry, str) and member_entry.startswith("ASEAN"):
-                    resolved_members.extend(asean_countries)
-                elif isinstance(member_entry, str):
-                    resolved_members.append(member_entry)
-        elif isinstance(agreement["members"], str): # e.g. "Most African Union member states"
-            if agreement["members"].startswith("ASEAN"): # Should not happen if data is consistent, but defensive
-                resolved_members.extend(asean_countries)
-            # For broad string descriptors like AfCFTA, direct check is hard. Logic below handles it.
-            pass 
-
-        if exporting_country in resolved_members:
-            exporter_is_member = True
-        if importing_country in resolved_members:
-            importer_is_member = True
-
-        # Special handling for AfCFTA due to broad member string
-        if agreement_name == "AfCFTA" and agreement["members"] == "Most African Union member states":
-            # This is a placeholder for a real check against a list of AU/AfCFTA members
-            # For demo, assume it's plausible if countries sound African (very simplified)
-            african_example_countries = ["Nigeria", "South Africa", "Kenya", "Egypt", "Ghana", "Ethiopia", "Algeria", "Morocco", "Angola", "Tanzania", "Ivory Coast"]
-            if exporting_country in african_example_countries : exporter_is_member = True # Simplified check
-            if importing_country in african_example_countries : importer_is_member = True # Simplified check
+
+        masks = self._country_masks(on_date)
+        agreement_mask = self._membership_index["agreement_bits"].get(agreement_name, 0)
+        exporter_mask = masks.get(self.country_aliases.get(exporting_country, exporting_country), 0) & agreement_mask
+        importer_mask = masks.get(self.country_aliases.get(importing_country, importing_country), 0) & agreement_mask
+        # Both parties to the same component (e.g. the same EU bilateral FTA)
+        exporter_is_member = importer_is_member = bool(exporter_mask & importer_mask)
 
         if not (exporter_is_member and importer_is_member):
             impact_statement += "No direct impact as one or both countries are not definitively members of the agreement based on available data. Potential for trade diversion."
@@ -306,14 +770,14 @@ class TradeAgreementImpact:
         
         return {"analysis": impact_statement, "trade_change_potential": trade_change_potential}
 
-    def compare_agreement_impacts(self, commodity: str, exporting_country: str, importing_country: str, agreements_to_compare: list[str]):
+    def compare_agreement_impacts(self, commodity: str, exporting_country: str, importing_country: str, agreements_to_compare: list[str], on_date=None):
         """
         Compares the potential impacts of multiple agreements on a specific trade flow.
         """
         comparison_results = {}
         for agreement_name in agreements_to_compare:
             comparison_results[agreement_name] = self.analyze_impact_on_commodity_flow(
-                agreement_name, commodity, exporting_country, importing_country
+                agreement_name, commodity, exporting_country, importing_country, on_date
             )
         return comparison_results
 
@@ -353,6 +817,289 @@ class ConsumerPreferenceImpact:
         """
         pass
 
+class TariffScheduleStore:
+    """
+    Compact, memory-mapped tariff schedule indexed by (importer, HS code, partner, year).
+
+    File layout: an 8-byte magic, a length-prefixed JSON header (country table, line count) and then
+    fixed-width columns: sorted uint64 keys, TRQ volumes (float64), and MFN / preferential / specific /
+    in-quota / out-of-quota rates (float32). Opening maps the file and casts memoryviews over the columns,
+    so load time does not depend on the number of lines; lookups are a bisect over the key column.
+
+    Keys pack importer (12 bits), HS level (6 or 8 digits, 1 bit), HS code (27 bits), partner (12 bits,
+    0 = MFN line for all partners) and schedule year offset from 1990 (8 bits). A query for year Y uses
+    the latest schedule year <= Y; an HS-8 query falls back to the HS-6 line when no national line exists,
+    separately for the MFN line and the partner's preferential line.
+    """
+    magic = b'TARIFFS1'
+    base_year = 1990
+    float32_columns = ('mfn_pct', 'preferential_pct', 'specific_usd_mt', 'in_quota_pct', 'out_quota_pct')
+    # Status codes returned by bulk_landed_cost
+    STATUS_OK = 0
+    STATUS_NO_SCHEDULE = 1  # No line found; zero tariff assumed, as in get_tariff_impact
+    STATUS_INVALID = 2      # Unknown importer or malformed HS code
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:8]) != self.magic:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{path} is not a tariff schedule store.")
+        header_len = int.from_bytes(view[8:16], 'little')
+        header = json.loads(bytes(view[16:16 + header_len]).decode('utf-8'))
+        self.countries = header['countries']
+        self.country_ids = {c: i + 1 for i, c in enumerate(self.countries)}
+        self.num_lines = n = header['num_lines']
+        offset = 16 + header_len + (-(16 + header_len) % 8)
+        self._view = view
+        self.keys = view[offset:offset + 8 * n].cast('Q')
+        offset += 8 * n
+        self.trq_volume_mt = view[offset:offset + 8 * n].cast('d')
+        offset += 8 * n
+        for name in self.float32_columns:
+            setattr(self, name, view[offset:offset + 4 * n].cast('f'))
+            offset += 4 * n
+
+    @staticmethod
+    def _hs_parts(hs_code):
+        """(level bit, integer code) for an HS-6/8/10 code given as str or int; None if malformed."""
+        digits = ''.join(ch for ch in str(hs_code) if ch.isdigit())
+        if len(digits) == 10:
+            digits = digits[:8]
+        if len(digits) == 8:
+            return 1, int(digits)
+        if len(digits) == 6:
+            return 0, int(digits)
+        return None
+
+    @classmethod
+    def _prefix(cls, importer_id, level, hs, partner_id):
+        return (((importer_id << 1 | level) << 27 | hs) << 12 | partner_id)
+
+    @classmethod
+    def build(cls, path, lines):
+        """
+        Writes a store from tariff lines and opens it.
+
+        Args:
+            path (str): Output file.
+            lines (iterable): Dicts with 'importer', 'hs_code' (HS-6 or HS-8), 'year', optional 'partner'
+                              (None for the MFN line) and any of 'mfn_pct', 'preferential_pct',
+                              'specific_usd_mt', 'trq_volume_mt', 'in_quota_pct', 'out_quota_pct'.
+        """
+        countries, country_ids, rows = [], {}, []
+        for line in lines:
+            for code in (line['importer'], line.get('partner')):
+                if code is not None and code not in country_ids:
+                    countries.append(code)
+                    country_ids[code] = len(countries)
+            hs = cls._hs_parts(line['hs_code'])
+            if hs is None:
+                raise ValueError(f"Malformed HS code {line['hs_code']!r}; expected 6, 8 or 10 digits.")
+            year_offset = line['year'] - cls.base_year
+            if not 0 <= year_offset < 256 or len(countries) >= 4096:
+                raise ValueError("Year outside 1990-2245 or more than 4095 countries.")
+            partner = country_ids[line['partner']] if line.get('partner') is not None else 0
+            key = cls._prefix(country_ids[line['importer']], hs[0], hs[1], partner) << 8 | year_offset
+            rows.append((key, line.get('trq_volume_mt', 0.0),
+                         line.get('mfn_pct', 0.0), line.get('preferential_pct', math.nan), line.get('specific_usd_mt', 0.0),
+                         line.get('in_quota_pct', 0.0), line.get('out_quota_pct', 0.0)))
+        rows.sort(key=lambda r: r[0])
+        header = json.dumps({'countries': countries, 'num_lines': len(rows)}).encode('utf-8')
+        with open(path, 'wb') as fh:
+            fh.write(cls.magic)
+            fh.write(len(header).to_bytes(8, 'little'))
+            fh.write(header)
+            fh.write(bytes(-(16 + len(header)) % 8))
+            for col, typecode in enumerate(('Q', 'd') + ('f',) * len(cls.float32_columns)):
+                array(typecode, (r[col] for r in rows)).tofile(fh)
+        return cls(path)
+
+    @classmethod
+    def from_tariff_data(cls, path, tariff_data, commodity_hs_codes, year):
+        """Builds a store from MarketAccessAnalysis.tariff_data-style nested dicts (commodity -> importer -> terms)."""
+        lines = []
+        for commodity, by_importer in tariff_data.items():
+            if commodity not in commodity_hs_codes:
+                continue
+            for importer, terms in by_importer.items():
+                line = {'importer': importer, 'hs_code': commodity_hs_codes[commodity], 'year': year,
+                        'mfn_pct': terms.get('mfn_avg_tariff_percent', 0.0),
+                        'specific_usd_mt': terms.get('specific_tariff_usd_mt', 0.0)}
+                if 'trq_volume_mt' in terms:
+                    line.update(trq_volume_mt=terms['trq_volume_mt'], in_quota_pct=terms.get('in_quota_tariff_percent', 0.0),
+                                out_quota_pct=terms.get('out_quota_tariff_percent', 0.0))
+                lines.append(line)
+        return cls.build(path, lines)
+
+    def close(self):
+        for name in ('keys', 'trq_volume_mt') + self.float32_columns:
+            getattr(self, name).release()
+        self._view.release()
+        self._mmap.close()
+
+    def _find(self, prefix, year):
+        """Index of the latest line with this prefix and schedule year <= year, or -1."""
+        year_offset = min(max(year - self.base_year, 0), 255)
+        i = bisect_right(self.keys, prefix << 8 | year_offset) - 1
+        return i if i >= 0 and self.keys[i] >> 8 == prefix else -1
+
+    def _line_indices(self, importer_id, hs, partner_id, year):
+        """
+        (mfn index, preferential index), each with its own HS-8 -> HS-6 fallback; -1 where absent. A partner
+        preference filed only at HS-6 therefore still applies under a national HS-8 MFN line. A partner line
+        without a preferential rate (NaN) counts as absent, so its shipments pay the MFN/TRQ regime and MFN
+        specific duty.
+        """
+        level, code = hs
+        candidates = [(level, code)] + ([(0, code // 100)] if level == 1 else [])
+        mfn = pref = -1
+        for lvl, c in candidates:
+            if mfn < 0:
+                mfn = self._find(self._prefix(importer_id, lvl, c, 0), year)
+            if pref < 0 and partner_id:
+                pref = self._find(self._prefix(importer_id, lvl, c, partner_id), year)
+                if pref >= 0 and math.isnan(self.preferential_pct[pref]):
+                    pref = -1
+        return mfn, pref
+
+    def lookup(self, importer, hs_code, partner=None, year=2024):
+        """
+        Applicable tariff terms for one (importer, HS code, partner, year).
+
+        Returns:
+            dict: MFN, preferential (None if no partner line), specific and TRQ terms, or an error/message.
+        """
+        hs = self._hs_parts(hs_code)
+        if importer not in self.country_ids or hs is None:
+            return {"error": f"Unknown importer '{importer}' or malformed HS code {hs_code!r}."}
+        mfn, pref = self._line_indices(self.country_ids[importer], hs, self.country_ids.get(partner, 0), year)
+        if mfn < 0 and pref < 0:
+            return {"message": f"No tariff line for HS {hs_code} into {importer}.", "importer": importer, "hs_code": str(hs_code)}
+        base = mfn if mfn >= 0 else pref
+        result = {
+            "importer": importer, "hs_code": str(hs_code), "partner": partner,
+            "schedule_year": self.base_year + (self.keys[base] & 0xFF),
+            "mfn_pct": self.mfn_pct[mfn] if mfn >= 0 else None,
+            "preferential_pct": self.preferential_pct[pref] if pref >= 0 else None,
+            "specific_usd_mt": self.specific_usd_mt[pref if pref >= 0 else mfn],
+            "trq_volume_mt": self.trq_volume_mt[mfn] if mfn >= 0 else 0.0
+        }
+        if result["trq_volume_mt"]:
+            result.update(in_quota_pct=self.in_quota_pct[mfn], out_quota_pct=self.out_quota_pct[mfn])
+        return result
+
+    def bulk_landed_cost(self, importers, hs_codes, partners, years, fob_usd_mt, volumes_mt, trq_fill='independent'):
+        """
+        Tariff and landed cost (before freight and other fees) for arrays of shipments.
+
+        A partner's preferential line, when present, replaces the MFN/TRQ regime; otherwise TRQ lines charge the
+        in-quota rate up to the quota and the out-of-quota rate beyond it. With trq_fill='sequential' the quota of
+        each line is drawn down first-come-first-served in shipment order; 'independent' treats every shipment as
+        if the quota were unused. Specific duties are added per tonne.
+
+        Returns:
+            dict: Columns 'tariff_cost_usd', 'landed_cost_usd', 'effective_tariff_rate_percent' (array('d')) and
+                  'status' (array('b'), see STATUS_* codes).
+        """
+        n = len(volumes_mt)
+        if not (len(importers) == len(hs_codes) == len(partners) == len(years) == len(fob_usd_mt) == n):
+            return {"error": "All shipment columns must have the same length."}
+        if trq_fill not in ('independent', 'sequential'):
+            return {"error": f"Unknown trq_fill '{trq_fill}'. Use 'independent' or 'sequential'."}
+        country_ids = self.country_ids
+        hs_cache = {}
+        # Shipments repeat the same lane far more often than lines differ: resolve each distinct lane once
+        lane_cache = {}
+        mfn_idx, pref_idx = array('l'), array('l')
+        status = array('b')
+        for imp, hs_code, partner, year in zip(importers, hs_codes, partners, years):
+            lane = (imp, hs_code, partner, year)
+            found = lane_cache.get(lane)
+            if found is None:
+                hs = hs_cache.get(hs_code)
+                if hs is None:
+                    hs = hs_cache[hs_code] = self._hs_parts(hs_code) or ()
+                if imp not in country_ids or not hs:
+                    found = (-1, -1, self.STATUS_INVALID)
+                else:
+                    m, p = self._line_indices(country_ids[imp], hs, country_ids.get(partner, 0), year)
+                    found = (m, p, self.STATUS_OK if m >= 0 or p >= 0 else self.STATUS_NO_SCHEDULE)
+                lane_cache[lane] = found
+            mfn_idx.append(found[0])
+            pref_idx.append(found[1])
+            status.append(found[2])
+
+        value = array('d', map(operator.mul, fob_usd_mt, volumes_mt))
+        pref_col, mfn_col = self.preferential_pct, self.mfn_pct
+        ad_valorem_pct = array('d', bytes(8 * n))
+        specific = array('d', bytes(8 * n))
+        trq_rows = []
+        for i, (m, p) in enumerate(zip(mfn_idx, pref_idx)):
+            if p >= 0:
+                ad_valorem_pct[i] = pref_col[p]
+                specific[i] = self.specific_usd_mt[p]
+            elif m >= 0:
+                if self.trq_volume_mt[m]:
+                    trq_rows.append(i)
+                else:
+                    ad_valorem_pct[i] = mfn_col[m]
+                specific[i] = self.specific_usd_mt[m]
+        tariff = array('d', map(operator.add, map(operator.mul, value, map(operator.truediv, ad_valorem_pct, repeat(100.0))),
+                                map(operator.mul, specific, volumes_mt)))
+        remaining = {}
+        for i in trq_rows:
+            m = mfn_idx[i]
+            quota = remaining.get(m, self.trq_volume_mt[m]) if trq_fill == 'sequential' else self.trq_volume_mt[m]
+            in_quota = min(volumes_mt[i], max(quota, 0.0))
+            if trq_fill == 'sequential':
+                remaining[m] = quota - in_quota
+            tariff[i] += fob_usd_mt[i] * (in_quota * self.in_quota_pct[m] + (volumes_mt[i] - in_quota) * self.out_quota_pct[m]) / 100
+        landed = array('d', map(operator.add, value, tariff))
+        effective = array('d', (t / v * 100 if v else 0.0 for t, v in zip(tariff, value)))
+        return {"tariff_cost_usd": tariff, "landed_cost_usd": landed, "effective_tariff_rate_percent": effective, "status": status}
+
+class MarketAccessBatchResult:
+    """
+    Columnar output of MarketAccessAnalysis.analyze_market_access_batch.
+
+    status holds bit flags (see MarketAccessAnalysis.STATUS_*); the narrative assessment and full per-check
+    detail of analyze_market_access are produced only when explain(row) is called.
+    """
+    def __init__(self, analyzer, shipments, tariff_cost_usd, effective_tariff_rate_percent, landed_cost_usd_mt, status):
+        self._analyzer = analyzer
+        self._shipments = shipments
+        self.tariff_cost_usd = tariff_cost_usd
+        self.effective_tariff_rate_percent = effective_tariff_rate_percent
+        self.landed_cost_usd_mt = landed_cost_usd_mt
+        self.status = status
+
+    def __len__(self):
+        return len(self.status)
+
+    def status_counts(self):
+        """Number of shipments per distinct status code."""
+        counts = {}
+        for code in self.status:
+            counts[code] = counts.get(code, 0) + 1
+        return counts
+
+    def assessment(self, row):
+        return self._analyzer.describe_status(self.status[row])
+
+    def explain(self, row):
+        """Full analyze_market_access output for one shipment, computed on demand."""
+        columns = self._shipments
+        optional = {key: columns[key][row] for key in ('product_attributes', 'trade_agreement_context', 'product_origin_details')
+                    if columns.get(key) is not None}
+        return self._analyzer.analyze_market_access(
+            columns['commodity'][row], columns['exporting_country'][row], columns['importing_country'][row],
+            columns['fob_price_usd_mt'][row], columns['volume_mt'][row], optional.get('product_attributes') or {},
+            optional.get('trade_agreement_context'), optional.get('product_origin_details'))
+
 class MarketAccessAnalysis:
     """
     Analyzes market access conditions, including tariffs, quotas, and non-tariff barriers.
@@ -374,12 +1121,45 @@ class MarketAccessAnalysis:
         self.rules_of_origin = { # Example
             "USMCA": {"wheat": " wholly obtained or sufficient transformation (e.g., 50% regional value content)"}
         }
-
-    def get_tariff_impact(self, commodity: str, exporting_country: str, importing_country: str, fob_price_usd_mt: float, volume_mt: float):
+        self._mrl_index_key = None
+        self._mrl_index = {}
+        # HS-6 codes used to query an attached TariffScheduleStore by commodity name
+        self.commodity_hs_codes = {"wheat": "100199", "corn": "100590", "soybeans": "120190", "rice": "100630", "sugar": "170199"}
+        self.tariff_store = None
+
+    # Bit flags of analyze_market_access_batch status codes (0 = no issues found)
+    STATUS_HIGH_TARIFF = 1
+    STATUS_SPS_ISSUE = 2
+    STATUS_TBT_ISSUE = 4
+    STATUS_ROO_ISSUE = 8
+    STATUS_NO_TARIFF_DATA = 16
+
+    def attach_tariff_store(self, tariff_store: TariffScheduleStore):
+        """Uses a TariffScheduleStore for tariff lookups; tariff_data remains the fallback for lanes it does not cover."""
+        self.tariff_store = tariff_store
+
+    def get_tariff_impact(self, commodity: str, exporting_country: str, importing_country: str, fob_price_usd_mt: float, volume_mt: float, hs_code: str = None, year: int = 2024):
         """
         Estimates the impact of tariffs on import costs.
         Handles MFN tariffs, specific tariffs, and TRQs (simplified).
+        With a tariff store attached, the line for hs_code (or the commodity's default HS code), the exporter as
+        partner and the given year is used when the store has one.
         """
+        hs_code = hs_code if hs_code else self.commodity_hs_codes.get(commodity.lower())
+        if self.tariff_store is not None and hs_code:
+            line = self.tariff_store.lookup(importing_country, hs_code, exporting_country, year)
+            if "error" not in line and "message" not in line:
+                costs = self.tariff_store.bulk_landed_cost([importing_country], [hs_code], [exporting_country], [year], [fob_price_usd_mt], [volume_mt])
+                return {
+                    "commodity": commodity, "importing_country": importing_country,
+                    "fob_price_usd_mt": fob_price_usd_mt, "volume_mt": volume_mt,
+                    "total_fob_value_usd": fob_price_usd_mt * volume_mt,
+                    "tariff_cost_usd": round(costs["tariff_cost_usd"][0], 2),
+                    "landed_cost_before_other_fees_usd": round(costs["landed_cost_usd"][0], 2),
+                    "effective_tariff_rate_percent": round(costs["effective_tariff_rate_percent"][0], 2),
+                    "tariff_details": line
+                }
+
         country_tariffs = self.tariff_data.get(commodity, {}).get(importing_country)
         if not country_tariffs:
             return {"message": f"No specific tariff data for {commodity} into {importing_country}. Assuming 0% tariff.", "tariff_cost_usd": 0, "effective_tariff_rate_percent": 0}
@@ -444,6 +1224,93 @@ class MarketAccessAnalysis:
         
         return compliance_status
 
+    def _refresh_mrl_index(self, markets, default_mrl_mg_kg):
+        """Drops the per-analyte MRL columns if sps_measures, the market list or the default MRL changed."""
+        key = (tuple(markets), default_mrl_mg_kg,
+               tuple(tuple(sorted(self.sps_measures.get(m, {}).get("max_residue_limits", {}).items())) for m in markets))
+        if key != self._mrl_index_key:
+            self._mrl_index_key = key
+            self._mrl_index = {}
+
+    def _mrl_column(self, analyte, markets, default_mrl_mg_kg):
+        """(ascending limits, market indices) of every market that limits this analyte, built lazily per analyte."""
+        column = self._mrl_index.get(analyte)
+        if column is None:
+            limits = []
+            for market_idx, market in enumerate(markets):
+                limit = self.sps_measures.get(market, {}).get("max_residue_limits", {}).get(analyte, default_mrl_mg_kg)
+                if limit is not None:
+                    limits.append((limit, market_idx))
+            limits.sort()
+            column = self._mrl_index[analyte] = (array('d', (l for l, _ in limits)), array('l', (m for _, m in limits)))
+        return column
+
+    def check_sps_residues_batch(self, lab_results, markets: list = None, default_mrl_mg_kg: float = None):
+        """
+        Checks lab residue results for many samples against the MRLs of many destination markets.
+
+        Residues are held sparsely (only detected analytes). For each analyte the markets limiting it are kept
+        sorted by MRL, so a detected residue fails exactly the markets in front of its bisect position and
+        every other market passes without being visited.
+
+        Args:
+            lab_results (dict or tuple): {sample_id: {analyte: residue_mg_kg}} or a COO table
+                                         (sample_ids, analytes, residues_mg_kg) of detections.
+            markets (list, optional): Destination markets; defaults to every market in sps_measures with MRLs.
+            default_mrl_mg_kg (float, optional): Limit applied to analytes a market does not list
+                                                 (e.g. 0.01 for an EU-style default); None leaves them unregulated.
+
+        Returns:
+            dict: 'fail_matrix' (flat bytearray, samples x markets, 1 = fails), its 'shape', sample and market order,
+                  'worst_analyte' for each failing (sample, market) cell keyed by that pair, and per-market counts.
+        """
+        if markets is None:
+            markets = [m for m, reqs in self.sps_measures.items() if "max_residue_limits" in reqs]
+        if isinstance(lab_results, dict):
+            samples = list(lab_results)
+            detections = [lab_results[s].items() for s in samples]
+        else:
+            sample_col, analyte_col, residue_col = lab_results
+            if not len(sample_col) == len(analyte_col) == len(residue_col):
+                return {"error": "sample_ids, analytes and residues must have the same length."}
+            rows = {}
+            for s, a, v in zip(sample_col, analyte_col, residue_col):
+                rows.setdefault(s, []).append((a, v))
+            samples = list(rows)
+            detections = [rows[s] for s in samples]
+
+        self._refresh_mrl_index(markets, default_mrl_mg_kg)
+        n_markets = len(markets)
+        fail_matrix = bytearray(len(samples) * n_markets)
+        worst = {}
+        fail_counts = [0] * n_markets
+        for row, (sample, found) in enumerate(zip(samples, detections)):
+            base = row * n_markets
+            cell_worst = {}
+            for analyte, residue in found:
+                if residue <= 0:
+                    continue
+                limits, market_idx = self._mrl_column(analyte, markets, default_mrl_mg_kg)
+                for j in range(bisect_left(limits, residue)):
+                    limit = limits[j]
+                    ratio = residue / limit if limit > 0 else math.inf
+                    m = market_idx[j]
+                    if m not in cell_worst or ratio > cell_worst[m][3]:
+                        cell_worst[m] = (analyte, residue, limit, ratio)
+            for m, (analyte, residue, limit, ratio) in cell_worst.items():
+                fail_matrix[base + m] = 1
+                fail_counts[m] += 1
+                worst[(sample, markets[m])] = {"analyte": analyte, "residue_mg_kg": residue, "mrl_mg_kg": limit,
+                                               "exceedance_ratio": round(ratio, 2) if ratio != math.inf else 'inf'}
+        return {
+            "samples": samples, "markets": list(markets),
+            "shape": (len(samples), n_markets),
+            "fail_matrix": fail_matrix,
+            "worst_analyte": worst,
+            "failing_samples_by_market": dict(zip(markets, fail_counts)),
+            "pass_rate_by_market": {m: round(1 - c / len(samples), 4) if samples else 1.0 for m, c in zip(markets, fail_counts)}
+        }
+
     def check_tbt_compliance(self, commodity: str, importing_country: str, product_attributes: dict):
         """
         Checks basic TBT compliance.
@@ -521,6 +1388,514 @@ class MarketAccessAnalysis:
             "landed_cost_estimate_usd_mt": round(landed_cost_estimate_per_mt, 2)
         }
 
+    def describe_status(self, status_code):
+        """Overall assessment text for a batch status code, with the same precedence as analyze_market_access."""
+        if status_code & self.STATUS_ROO_ISSUE:
+            return "Potential Rules of Origin issue."
+        if status_code & (self.STATUS_SPS_ISSUE | self.STATUS_TBT_ISSUE):
+            return "Significant non-tariff barriers."
+        if status_code & self.STATUS_HIGH_TARIFF:
+            return "Challenging due to high tariffs."
+        return "Good"
+
+    def _lane_tariff_terms(self, commodity, importing_country):
+        """(ad valorem %, specific USD/t, TRQ volume, in-quota %, out-of-quota %) from tariff_data, or None."""
+        terms = self.tariff_data.get(commodity, {}).get(importing_country)
+        if not terms:
+            return None
+        if "trq_volume_mt" in terms:
+            return (0.0, terms.get("specific_tariff_usd_mt", 0), terms["trq_volume_mt"],
+                    terms["in_quota_tariff_percent"], terms["out_quota_tariff_percent"])
+        return (terms.get("mfn_avg_tariff_percent", 0.0), terms.get("specific_tariff_usd_mt", 0), 0, 0.0, 0.0)
+
+    def analyze_market_access_batch(self, shipments: dict, trq_fill: str = 'independent'):
+        """
+        Batch version of analyze_market_access over a columnar table of shipments.
+
+        Args:
+            shipments (dict): Equal-length columns 'commodity', 'exporting_country', 'importing_country',
+                              'fob_price_usd_mt', 'volume_mt'; optional 'product_attributes',
+                              'trade_agreement_context', 'product_origin_details', 'hs_code' and 'year'.
+            trq_fill (str): 'independent' (each shipment sees the full quota, as get_tariff_impact does)
+                            or 'sequential' (quota drawn down first-come-first-served in row order).
+
+        Tariff terms are resolved once per (commodity, importer) lane, or per store lane when a tariff store
+        is attached; duties are computed column-wise. SPS/TBT checks run only for importers that have rules,
+        RoO only for rows with an agreement context and origin details, and identical attribute objects
+        are checked once.
+
+        Returns:
+            MarketAccessBatchResult: tariff cost, effective rate, landed cost per tonne and status flags per row.
+        """
+        required = ('commodity', 'exporting_country', 'importing_country', 'fob_price_usd_mt', 'volume_mt')
+        missing = [c for c in required if c not in shipments]
+        if missing:
+            return {"error": f"Missing shipment columns: {missing}"}
+        n = len(shipments['volume_mt'])
+        if any(len(shipments[c]) != n for c in required):
+            return {"error": "All shipment columns must have the same length."}
+        if trq_fill not in ('independent', 'sequential'):
+            return {"error": f"Unknown trq_fill '{trq_fill}'. Use 'independent' or 'sequential'."}
+        commodities, exporters, importers = shipments['commodity'], shipments['exporting_country'], shipments['importing_country']
+        fob, volumes = shipments['fob_price_usd_mt'], shipments['volume_mt']
+        status = array('b', bytes(n))
+
+        # Tariffs: per-lane terms, then column arithmetic
+        ad_valorem = array('d', bytes(8 * n))
+        specific = array('d', bytes(8 * n))
+        trq_rows, lane_terms, lane_of_row = [], {}, []
+        for i, lane in enumerate(zip(commodities, importers)):
+            terms = lane_terms.get(lane, False)
+            if terms is False:
+                terms = lane_terms[lane] = self._lane_tariff_terms(*lane)
+            lane_of_row.append(lane)
+            if terms is None:
+                status[i] = self.STATUS_NO_TARIFF_DATA
+                continue
+            ad_valorem[i] = terms[0]
+            specific[i] = terms[1]
+            if terms[2]:
+                trq_rows.append(i)
+        value = array('d', map(operator.mul, fob, volumes))
+        tariff = array('d', map(operator.add, map(operator.mul, value, map(operator.truediv, ad_valorem, repeat(100.0))),
+                                map(operator.mul, specific, volumes)))
+        remaining = {}
+        for i in trq_rows:
+            lane = lane_of_row[i]
+            _, _, quota_total, in_pct, out_pct = lane_terms[lane]
+            quota = remaining.get(lane, quota_total) if trq_fill == 'sequential' else quota_total
+            in_quota = min(volumes[i], max(quota, 0))
+            if trq_fill == 'sequential':
+                remaining[lane] = quota - in_quota
+            tariff[i] += fob[i] * (in_quota * in_pct + (volumes[i] - in_quota) * out_pct) / 100
+
+        store_effective = {}
+        if self.tariff_store is not None:
+            hs_column = shipments.get('hs_code') or [self.commodity_hs_codes.get(str(c).lower()) for c in commodities]
+            years = shipments.get('year') or [2024] * n
+            store_rows = [i for i, hs in enumerate(hs_column) if hs]
+            if store_rows:
+                pick = lambda col: [col[i] for i in store_rows]
+                from_store = self.tariff_store.bulk_landed_cost(pick(importers), pick(hs_column), pick(exporters), pick(years),
+                                                                pick(fob), pick(volumes), trq_fill)
+                for j, i in enumerate(store_rows):
+                    if from_store['status'][j] == TariffScheduleStore.STATUS_OK:
+                        tariff[i] = from_store['tariff_cost_usd'][j]
+                        store_effective[i] = from_store['effective_tariff_rate_percent'][j]
+                        status[i] &= ~self.STATUS_NO_TARIFF_DATA
+
+        # Zero-value shipments report the ad valorem rate, as get_tariff_impact does
+        effective = array('d', (t / v * 100 if v else a for t, v, a in zip(tariff, value, ad_valorem)))
+        for i, rate in store_effective.items():
+            effective[i] = rate
+        landed_per_t = array('d', (f + t / q if q > 0 else 0.0 for f, t, q in zip(fob, tariff, volumes)))
+        for i, rate in enumerate(effective):
+            if rate > 20:
+                status[i] |= self.STATUS_HIGH_TARIFF
+
+        # Compliance: only where rules exist
+        attributes = shipments.get('product_attributes')
+        sps_memo, tbt_memo = {}, {}
+        for i, imp in enumerate(importers):
+            attrs = attributes[i] if attributes is not None and attributes[i] is not None else {}
+            if imp in self.sps_measures:
+                key = (imp, id(attrs))
+                if key not in sps_memo:
+                    sps_memo[key] = self.check_sps_compliance(commodities[i], exporters[i], imp, attrs)["overall_compliant"]
+                if not sps_memo[key]:
+                    status[i] |= self.STATUS_SPS_ISSUE
+            if imp in self.tbt_measures:
+                key = (imp, id(attrs))
+                if key not in tbt_memo:
+                    tbt_memo[key] = self.check_tbt_compliance(commodities[i], imp, attrs)["overall_compliant"]
+                if not tbt_memo[key]:
+                    status[i] |= self.STATUS_TBT_ISSUE
+        contexts, origins = shipments.get('trade_agreement_context'), shipments.get('product_origin_details')
+        if contexts is not None and origins is not None:
+            for i, (context, origin) in enumerate(zip(contexts, origins)):
+                if context and origin and context in self.rules_of_origin:
+                    if self.check_rules_of_origin(commodities[i], context, origin).get("compliant") == False:
+                        status[i] |= self.STATUS_ROO_ISSUE
+
+        return MarketAccessBatchResult(self, shipments, tariff, effective, landed_per_t, status)
+
+class TRQFillSimulator:
+    """
+    Replays a time-ordered stream of shipments against tariff-rate quota balances.
+
+    Quotas are tracked per (commodity, importer, quota year) and fill across all shippers, unlike
+    get_tariff_impact which gives every shipment the whole quota. Allocation is either first-come-first-served
+    or licence-based: each licence holder draws on its own allocation, any unlicensed remainder of the quota
+    forms a common pool, and on an optional reallocation date unused licence balances move into that pool.
+    Shipments and reallocation events share one heap-ordered event queue.
+    """
+    def __init__(self, market_access_analyzer: MarketAccessAnalysis):
+        self.market_access_analyzer = market_access_analyzer
+
+    @staticmethod
+    def _as_date(value):
+        return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+    def simulate(self, shipments: list, allocation: str = 'fcfs', licences: dict = None, reallocation_date: str = None, quotas: dict = None):
+        """
+        Args:
+            shipments (list): Dicts with 'date' (date or ISO string), 'commodity', 'importing_country', 'volume_mt',
+                              'fob_price_usd_mt', optional 'id' and, for licence allocation, 'licence_holder'.
+            allocation (str): 'fcfs' or 'licence'.
+            licences (dict, optional): {(commodity, importer): {holder: licensed_mt}} per quota year.
+            reallocation_date (str, optional): 'MM-DD' on which unused licence volume returns to the common pool
+                                               ('02-29' falls on 28 February in non-leap years).
+            quotas (dict, optional): {(commodity, importer): {'trq_volume_mt', 'in_quota_tariff_percent',
+                                     'out_quota_tariff_percent'}}; defaults to the TRQ lines of tariff_data.
+
+        Returns:
+            dict: Per shipment (input order) in/out-of-quota tonnes, tariff cost and effective rate; per quota
+                  year the filled volume, fill rate and the date the quota was exhausted (None if it never was).
+        """
+        if allocation not in ('fcfs', 'licence'):
+            return {"error": f"Unknown allocation '{allocation}'. Use 'fcfs' or 'licence'."}
+        licences = licences or {}
+        analyzer = self.market_access_analyzer
+        if quotas is None:
+            quotas = {}
+            for commodity, by_importer in analyzer.tariff_data.items():
+                for importer, terms in by_importer.items():
+                    if "trq_volume_mt" in terms:
+                        quotas[(commodity, importer)] = terms
+        for lane, held in licences.items():
+            if lane not in quotas:
+                continue
+            if any(mt < 0 for mt in held.values()):
+                return {"error": f"Licences for {lane[0]}->{lane[1]} must not be negative."}
+            if sum(held.values()) > quotas[lane]['trq_volume_mt'] + 1e-9:
+                return {"error": f"Licences for {lane[0]}->{lane[1]} total {sum(held.values())} mt, "
+                                 f"above the {quotas[lane]['trq_volume_mt']} mt quota."}
+        if allocation == 'licence' and reallocation_date:
+            try:
+                reallocation_month, reallocation_day = date.fromisoformat(f"2000-{reallocation_date}").timetuple()[1:3]
+            except ValueError:
+                return {"error": f"Invalid reallocation_date '{reallocation_date}'; use 'MM-DD'."}
+
+        events = []
+        for seq, shipment in enumerate(shipments):
+            try:
+                day = self._as_date(shipment['date'])
+            except (KeyError, ValueError):
+                return {"error": f"Shipment {shipment.get('id', seq)} has a missing or invalid date."}
+            events.append((day.toordinal(), 1, seq))
+        if allocation == 'licence' and reallocation_date:
+            years = {date.fromordinal(e[0]).year for e in events}
+            for year in years:
+                # Priority 0: reallocation happens before same-day shipments
+                leap_day_clamp = reallocation_month == 2 and reallocation_day == 29 and not calendar.isleap(year)
+                day = date(year, reallocation_month, 28 if leap_day_clamp else reallocation_day)
+                events.append((day.toordinal(), 0, -year))
+        heapq.heapify(events)
+
+        balances = {}  # (commodity, importer, year) -> {'pool': mt, 'licences': {holder: mt}, ...}
+        results = [None] * len(shipments)
+        lane_terms = {}
+
+        def balance_for(lane, year):
+            key = lane + (year,)
+            state = balances.get(key)
+            if state is None:
+                quota = quotas[lane]['trq_volume_mt']
+                held = dict(licences.get(lane, {})) if allocation == 'licence' else {}
+                state = balances[key] = {'quota': quota, 'pool': max(quota - sum(held.values()), 0.0),
+                                         'licences': held, 'filled': 0.0, 'fill_date': None}
+            return state
+
+        while events:
+            ordinal, priority, seq = heapq.heappop(events)
+            if priority == 0:
+                year = -seq
+                for key, state in balances.items():
+                    if key[2] == year:
+                        state['pool'] += sum(state['licences'].values())
+                        state['licences'] = {h: 0.0 for h in state['licences']}
+                # Quota years not yet opened by a shipment get their unused licences pooled when first touched
+                for lane in licences:
+                    if lane in quotas and lane + (year,) not in balances:
+                        state = balance_for(lane, year)
+                        state['pool'] += sum(state['licences'].values())
+                        state['licences'] = {h: 0.0 for h in state['licences']}
+                continue
+
+            shipment = shipments[seq]
+            lane = (shipment['commodity'], shipment['importing_country'])
+            volume, fob = shipment['volume_mt'], shipment['fob_price_usd_mt']
+            value = volume * fob
+            in_quota = 0.0
+            if lane in quotas:
+                terms = quotas[lane]
+                state = balance_for(lane, date.fromordinal(ordinal).year)
+                holder = shipment.get('licence_holder')
+                if holder in state['licences']:
+                    take = min(volume, state['licences'][holder])
+                    state['licences'][holder] -= take
+                    in_quota += take
+                take = min(volume - in_quota, state['pool'])
+                state['pool'] -= take
+                in_quota += take
+                state['filled'] += in_quota
+                if state['fill_date'] is None and state['filled'] >= state['quota'] - 1e-9:
+                    state['fill_date'] = date.fromordinal(ordinal).isoformat()
+                ad_valorem = (in_quota * terms['in_quota_tariff_percent'] + (volume - in_quota) * terms['out_quota_tariff_percent']) / 100
+                tariff = fob * ad_valorem + terms.get('specific_tariff_usd_mt', 0) * volume
+                status = 'in_quota' if in_quota >= volume else ('partial' if in_quota > 0 else 'out_of_quota')
+            else:
+                if lane not in lane_terms:
+                    lane_terms[lane] = analyzer._lane_tariff_terms(*lane)
+                terms = lane_terms[lane]
+                tariff = value * terms[0] / 100 + terms[1] * volume if terms else 0.0
+                status = 'no_trq'
+            results[seq] = {
+                'id': shipment.get('id', seq), 'date': date.fromordinal(ordinal).isoformat(),
+                'commodity': lane[0], 'importing_country': lane[1], 'volume_mt': volume,
+                'in_quota_mt': round(in_quota, 3), 'out_quota_mt': round(volume - in_quota, 3),
+                'tariff_cost_usd': round(tariff, 2),
+                'effective_tariff_rate_percent': round(tariff / value * 100, 2) if value else 0.0,
+                'quota_status': status
+            }
+
+        quota_report = {}
+        for (commodity, importer, year), state in sorted(balances.items()):
+            quota_report[f"{commodity}->{importer} {year}"] = {
+                'quota_mt': state['quota'], 'filled_mt': round(state['filled'], 3),
+                'fill_rate_percent': round(state['filled'] / state['quota'] * 100, 2) if state['quota'] else 0.0,
+                'fill_date': state['fill_date'],
+                'unused_licence_mt': round(sum(state['licences'].values()), 3)
+            }
+        return {'allocation': allocation, 'shipments': results, 'quotas': quota_report}
+
+class SpatialPriceEquilibriumModel:
+    """
+    Multi-region spatial price equilibrium for a single commodity (Takayama-Judge).
+
+    Each region has linear supply and demand calibrated from base production, consumption, price and
+    elasticities. Shipping from i to j costs transport plus the importer's tariff, with ad valorem duties
+    converted to a specific equivalent at the exporter's base price and TRQ lanes charged the out-of-quota
+    rate (the marginal rate once the quota binds).
+
+    The solver is an active-set method over the routes that carry trade. Those routes form a forest; within
+    each tree prices differ by the route costs and the tree's price level clears its pooled excess supply in
+    closed form. Routes whose implied flow turns negative are dropped, and the route with the largest arbitrage
+    gap (importer price above exporter price plus route cost) is added, until every route is priced out and
+    every flow is non-negative. A previous solution's active routes are a warm start, so re-clearing after a
+    shock usually takes a few pivots.
+    """
+    def __init__(self, market_access_analyzer: MarketAccessAnalysis):
+        self.market_access_analyzer = market_access_analyzer
+
+    def build(self, commodity: str, regions: dict, transport_costs: dict = None, default_transport_cost_usd_mt: float = 50.0,
+              blocked_routes=(), tariff_overrides: dict = None, default_supply_elasticity: float = 0.5, default_demand_elasticity: float = -0.4):
+        """
+        Args:
+            commodity (str): Commodity used to look up importer tariffs.
+            regions (dict): {region: {'production_mt', 'consumption_mt', 'price_usd_mt',
+                            optional 'supply_elasticity', 'demand_elasticity'}}.
+            transport_costs (dict, optional): {(exporter, importer): USD/t}; other routes use the default.
+            blocked_routes (iterable): (exporter, importer) pairs that cannot trade (bans, SPS closures).
+            tariff_overrides (dict, optional): {importer: ad valorem %} replacing tariff_data for that importer.
+
+        Returns:
+            dict: Calibrated model consumed by solve().
+        """
+        names = list(regions)
+        if not names:
+            return {"error": "No regions supplied."}
+        transport_costs = transport_costs or {}
+        tariff_overrides = tariff_overrides or {}
+        blocked = set(blocked_routes)
+        # Quantities: production = a + b * price, consumption = c - m * price
+        a, b, c, m = array('d'), array('d'), array('d'), array('d')
+        for name in names:
+            region = regions[name]
+            price = region['price_usd_mt']
+            if price <= 0:
+                return {"error": f"Region {name} needs a positive base price."}
+            e_s = max(region.get('supply_elasticity', default_supply_elasticity), 1e-6)
+            e_d = min(region.get('demand_elasticity', default_demand_elasticity), -1e-6)
+            b.append(e_s * max(region['production_mt'], 1e-6) / price)
+            a.append(region['production_mt'] - b[-1] * price)
+            m.append(-e_d * max(region['consumption_mt'], 1e-6) / price)
+            c.append(region['consumption_mt'] + m[-1] * price)
+
+        importer_terms = []
+        for name in names:
+            if name in tariff_overrides:
+                importer_terms.append((tariff_overrides[name], 0.0))
+                continue
+            terms = self.market_access_analyzer._lane_tariff_terms(commodity, name)
+            if terms is None:
+                importer_terms.append((0.0, 0.0))
+            elif terms[2]:
+                importer_terms.append((terms[4], terms[1]))
+            else:
+                importer_terms.append((terms[0], terms[1]))
+
+        inf = float('inf')
+        arc_cost = []
+        for i, exporter in enumerate(names):
+            base_price = regions[exporter]['price_usd_mt']
+            row = array('d', repeat(0.0, len(names)))
+            for j, importer in enumerate(names):
+                if i == j:
+                    continue
+                if (exporter, importer) in blocked:
+                    row[j] = inf
+                    continue
+                ad_valorem, specific = importer_terms[j]
+                row[j] = (transport_costs.get((exporter, importer), default_transport_cost_usd_mt)
+                          + base_price * ad_valorem / 100 + specific)
+            arc_cost.append(row)
+        return {
+            'commodity': commodity, 'regions': names,
+            'supply_intercept': a, 'supply_slope': b, 'demand_intercept': c, 'demand_slope': m,
+            'arc_cost': arc_cost
+        }
+
+    @staticmethod
+    def _price_forest(routes, arc_cost, excess_intercept, excess_slope):
+        """Prices, route flows and tree structure implied by a forest of tight routes."""
+        n = len(excess_intercept)
+        adjacency = [[] for _ in range(n)]
+        for route in routes:
+            i, j = route
+            adjacency[i].append((j, arc_cost[i][j], route))
+            adjacency[j].append((i, -arc_cost[i][j], route))
+        prices = [0.0] * n
+        tree = [-1] * n
+        parent = [-1] * n
+        parent_route = [None] * n
+        depth = [0] * n
+        flows = {}
+        for root in range(n):
+            if tree[root] >= 0:
+                continue
+            tree[root] = root
+            order = [root]
+            for u in order:
+                for v, offset, route in adjacency[u]:
+                    if tree[v] < 0:
+                        tree[v] = root
+                        prices[v] = prices[u] + offset
+                        parent[v], parent_route[v], depth[v] = u, route, depth[u] + 1
+                        order.append(v)
+            level = -(sum(excess_intercept[k] + excess_slope[k] * prices[k] for k in order)
+                      / sum(excess_slope[k] for k in order))
+            subtree_excess = {}
+            for k in order:
+                prices[k] += level
+                subtree_excess[k] = excess_intercept[k] + excess_slope[k] * prices[k]
+            for k in reversed(order[1:]):
+                surplus = subtree_excess[k]
+                route = parent_route[k]
+                flows[route] = surplus if route[0] == k else -surplus
+                subtree_excess[parent[k]] += surplus
+        return prices, flows, tree, parent, parent_route, depth
+
+    def solve(self, model: dict, warm_start: dict = None, price_tolerance: float = 1e-6, max_pivots: int = None):
+        """
+        Clears all regional markets at once.
+
+        Args:
+            model (dict): Output of build().
+            warm_start (dict, optional): A previous solve() result over the same regions.
+            price_tolerance (float): Largest arbitrage gap (USD/t) accepted at equilibrium.
+
+        Returns:
+            dict: Regional price, production, consumption and net exports; inter-regional flows; the active
+                  routes (for warm starts); pivots used and a convergence flag.
+        """
+        if "error" in model:
+            return model
+        names = model['regions']
+        n = len(names)
+        index = {name: k for k, name in enumerate(names)}
+        a, b = model['supply_intercept'], model['supply_slope']
+        c, m = model['demand_intercept'], model['demand_slope']
+        excess_intercept = list(map(operator.sub, a, c))
+        excess_slope = list(map(operator.add, b, m))
+        arc_cost = model['arc_cost']
+        inf = float('inf')
+        flow_tolerance = 1e-9 * max(sum(map(abs, c)), 1.0)
+
+        routes = set()
+        if warm_start:
+            component = list(range(n))
+
+            def find(k):
+                while component[k] != k:
+                    component[k] = component[component[k]]
+                    k = component[k]
+                return k
+            for exporter, importer in warm_start.get('active_routes', []):
+                i, j = index.get(exporter), index.get(importer)
+                if i is None or j is None or arc_cost[i][j] == inf:
+                    continue
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    component[root_i] = root_j
+                    routes.add((i, j))
+
+        max_pivots = max_pivots or 20 * n + 100
+        pivots, converged = 0, False
+        while pivots < max_pivots:
+            pivots += 1
+            prices, flows, tree, parent, parent_route, depth = self._price_forest(routes, arc_cost, excess_intercept, excess_slope)
+            if flows:
+                route, flow = min(flows.items(), key=lambda item: item[1])
+                if flow < -flow_tolerance:
+                    routes.discard(route)
+                    continue
+            # Largest arbitrage gap p_j - p_i - cost_ij over all routes, one row at a time
+            gap, entering = price_tolerance, None
+            for i in range(n):
+                row_gaps = list(map(operator.sub, prices, arc_cost[i]))
+                best = max(row_gaps)
+                if best - prices[i] > gap:
+                    gap, entering = best - prices[i], (i, row_gaps.index(best))
+            if entering is None:
+                converged = True
+                break
+            i, j = entering
+            if tree[i] == tree[j]:
+                # Entering route closes a cycle: drop the reverse-oriented tree route with the least flow
+                leaving, least = None, inf
+                u, v = j, i
+                while u != v:
+                    if depth[u] >= depth[v]:
+                        route, step_from, u = parent_route[u], u, parent[u]
+                        backward = route[0] != step_from
+                    else:
+                        route, step_to, v = parent_route[v], v, parent[v]
+                        backward = route[1] != step_to
+                    if backward and flows[route] < least:
+                        leaving, least = route, flows[route]
+                if leaving is None:
+                    break
+                routes.discard(leaving)
+            routes.add(entering)
+
+        production = list(map(operator.add, a, map(operator.mul, b, prices)))
+        consumption = list(map(operator.sub, c, map(operator.mul, m, prices)))
+        results = {}
+        for k, name in enumerate(names):
+            results[name] = {
+                'price_usd_mt': round(prices[k], 2),
+                'production_mt': round(production[k], 1),
+                'consumption_mt': round(consumption[k], 1),
+                'net_exports_mt': round(production[k] - consumption[k], 1)
+            }
+        trade_flows = {(names[i], names[j]): round(flow, 1) for (i, j), flow in flows.items() if flow > flow_tolerance}
+        return {
+            'commodity': model['commodity'], 'regions': results, 'trade_flows': trade_flows,
+            'active_routes': [(names[i], names[j]) for i, j in routes], 'pivots': pivots, 'converged': converged
+        }
+
+
 class TradeFlowVolatilityModel:
     """
     Models trade flow volatility based on various shock events.
@@ -532,6 +1907,8 @@ class TradeFlowVolatilityModel:
             "corn": {"default_export": -0.6, "default_import": 0.5},
             "soybeans": {"default_export": -0.7, "default_import": 0.6}
         }
+        self.equilibrium_model = SpatialPriceEquilibriumModel(market_access_analyzer)
+        self._equilibrium_cache = {}  # (commodity, regions) -> last baseline solution, reused as warm start
 
     def calculate_baseline_flow(self, commodity: str, exporting_country: str, importing_country: str, base_volume_mt: float, base_price_usd_mt: float):
         """
@@ -623,6 +2000,339 @@ class TradeFlowVolatilityModel:
         }
 
 
+    def simulate_shock_equilibrium(self, commodity: str, regions: dict, shock_event: dict, transport_costs: dict = None,
+                                   default_transport_cost_usd_mt: float = 50.0):
+        """
+        Re-clears every regional market after a shock instead of adjusting one bilateral flow.
+
+        Args:
+            commodity (str): Commodity being traded.
+            regions (dict): Region calibration data, see SpatialPriceEquilibriumModel.build.
+            shock_event (dict): Same shapes as simulate_trade_shock_impact ('tariff_increase', 'export_ban',
+                                'sps_issue'), plus 'production_shock' with details {'production_change_percent'}
+                                for the shocked 'exporting_country'.
+            transport_costs (dict, optional): {(exporter, importer): USD/t}.
+
+        Returns:
+            dict: Baseline and post-shock equilibria, price and net-export changes per region, and the
+                  bilateral flows that changed.
+        """
+        elasticities = self.shock_elasticities.get(commodity, {})
+        defaults = {'default_transport_cost_usd_mt': default_transport_cost_usd_mt,
+                    'default_supply_elasticity': abs(elasticities.get("default_export", -0.5)),
+                    'default_demand_elasticity': -abs(elasticities.get("default_import", 0.4))}
+        cache_key = (commodity, tuple(regions))
+        baseline = self.equilibrium_model.solve(
+            self.equilibrium_model.build(commodity, regions, transport_costs, **defaults),
+            warm_start=self._equilibrium_cache.get(cache_key))
+        if "error" in baseline:
+            return baseline
+        self._equilibrium_cache[cache_key] = baseline
+
+        shock_type = shock_event.get("type")
+        shocked_regions, blocked, overrides = regions, [], {}
+        if shock_type == "tariff_increase":
+            overrides[shock_event["importing_country"]] = shock_event["details"]["new_tariff_percent"]
+        elif shock_type == "export_ban":
+            blocked = [(shock_event["exporting_country"], importer) for importer in regions if importer != shock_event["exporting_country"]]
+        elif shock_type == "sps_issue":
+            blocked = [(shock_event["exporting_country"], shock_event["importing_country"])]
+        elif shock_type == "production_shock":
+            shocked_regions = dict(regions)
+            origin = dict(regions[shock_event["exporting_country"]])
+            origin['production_mt'] *= 1 + shock_event["details"]["production_change_percent"] / 100
+            shocked_regions[shock_event["exporting_country"]] = origin
+        else:
+            return {"error": f"Unsupported shock type '{shock_type}' for equilibrium simulation."}
+        shocked = self.equilibrium_model.solve(
+            self.equilibrium_model.build(commodity, shocked_regions, transport_costs, blocked_routes=blocked,
+                                         tariff_overrides=overrides, **defaults),
+            warm_start=baseline)
+
+        region_changes = {}
+        for name, before in baseline['regions'].items():
+            after = shocked['regions'][name]
+            region_changes[name] = {
+                'price_change_percent': round((after['price_usd_mt'] - before['price_usd_mt']) / before['price_usd_mt'] * 100, 2) if before['price_usd_mt'] else 0.0,
+                'net_exports_change_mt': round(after['net_exports_mt'] - before['net_exports_mt'], 1)
+            }
+        flow_changes = {}
+        for route in set(baseline['trade_flows']) | set(shocked['trade_flows']):
+            before, after = baseline['trade_flows'].get(route, 0.0), shocked['trade_flows'].get(route, 0.0)
+            if abs(after - before) > 0.5:
+                flow_changes[route] = {'before_mt': before, 'after_mt': after}
+        return {
+            'shock_event': shock_event, 'baseline': baseline, 'shocked': shocked,
+            'region_changes': region_changes, 'flow_changes': flow_changes
+        }
+
+
+class TradeFlowTensor:
+    """
+    Commodity x origin x destination trade flow tensor for scenario runs.
+
+    Volumes, FOB prices and tariff terms live in flat arrays indexed ((commodity * origins) + origin) *
+    destinations + destination. Events select cells through masks (an origin row is a contiguous range, a
+    destination column a strided range, agreement coverage an explicit pair list) and only the selected cells
+    have their tariff and landed cost recomputed, so an event costs in proportion to the pairs it touches.
+    Duties follow get_tariff_impact: each flow sees the whole TRQ and specific duties are added per tonne.
+    """
+    term_columns = ('ad_valorem_percent', 'specific_usd_mt', 'trq_volume_mt', 'in_quota_percent', 'out_quota_percent')
+    state_columns = ('volume_mt', 'fob_price_usd_mt', 'tariff_cost_usd', 'landed_cost_usd_mt') + term_columns
+
+    def __init__(self, market_access_analyzer: MarketAccessAnalysis, agreement_analyzer: TradeAgreementImpact = None,
+                 import_demand_elasticity: float = -0.4):
+        self.market_access_analyzer = market_access_analyzer
+        self.agreement_analyzer = agreement_analyzer
+        self.import_demand_elasticity = import_demand_elasticity
+        self.commodities, self.origins, self.destinations = [], [], []
+        self._baseline = {}
+        self._touched = set()
+
+    def load(self, flows: dict):
+        """
+        Args:
+            flows (dict): Equal-length columns 'commodity', 'exporting_country', 'importing_country',
+                          'volume_mt' and 'fob_price_usd_mt'.
+
+        Returns:
+            dict: Tensor shape and baseline totals, or an error if a column is missing or the columns
+                  have different lengths.
+        """
+        required = ('commodity', 'exporting_country', 'importing_country', 'volume_mt', 'fob_price_usd_mt')
+        missing = [c for c in required if c not in flows]
+        if missing:
+            return {"error": f"Missing flow columns: {missing}"}
+        lengths = {c: len(flows[c]) for c in required}
+        if len(set(lengths.values())) > 1:
+            return {"error": f"Flow columns must have the same length, got {lengths}."}
+        self.commodities = sorted(set(flows['commodity']))
+        self.origins = sorted(set(flows['exporting_country']))
+        self.destinations = sorted(set(flows['importing_country']))
+        self._c = {name: k for k, name in enumerate(self.commodities)}
+        self._o = {name: k for k, name in enumerate(self.origins)}
+        self._d = {name: k for k, name in enumerate(self.destinations)}
+        n_o, n_d = len(self.origins), len(self.destinations)
+        size = len(self.commodities) * n_o * n_d
+        for column in self.state_columns:
+            setattr(self, column, array('d', repeat(0.0, size)))
+
+        # Lane terms broadcast down each (commodity, destination) column with one strided slice assignment
+        for commodity, c in self._c.items():
+            for importer, d in self._d.items():
+                terms = self.market_access_analyzer._lane_tariff_terms(commodity, importer) or (0.0, 0.0, 0, 0.0, 0.0)
+                column = slice(c * n_o * n_d + d, (c + 1) * n_o * n_d, n_d)
+                for name, value in zip(self.term_columns, terms):
+                    getattr(self, name)[column] = array('d', repeat(value, n_o))
+
+        volume, fob = self.volume_mt, self.fob_price_usd_mt
+        for commodity, exporter, importer, mt, price in zip(*(flows[c] for c in required)):
+            cell = (self._c[commodity] * n_o + self._o[exporter]) * n_d + self._d[importer]
+            volume[cell] += mt
+            fob[cell] = price
+        self._recompute(range(size))
+        self._baseline = {column: array('d', getattr(self, column)) for column in self.state_columns}
+        self._touched = set()
+        return {"shape": (len(self.commodities), n_o, n_d),
+                "total_volume_mt": round(sum(volume), 1), "total_tariff_cost_usd": round(sum(self.tariff_cost_usd), 2)}
+
+    def _recompute(self, cells):
+        volume, fob = self.volume_mt, self.fob_price_usd_mt
+        ad_valorem, specific = self.ad_valorem_percent, self.specific_usd_mt
+        trq, in_rate, out_rate = self.trq_volume_mt, self.in_quota_percent, self.out_quota_percent
+        tariff, landed = self.tariff_cost_usd, self.landed_cost_usd_mt
+        for cell in cells:
+            mt, price = volume[cell], fob[cell]
+            if trq[cell]:
+                in_quota = min(mt, trq[cell])
+                duty = price * (in_quota * in_rate[cell] + (mt - in_quota) * out_rate[cell]) / 100
+                # Per-tonne landed cost of the marginal tonne for an empty cell
+                rate = duty / (price * mt) * 100 if mt and price else in_rate[cell]
+            else:
+                duty = price * mt * ad_valorem[cell] / 100
+                rate = ad_valorem[cell]
+            tariff[cell] = duty + specific[cell] * mt
+            landed[cell] = price * (1 + rate / 100) + specific[cell]
+
+    def _select(self, commodity=None, origin=None, destination=None):
+        """Cells matching the given axis labels (None = whole axis) as a list of ranges."""
+        n_o, n_d = len(self.origins), len(self.destinations)
+        try:
+            cs = [self._c[commodity]] if commodity is not None else range(len(self.commodities))
+            o = self._o[origin] if origin is not None else None
+            d = self._d[destination] if destination is not None else None
+        except KeyError:
+            return []
+        masks = []
+        for c in cs:
+            base = c * n_o * n_d
+            if o is not None and d is not None:
+                masks.append(range(base + o * n_d + d, base + o * n_d + d + 1))
+            elif o is not None:
+                masks.append(range(base + o * n_d, base + (o + 1) * n_d))
+            elif d is not None:
+                masks.append(range(base + d, base + n_o * n_d, n_d))
+            else:
+                masks.append(range(base, base + n_o * n_d))
+        return masks
+
+    def _agreement_cells(self, event):
+        countries = event.get("countries")
+        if countries is not None:
+            members = set(countries)
+            pairs = [(o, d) for exporter, o in self._o.items() if exporter in members
+                     for importer, d in self._d.items() if importer in members and importer != exporter]
+        else:
+            if self.agreement_analyzer is None:
+                return None
+            labels = list(dict.fromkeys(self.origins + self.destinations))
+            coverage = self.agreement_analyzer.coverage_matrix(labels, event.get("on_date"))
+            if event["agreement_name"] not in coverage["agreements"]:
+                return None
+            bit = 1 << coverage["agreements"].index(event["agreement_name"])
+            position = {label: k for k, label in enumerate(labels)}
+            n = len(labels)
+            pairs = [(o, d) for exporter, o in self._o.items() for importer, d in self._d.items()
+                     if importer != exporter and coverage["coverage"][position[exporter] * n + position[importer]] & bit]
+        n_o, n_d = len(self.origins), len(self.destinations)
+        cs = [self._c[event["commodity"]]] if event.get("commodity") in self._c else range(len(self.commodities))
+        return [[(c * n_o + o) * n_d + d for o, d in pairs] for c in cs]
+
+    @staticmethod
+    def _normalise_event(event):
+        """Accepts simulate_scenario 'trade_shock' events as well as native tensor events."""
+        if event.get("type") == "trade_shock":
+            shock = event["shock_event"]
+            mapped = {"tariff_increase": "tariff_change", "export_ban": "export_ban", "sps_issue": "sps_failure"}
+            native = dict(shock, type=mapped.get(shock["type"], shock["type"]))
+            native.update(shock.get("details", {}))
+            return native
+        if event.get("type") == "trade_agreement_change":
+            return dict(event, type="agreement_change")
+        return event
+
+    def apply_event(self, event: dict):
+        """
+        Applies one event as a masked update and recomputes only the affected cells.
+
+        Event types:
+            'tariff_change': commodity, importing_country, optional exporting_country, and
+                             new_tariff_percent (replaces the regime) or additional_tariff_percent.
+            'export_ban': exporting_country, optional commodity and importing_country.
+            'sps_failure': commodity, exporting_country, importing_country, optional volume_reduction_percent (90).
+            'agreement_change': agreement_name, change 'enter' or 'exit', optional preferential_tariff_percent (0),
+                                commodity, countries (members, default from the agreement index) and on_date.
+                                'exit' puts the covered cells on the importer's MFN terms.
+
+        Returns:
+            dict: Event type and number of cells updated, or an error.
+        """
+        event = self._normalise_event(event)
+        kind = event.get("type")
+        price_driven = True
+        if kind == "tariff_change":
+            masks = self._select(event.get("commodity"), event.get("exporting_country"), event.get("importing_country"))
+        elif kind in ("export_ban", "sps_failure"):
+            masks = self._select(event.get("commodity"), event.get("exporting_country"), event.get("importing_country"))
+            price_driven = False
+        elif kind == "agreement_change":
+            masks = self._agreement_cells(event)
+            if masks is None:
+                return {"error": f"No membership data for agreement '{event.get('agreement_name')}'; pass 'countries'."}
+        else:
+            return {"error": f"Unsupported event type '{kind}'."}
+
+        volume, landed = self.volume_mt, self.landed_cost_usd_mt
+        n_od, n_d = len(self.origins) * len(self.destinations), len(self.destinations)
+        mfn_terms = {}
+        updated = 0
+        for mask in masks:
+            previous_landed = [landed[cell] for cell in mask]
+            for cell in mask:
+                if kind == "tariff_change":
+                    if "new_tariff_percent" in event:
+                        self.ad_valorem_percent[cell] = event["new_tariff_percent"]
+                        self.trq_volume_mt[cell] = 0.0
+                    else:
+                        extra = event.get("additional_tariff_percent", 0.0)
+                        self.ad_valorem_percent[cell] += extra
+                        self.in_quota_percent[cell] += extra
+                        self.out_quota_percent[cell] += extra
+                elif kind == "export_ban":
+                    volume[cell] = 0.0
+                elif kind == "sps_failure":
+                    volume[cell] *= 1 - event.get("volume_reduction_percent", 90) / 100
+                elif event.get("change") == "exit":
+                    lane = (cell // n_od, cell % n_d)
+                    if lane not in mfn_terms:
+                        mfn_terms[lane] = self.market_access_analyzer._lane_tariff_terms(
+                            self.commodities[lane[0]], self.destinations[lane[1]]) or (0.0, 0.0, 0, 0.0, 0.0)
+                    for name, value in zip(self.term_columns, mfn_terms[lane]):
+                        getattr(self, name)[cell] = value
+                else:
+                    self.ad_valorem_percent[cell] = event.get("preferential_tariff_percent", 0.0)
+                    self.specific_usd_mt[cell] = self.trq_volume_mt[cell] = 0.0
+            self._recompute(mask)
+            if price_driven:
+                # Import demand responds to the change in landed cost
+                for cell, before in zip(mask, previous_landed):
+                    if before and landed[cell] != before:
+                        volume[cell] *= max(0.0, 1 + self.import_demand_elasticity * (landed[cell] / before - 1))
+                self._recompute(mask)
+            self._touched.update(mask)
+            updated += len(mask)
+        return {"type": kind, "cells_updated": updated}
+
+    def apply_events(self, events: list):
+        """Applies events in order and returns the diff against baseline."""
+        applied = [self.apply_event(event) for event in events]
+        diff = self.diff()
+        diff["events"] = applied
+        return diff
+
+    def diff(self, tolerance: float = 1e-6):
+        """
+        Cells that differ from baseline, visiting only cells touched by events.
+
+        Returns:
+            dict: Changed flows with before/after volume, landed cost and tariff cost, and totals by commodity.
+        """
+        n_o, n_d = len(self.origins), len(self.destinations)
+        base = self._baseline
+        changes, totals = [], {}
+        for cell in sorted(self._touched):
+            before_mt, after_mt = base['volume_mt'][cell], self.volume_mt[cell]
+            before_landed, after_landed = base['landed_cost_usd_mt'][cell], self.landed_cost_usd_mt[cell]
+            before_tariff, after_tariff = base['tariff_cost_usd'][cell], self.tariff_cost_usd[cell]
+            if (abs(after_mt - before_mt) <= tolerance and abs(after_landed - before_landed) <= tolerance
+                    and abs(after_tariff - before_tariff) <= tolerance):
+                continue
+            c, rest = divmod(cell, n_o * n_d)
+            o, d = divmod(rest, n_d)
+            commodity = self.commodities[c]
+            changes.append({
+                "commodity": commodity, "exporting_country": self.origins[o], "importing_country": self.destinations[d],
+                "volume_mt": (round(before_mt, 1), round(after_mt, 1)),
+                "landed_cost_usd_mt": (round(before_landed, 2), round(after_landed, 2)),
+                "tariff_cost_usd": (round(before_tariff, 2), round(after_tariff, 2))
+            })
+            total = totals.setdefault(commodity, {"volume_change_mt": 0.0, "tariff_cost_change_usd": 0.0})
+            total["volume_change_mt"] += after_mt - before_mt
+            total["tariff_cost_change_usd"] += after_tariff - before_tariff
+        for total in totals.values():
+            total["volume_change_mt"] = round(total["volume_change_mt"], 1)
+            total["tariff_cost_change_usd"] = round(total["tariff_cost_change_usd"], 2)
+        return {"cells_touched": len(self._touched), "changed_flows": changes, "totals_by_commodity": totals}
+
+    def reset(self):
+        """Restores the touched cells to baseline."""
+        for column in self.state_columns:
+            current, base = getattr(self, column), self._baseline[column]
+            for cell in self._touched:
+                current[cell] = base[cell]
+        self._touched = set()
+
+
 class TradeFlowReconfigurationMarketAccess:
     """
     Main class to simulate trade flow reconfigurations based on market access changes.
@@ -638,6 +2348,8 @@ class TradeFlowReconfigurationMarketAccess:
         self.standard_evolution = StandardEvolution()
         self.consumer_prefs = ConsumerPreferenceImpact()
         self.volatility_model = TradeFlowVolatilityModel(self.market_analyzer)
+        self.flow_tensor = TradeFlowTensor(self.market_analyzer, self.agreement_analyzer)
+        self.trq_simulator = TRQFillSimulator(self.market_analyzer)
 
 
     def simulate_scenario(self, scenario_details: dict):
@@ -656,6 +2368,9 @@ class TradeFlowReconfigurationMarketAccess:
                  {"commodity": "soybeans", "exporting_country": "US", "importing_country": "EU", "volume_mt": 5000000, "price_usd_mt": 460}
             ]
         }
+        An optional "flows" entry (columnar, see TradeFlowTensor.load) runs the trade shocks, and agreement
+        changes that carry a "change" of "enter"/"exit", over the full origin-destination tensor as well;
+        the diff against baseline is returned under "flow_tensor_diff".
         """
         results = {"scenario_name": scenario_details["name"], "event_impacts": [], "flow_analyses": []}
 
@@ -691,6 +2406,15 @@ class TradeFlowReconfigurationMarketAccess:
                 agreement_impact = self.agreement_analyzer.get_agreement_details(event["agreement_name"])
                 results["event_impacts"].append({"event_type": event["type"], "details": agreement_impact, "change": event["change_description"]})
 
+        if "flows" in scenario_details:
+            loaded = self.flow_tensor.load(scenario_details["flows"])
+            if "error" in loaded:
+                results["flow_tensor_diff"] = loaded
+            else:
+                tensor_events = [e for e in scenario_details.get("events", [])
+                                 if e["type"] == "trade_shock" or (e["type"] == "trade_agreement_change" and "change" in e)]
+                results["flow_tensor_diff"] = self.flow_tensor.apply_events(tensor_events)
+
         # Analyze alternative markets
         for alt_flow_data in scenario_details.get("alternative_markets_check", []):
             alt_flow_analysis = self.volatility_model.calculate_baseline_flow(
@@ -728,6 +2452,51 @@ if __name__ == '__main__':
             print(f"  {key}: {value}")
     print("\n")
 
+    # Example 1b: Indexed tariff schedule store (built here from the example tariff data)
+    print("--- Example 1b: Tariff Schedule Store ---")
+    market_analyzer = trade_flow_simulator.market_analyzer
+    with tempfile.TemporaryDirectory() as store_dir:
+        store_path = os.path.join(store_dir, "tariff_schedule.bin")
+        tariff_store = TariffScheduleStore.from_tariff_data(store_path, market_analyzer.tariff_data, market_analyzer.commodity_hs_codes, year=2023)
+        print(f"Tariff line for HS 100590 into China (2024): {tariff_store.lookup('China', '100590', 'US', 2024)}")
+        bulk_costs = tariff_store.bulk_landed_cost(
+            ["China", "China", "EU", "India"], ["100590", "100590", "100199", "120190"], ["US", "Brazil", "Canada", "US"],
+            [2024] * 4, [250, 240, 300, 420], [5000000, 4000000, 50000, 20000], trq_fill="sequential")
+        print(f"Bulk effective tariff rates (%): {[round(r, 2) for r in bulk_costs['effective_tariff_rate_percent']]}")
+        tariff_store.close()
+
+    # Example 1c: Batch market access over a columnar shipment table
+    shipment_table = {
+        "commodity": ["corn", "wheat", "soybeans", "wheat"],
+        "exporting_country": ["US", "Canada", "Brazil", "Australia"],
+        "importing_country": ["China", "EU", "India", "US"],
+        "fob_price_usd_mt": [250, 300, 420, 310],
+        "volume_mt": [1000000, 80000, 20000, 5000],
+        "product_attributes": [{}, {"pesticide_residues": {"pesticide_x": 0.02}}, {}, {"labeling": ["country_of_origin", "gmo_content"]}]
+    }
+    batch_access = market_analyzer.analyze_market_access_batch(shipment_table)
+    print(f"Batch landed cost per MT: {[round(c, 2) for c in batch_access.landed_cost_usd_mt]} | status codes: {list(batch_access.status)}")
+    print(f"Explanation for row 1: {batch_access.explain(1)['summary']}")
+
+    # Example 1d: Lab residue results checked against every market's MRLs at once
+    lab_results = {"lot_A": {"pesticide_x": 0.004}, "lot_B": {"pesticide_x": 0.03, "pesticide_y": 0.08}, "lot_C": {"pesticide_z": 0.02}}
+    residue_check = market_analyzer.check_sps_residues_batch(lab_results, markets=["EU", "Japan"], default_mrl_mg_kg=0.01)
+    print(f"Residue fail matrix (lots x markets {residue_check['markets']}): {list(residue_check['fail_matrix'])}")
+    print(f"Worst analytes: {residue_check['worst_analyte']}")
+
+    # Example 1e: A season of corn shipments filling China's TRQ, first-come-first-served vs licensed
+    corn_shipments = [{"id": f"cargo_{month}", "date": f"2024-{month:02d}-10", "commodity": "corn", "importing_country": "China",
+                       "volume_mt": 1000000, "fob_price_usd_mt": 250, "licence_holder": "COFCO" if month % 2 else "private"}
+                      for month in range(1, 11)]
+    fcfs_fill = trade_flow_simulator.trq_simulator.simulate(corn_shipments)
+    print(f"FCFS fill: {fcfs_fill['quotas']}")
+    licensed_fill = trade_flow_simulator.trq_simulator.simulate(
+        corn_shipments, allocation="licence", licences={("corn", "China"): {"COFCO": 4000000, "private": 2000000}},
+        reallocation_date="09-15")
+    for row in licensed_fill["shipments"][6:9]:
+        print(f"  {row['date']} {row['id']}: in-quota {row['in_quota_mt']:,.0f} t, effective tariff {row['effective_tariff_rate_percent']}% ({row['quota_status']})")
+    print("\n")
+
     # Example 2: Simulate impact of a new trade barrier
     print("--- Example 2: New Trade Barrier Simulation ---")
     barrier_sim_result = trade_flow_simulator.barrier_developer.simulate_new_barrier(
@@ -741,6 +2510,17 @@ if __name__ == '__main__':
     escalation_risk = trade_flow_simulator.barrier_developer.assess_escalation_risk(barrier_sim_result)
     print(f"Escalation risk for this barrier: {escalation_risk}\n")
 
+    # Example 2b: Monte Carlo escalation paths for a Chinese wheat tariff across all tracked relationships
+    wheat_tariff = trade_flow_simulator.barrier_developer.simulate_new_barrier("China", "wheat", "tariff", "retaliation_to_other_country_action")
+    for strategy in ("probabilistic", "tit_for_tat"):
+        escalation_paths = trade_flow_simulator.barrier_developer.simulate_escalation(
+            trade_flow_simulator.bilateral_evolution.trade_relationships, wheat_tariff, n_paths=5000, strategy=strategy, seed=7)
+        us_china = escalation_paths["pairs"]["US-China"]
+        print(f"{strategy}: US-China retaliation probability {us_china['probability_of_retaliation']:.1%}, "
+              f"trade reduction p50/p95 {us_china['trade_reduction_percent']['p50']}%/{us_china['trade_reduction_percent']['p95']}%, "
+              f"final tariff on US imports p95 {us_china['final_tariff_percent']['on_US_imports']['p95']}%")
+    print("\n")
+
 
     # Example 3: Analyze impact of a trade agreement
     print("--- Example 3: Trade Agreement Impact ---")
@@ -758,6 +2538,15 @@ if __name__ == '__main__':
     )
     print(f"Comparison for Wheat (Australia to Indonesia) under CPTPP vs RCEP: {agreement_comparison}\n")
 
+    # Example 3b: Membership index lookups by date and for all pairs at once
+    agreement_analyzer = trade_flow_simulator.agreement_analyzer
+    print(f"UK -> Canada on 2020-06-01: {agreement_analyzer.agreements_covering('UK', 'Canada', '2020-06-01')}")
+    print(f"UK -> Canada on 2025-06-01: {agreement_analyzer.agreements_covering('UK', 'Canada', '2025-06-01')}")
+    coverage_countries = ["USA", "Canada", "Japan", "Vietnam", "France", "Kenya", "Nigeria", "Australia"]
+    coverage = agreement_analyzer.coverage_matrix(coverage_countries, on_date="2025-01-01")
+    covered_pairs = sum(1 for mask in coverage["coverage"] if mask)
+    print(f"Ordered pairs covered by at least one agreement among {len(coverage_countries)} countries: {covered_pairs}\n")
+
 
     # Example 4: Bilateral Relationship Scenario
     print("--- Example 4: Bilateral Relationship Scenario ---")
@@ -769,6 +2558,18 @@ if __name__ == '__main__':
     )
     print(f"Impact of US-China Negative Scenario: {bilateral_impact}\n")
 
+    # Example 4b: Replaying a dated event stream into relationship state
+    relationship_events = {
+        "date": ["2018-07-06", "2018-07-06", "2019-05-10", "2020-01-15", "2022-03-02", "2022-06-01", "2023-09-12"],
+        "country_pair_key": ["US-China", "US-China", "US-China", "US-China", "EU-Russia", "EU-Russia", "India-MiddleEast"],
+        "text": ["US imposes Section 301 tariffs", "China retaliates on soybeans", "Tariff hike on remaining goods",
+                 "Phase One trade agreement signed", "New sanctions package", "Export ban on fertilizers", "CEPA talks advance"],
+    }
+    replay = trade_flow_simulator.bilateral_evolution.replay_events(relationship_events, record_history=True)
+    for pair, state in replay["pairs"].items():
+        print(f"{pair}: tension {state['tension_index']}, tariff {state['tariff_level_percent']}%, barriers {state['active_barriers']}")
+    print(f"US-China trajectory: {replay['history']['US-China']}\n")
+
     # Example 5: Trade Flow Volatility due to a shock
     print("--- Example 5: Trade Flow Volatility ---")
     shock_details = {"type": "tariff_increase", "importing_country": "China", "commodity": "soybeans", "details": {"new_tariff_percent": 25}}
@@ -790,6 +2591,24 @@ if __name__ == '__main__':
                  print(f"    {sub_key}: {sub_value}")
         else:
             print(f"  {key}: {value}")
+
+    # Example 5b: Same kind of shock re-cleared across all markets in a spatial equilibrium
+    soybean_regions = {
+        "US": {"production_mt": 116000000, "consumption_mt": 64000000, "price_usd_mt": 450},
+        "Brazil": {"production_mt": 155000000, "consumption_mt": 55000000, "price_usd_mt": 440},
+        "Argentina": {"production_mt": 48000000, "consumption_mt": 44000000, "price_usd_mt": 430},
+        "China": {"production_mt": 20000000, "consumption_mt": 120000000, "price_usd_mt": 560},
+        "EU": {"production_mt": 2700000, "consumption_mt": 17000000, "price_usd_mt": 540},
+    }
+    soybean_freight = {("US", "China"): 55, ("Brazil", "China"): 60, ("Argentina", "China"): 65,
+                       ("US", "EU"): 35, ("Brazil", "EU"): 40, ("Argentina", "EU"): 42}
+    equilibrium_shock = trade_flow_simulator.volatility_model.simulate_shock_equilibrium(
+        "soybeans", soybean_regions, shock_details, transport_costs=soybean_freight, default_transport_cost_usd_mt=80)
+    print("Spatial equilibrium after China tariff shock:")
+    for name, change in equilibrium_shock["region_changes"].items():
+        print(f"  {name}: price {change['price_change_percent']:+.2f}%, net exports {change['net_exports_change_mt']:+,.0f} t")
+    for route, change in sorted(equilibrium_shock["flow_changes"].items()):
+        print(f"  {route[0]} -> {route[1]}: {change['before_mt']:,.0f} t -> {change['after_mt']:,.0f} t")
     print("\n")
 
 
@@ -867,4 +2686,24 @@ if __name__ == '__main__':
             print(f"    Baseline Landed Cost/MT: {landed_cost}")
         print(f"    Market Access Summary: {summary}")
     else:
-        print("    Alternative flow analysis (Canada to Indonesia) not found.") 
\ No newline at end of file
+        print("    Alternative flow analysis (Canada to Indonesia) not found.")
+
+    # Example 6b: The same shocks over a full origin-destination flow tensor, reported as a diff
+    wheat_routes = [("Australia", "Indonesia", 5000000, 300), ("Canada", "Indonesia", 1000000, 320), ("US", "Indonesia", 1500000, 310),
+                    ("Australia", "China", 3000000, 305), ("US", "Japan", 2500000, 315), ("Canada", "Japan", 1200000, 318),
+                    ("Australia", "Vietnam", 1800000, 298), ("US", "EU", 400000, 312)]
+    tensor_scenario = dict(complex_scenario, events=complex_scenario["events"] + [
+        {"type": "trade_agreement_change", "agreement_name": "CPTPP", "change": "enter", "commodity": "wheat",
+         "change_description": "CPTPP partners drop remaining wheat duties."},
+        {"type": "trade_shock", "shock_event": {"type": "tariff_increase", "importing_country": "EU", "exporting_country": "US",
+                                                "commodity": "wheat", "details": {"new_tariff_percent": 25}}}
+    ], flows={
+        "commodity": ["wheat"] * len(wheat_routes), "exporting_country": [r[0] for r in wheat_routes],
+        "importing_country": [r[1] for r in wheat_routes], "volume_mt": [r[2] for r in wheat_routes],
+        "fob_price_usd_mt": [r[3] for r in wheat_routes]
+    })
+    tensor_diff = trade_flow_simulator.simulate_scenario(tensor_scenario)["flow_tensor_diff"]
+    print(f"  Flow tensor: {tensor_diff['cells_touched']} cells touched, {len(tensor_diff['changed_flows'])} flows changed")
+    for change in tensor_diff["changed_flows"]:
+        print(f"    {change['exporting_country']} -> {change['importing_country']}: volume {change['volume_mt'][0]:,.0f} -> {change['volume_mt'][1]:,.0f} t, "
+              f"landed {change['landed_cost_usd_mt'][0]} -> {change['landed_cost_usd_mt'][1]} USD/t") 
\ No newline at end of file
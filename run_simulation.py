@@ -121,54 +121,32 @@ def run_all_simulations():
         print(f"Labour Cost Dynamics Result: {json.dumps(labour_wage_impact_result, indent=2)}")
         
         print("\n--- Agri Input Price Index ---")
-        if hasattr(input_cost_sim, 'price_index_model') and input_cost_sim.price_index_model:
+        if hasattr(input_cost_sim, 'agri_input_index') and input_cost_sim.agri_input_index:
             price_scenario_data = {'Fertilizers': 1.10, 'Energy': 1.05, 'Seeds': 1.02, 'Chemicals': 1.08, 'Labour': 1.03} # Factors
-            
+            price_index_model = input_cost_sim.agri_input_index
+
             # Reset to baseline before applying new scenario updates
-            input_cost_sim.price_index_model.reset_to_baseline()
+            price_index_model.reset_to_baseline()
 
             for component, factor in price_scenario_data.items():
-                # The component names in AgriInputPriceIndex are:
-                # 'Fertilizers', 'Pesticides', 'Herbicides', 'Seeds', 'Fuel_Machinery', 'Labour', 'Utilities'
-                # We need to map our scenario data or use the exact names.
-                # For now, let's assume a direct mapping for components present in price_scenario_data
-                # and that the 'factor' is the new index value (e.g., 110 for 10% increase if baseline is 100).
-                # The update_component_price expects the new index value directly.
-                
-                # Let's use a more robust mapping or ensure keys match AgriInputPriceIndex internal component names
-                # Current AgriInputPriceIndex components (from its __init__):
-                # self.component_prices = {"Fertilizers": 100, "Pesticides": 100, ...}
-                # So, factor * 100 is correct if factor 1.10 means new index 110.
-
-                mapped_component = component # Default direct mapping
-                if component == "Energy": # Example mapping
-                    mapped_component = "Fuel_Machinery"
-                elif component == "Chemicals": # Example mapping for "Chemicals"
-                    # AgriInputPriceIndex has "Pesticides", "Herbicides". We might need to split this or have a general "Chemicals".
-                    # For now, let's assume "Chemicals" maps to "Pesticides" for simplicity or that the model handles a general "Chemicals".
-                    # Let's check component_weights keys from the model instance
-                    pass # Keep 'Chemicals' if it's a valid key, or handle appropriately
-
-                if mapped_component in input_cost_sim.price_index_model.component_weights:
-                    input_cost_sim.price_index_model.update_component_price(mapped_component, factor * 100)
-                elif component in input_cost_sim.price_index_model.component_weights: # Try original name if mapped didn't work
-                     input_cost_sim.price_index_model.update_component_price(component, factor * 100)
+                # Scenario names are mapped onto the index weight keys ('fertilizer', 'fuel', 'seed', ...)
+                # via AgriInputPriceIndex.component_aliases; factor 1.10 means a new component index of 110.
+                mapped_component = price_index_model.resolve_component(component)
+                if mapped_component is not None:
+                    price_index_model.update_component_price(mapped_component, factor * 100)
                 else:
-                    print(f"Warning: Component '{component}' (mapped to '{mapped_component}') not found in price_index_model.component_weights. Skipping update for this component.")
+                    print(f"Warning: Component '{component}' not found in agri_input_index.weights. Skipping update for this component.")
 
-            index_result = input_cost_sim.price_index_model._calculate_index() # Calling protected method as per original main
+            index_result = price_index_model.get_index_value()
             results["agri_input_price_index"] = {"index_value": index_result, "scenario_data_applied": price_scenario_data}
             print(f"Simulated Agri Input Price Index: {index_result} based on scenario: {price_scenario_data}")
-            
-            # The call to get_index_component_details was problematic as the method doesn't exist.
-            # If we want component details, we'd typically look at self.price_index_model.component_prices
-            # or self.price_index_model.component_weights after updates.
-            current_component_prices = input_cost_sim.price_index_model.component_prices
+
+            current_component_prices = price_index_model.get_component_prices()
             results["agri_input_price_index_components"] = current_component_prices
             print(f"Agri Input Price Index Component Prices after update: {json.dumps(current_component_prices, indent=2)}")
 
         else:
-            print("AgriInputPriceIndex model not available or not named 'price_index_model'. Skipping Agri Input Price Index.")
+            print("AgriInputPriceIndex model not available. Skipping Agri Input Price Index.")
             results["agri_input_price_index"] = "Skipped"
             results["agri_input_price_index_components"] = "Skipped"
 
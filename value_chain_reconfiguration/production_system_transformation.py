@@ -1,5 +1,25 @@
 # This module will cover transformations in production systems. 
 
+import math
+import operator
+import os
+import random
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, chain, compress, repeat
+from statistics import NormalDist
+
+try:
+    from industry_transformation_landscape.climate_shock_yield_volatility import ClimateVolatilityModel
+    from industry_transformation_landscape.input_cost_dynamics_margin_structure import FarmMarginModel
+except ImportError:  # run as a script from this directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from industry_transformation_landscape.climate_shock_yield_volatility import ClimateVolatilityModel
+    from industry_transformation_landscape.input_cost_dynamics_margin_structure import FarmMarginModel
+
 class FarmConsolidationTrends:
     def __init__(self):
         self.farm_size_data = {
@@ -9,6 +29,15 @@ class FarmConsolidationTrends:
             "Asia (India)": {"current_avg_ha": 1.1, "trend_pa": -0.005, "notes": "Dominated by smallholders; land fragmentation is a concern in some areas."},
             "Africa (Sub-Saharan)": {"current_avg_ha": 1.5, "trend_pa": 0.001, "notes": "Highly diverse, slow changes, land tenure issues often a barrier."}
         }
+        # Lognormal farm-size dispersion (log-scale standard deviation) and its yearly drift under consolidation
+        self.size_distribution = {
+            "North America (US)": {"log_sd": 1.3, "log_sd_trend_pa": 0.004},
+            "Europe (EU-27)": {"log_sd": 1.4, "log_sd_trend_pa": 0.005},
+            "South America (Brazil)": {"log_sd": 1.8, "log_sd_trend_pa": 0.003},
+            "Asia (India)": {"log_sd": 0.9, "log_sd_trend_pa": 0.001},
+            "Africa (Sub-Saharan)": {"log_sd": 0.8, "log_sd_trend_pa": 0.002}
+        }
+        self._standard_normal_draws = {}  # (n_farms, seed) -> sorted array('d') of N(0, 1) draws
         self.drivers = {
             "economic": ["economies of scale", "high cost of technology adoption", "access to capital", "market price pressures", "global competition"],
             "policy": ["subsidies favoring larger operations", "land tenure and inheritance laws", "global trade agreements"],
@@ -47,6 +76,94 @@ class FarmConsolidationTrends:
             "driver_factor_applied": specific_driver_factor
         }
 
+    def projection_cube(self, regions: list = None, years: int = 30, driver_factors=(0.5, 0.75, 1.0, 1.25, 1.5)) -> dict:
+        """
+        Projected average farm size for every region x year 1..years x driver factor.
+
+        Same compounding as model_consolidation_rate, evaluated for the whole grid in one pass over flat
+        parameter columns. 'avg_ha' is row-major over (region, year, driver factor).
+        """
+        regions = regions or list(self.farm_size_data)
+        missing = [r for r in regions if r not in self.farm_size_data]
+        if missing:
+            return {"error": f"Region(s) not found: {missing}"}
+        cell_count = years * len(driver_factors)
+        base = chain.from_iterable(repeat(self.farm_size_data[r]["current_avg_ha"], cell_count) for r in regions)
+        growth = chain.from_iterable(repeat(1 + self.farm_size_data[r]["trend_pa"] * f, years)
+                                     for r in regions for f in driver_factors)
+        exponents = chain.from_iterable(repeat(range(1, years + 1), len(regions) * len(driver_factors)))
+        # growth is laid out (region, factor, year); reorder the exponentiated values to (region, year, factor)
+        compounded = array('d', map(pow, growth, exponents))
+        n_factors = len(driver_factors)
+        ordered = array('d', bytes(8 * len(compounded)))
+        for r in range(len(regions)):
+            for k in range(n_factors):
+                start = (r * n_factors + k) * years
+                ordered[r * cell_count + k:(r + 1) * cell_count:n_factors] = compounded[start:start + years]
+        return {
+            "regions": regions,
+            "years": list(range(1, years + 1)),
+            "driver_factors": list(driver_factors),
+            "shape": (len(regions), years, n_factors),
+            "avg_ha": array('d', map(operator.mul, base, ordered))
+        }
+
+    def _sorted_normal_draws(self, n_farms: int, seed: int) -> array:
+        key = (n_farms, seed)
+        if key not in self._standard_normal_draws:
+            draws = NormalDist().samples(n_farms, seed=seed)
+            draws.sort()
+            self._standard_normal_draws[key] = array('d', draws)
+        return self._standard_normal_draws[key]
+
+    def _lognormal_parameters(self, region: str, year: int, driver_factor: float, avg_ha: float):
+        params = self.size_distribution[region]
+        sigma = params["log_sd"] * (1 + params["log_sd_trend_pa"] * driver_factor) ** year
+        return math.log(avg_ha) - 0.5 * sigma * sigma, sigma
+
+    def synthetic_farms(self, region: str, years: int = 0, driver_factor: float = 1.0, n_farms: int = 100000, seed: int = 0) -> dict:
+        """
+        Synthetic farm sizes (ha) drawn from the region's lognormal distribution in the given projection year.
+        The distribution's mean equals the projected average farm size; its dispersion drifts with consolidation.
+        """
+        if region not in self.farm_size_data:
+            return {"error": "Region not found"}
+        avg_ha = self.farm_size_data[region]["current_avg_ha"] * (1 + self.farm_size_data[region]["trend_pa"] * driver_factor) ** years
+        mu, sigma = self._lognormal_parameters(region, years, driver_factor, avg_ha)
+        draws = NormalDist().samples(n_farms, seed=seed)
+        return {"region": region, "year": years, "mu": mu, "sigma": sigma,
+                "farm_size_ha": array('d', map(math.exp, map(mu.__add__, map(sigma.__mul__, draws))))}
+
+    def size_distribution_cube(self, regions: list = None, years: int = 30, driver_factors=(0.5, 0.75, 1.0, 1.25, 1.5),
+                               n_farms: int = 1000000, quantiles=(0.1, 0.25, 0.5, 0.75, 0.9),
+                               thresholds_ha=(2, 50, 500), seed: int = 0) -> dict:
+        """
+        Farm-size distribution summary for every cell of the projection cube, from n_farms synthetic farms per cell.
+
+        All cells share one sorted set of standard-normal draws, so each cell's farms are exp(mu + sigma * z)
+        in sorted order: sample quantiles are single lookups and the share of farms above a threshold is a
+        bisection, instead of drawing and sorting millions of farms per cell.
+
+        Returns:
+            dict: Cube axes plus, per quantile and per threshold, a flat row-major array over (region, year, factor).
+        """
+        cube = self.projection_cube(regions, years, driver_factors)
+        if "error" in cube:
+            return cube
+        z = self._sorted_normal_draws(n_farms, seed)
+        ranks = [min(int(q * n_farms), n_farms - 1) for q in quantiles]
+        quantile_values = {q: array('d') for q in quantiles}
+        share_above = {t: array('d') for t in thresholds_ha}
+        cells = ((region, year, factor) for region in cube["regions"] for year in cube["years"] for factor in cube["driver_factors"])
+        for (region, year, factor), avg_ha in zip(cells, cube["avg_ha"]):
+            mu, sigma = self._lognormal_parameters(region, year, factor, avg_ha)
+            for q, rank in zip(quantiles, ranks):
+                quantile_values[q].append(math.exp(mu + sigma * z[rank]))
+            for threshold in thresholds_ha:
+                share_above[threshold].append(1 - bisect_right(z, (math.log(threshold) - mu) / sigma) / n_farms)
+        cube.update({"n_farms": n_farms, "quantiles_ha": quantile_values, "share_of_farms_above_ha": share_above})
+        return cube
+
     def analyze_regional_differences(self, region1: str, region2: str) -> dict:
         """Provides a comparative analysis of consolidation trends between two regions."""
         data_region1 = self.get_regional_data(region1)
@@ -64,7 +181,13 @@ class FarmConsolidationTrends:
         }
 
 class TechnologyAdoptionDifferential:
-    def simulate_differential(self, technology_type: str, farm_size: str):
+    farm_size_aliases = {"LargeScale": "large", "MediumScale": "medium", "SmallScale": "small", "Smallholder": "small"}
+
+    def __init__(self, precision_agriculture=None):
+        self.precision_agriculture = precision_agriculture or PrecisionAgricultureAdoption()
+        self.diffusion = AdoptionDiffusionEngine(self.precision_agriculture)
+
+    def simulate_differential(self, technology_type: str, farm_size: str, years: int = 15):
         """
         Simulate technology adoption differential.
         - Precision agriculture penetration curve by farm size
@@ -72,8 +195,30 @@ class TechnologyAdoptionDifferential:
         - Mechanization advancement by production system
         - Irrigation technology modernization timeline
         - Crop protection innovation diffusion pattern
+
+        technology_type is a PrecisionAgricultureAdoption technology or "PrecisionAg" for all of them;
+        farm_size is a size class ("small", "medium", "large") or an alias such as "LargeScale".
+        Returns Bass diffusion curves per technology and region for the size class, and the gap to large farms.
         """
-        pass
+        size_class = self.farm_size_aliases.get(farm_size, farm_size)
+        if size_class not in self.diffusion.size_classes:
+            return {"error": f"Unknown farm size '{farm_size}'. Use one of {list(self.diffusion.size_classes)}."}
+        technologies = list(self.precision_agriculture.adoption_data) if technology_type == "PrecisionAg" else [technology_type]
+        if any(t not in self.precision_agriculture.adoption_data for t in technologies):
+            return {"error": f"Technology '{technology_type}' not found."}
+        cells = self.diffusion.default_cells(technologies=technologies, size_classes=sorted({size_class, "large"}))
+        projection = self.diffusion.project(cells, years)
+        curves = self.diffusion.curves_by_cell(projection)
+        differential = {}
+        for technology in technologies:
+            for region in self.diffusion.regions:
+                curve = curves[(technology, region, size_class)]
+                large = curves[(technology, region, "large")]
+                differential.setdefault(technology, {})[region] = {
+                    "adoption_curve": [round(v, 4) for v in curve],
+                    "gap_to_large_farms_final_year": round(large[-1] - curve[-1], 4)
+                }
+        return {"technology_type": technology_type, "farm_size": size_class, "years": projection["years"], "by_technology": differential}
 
 class SustainabilityPracticeImplementation:
     def track_implementation(self, practice_type: str):
@@ -88,7 +233,251 @@ class SustainabilityPracticeImplementation:
         pass
 
 class CropMixEvolution:
-    def project_evolution(self, region: str):
+    """
+    Mean-variance crop portfolio per region: hectare shares that maximise expected gross margin minus a
+    risk penalty, subject to rotation limits (per-crop share bounds) and the region's cropland.
+
+    Margins are drawn as an ensemble. Each scenario has a regional temperature and precipitation anomaly
+    (correlated: hot years are dry years) around the warming path of ClimateVolatilityModel's scenario;
+    ClimateVolatilityModel.correlate_climate_yield_impact turns them into crop yield impacts, crop-specific
+    noise and price noise are added, and FarmMarginModel gives the gross margin per ha. Anomaly volatility
+    rises year by year; draws are reused across years so successive problems differ smoothly and the
+    previous year's solution is a good warm start.
+    """
+    # Price (USD/t), price and residual (non-climate) yield volatility, technology yield trend, and the
+    # crop type used by ClimateVolatilityModel's yield response (other crops use its generic response)
+    crop_economics = {
+        "Maize": {"price_usd_t": 190, "price_cv": 0.18, "yield_cv": 0.10, "yield_trend_pa": 0.010, "climate_crop": "corn"},
+        "Soybean": {"price_usd_t": 430, "price_cv": 0.15, "yield_cv": 0.09, "yield_trend_pa": 0.012},
+        "Wheat": {"price_usd_t": 240, "price_cv": 0.18, "yield_cv": 0.10, "yield_trend_pa": 0.008, "climate_crop": "wheat"},
+        "Barley": {"price_usd_t": 210, "price_cv": 0.15, "yield_cv": 0.09, "yield_trend_pa": 0.006, "climate_crop": "wheat"},
+        "Rapeseed": {"price_usd_t": 480, "price_cv": 0.18, "yield_cv": 0.11, "yield_trend_pa": 0.008},
+        "Sugarcane": {"price_usd_t": 35, "price_cv": 0.10, "yield_cv": 0.06, "yield_trend_pa": 0.008},
+        "Rice": {"price_usd_t": 300, "price_cv": 0.10, "yield_cv": 0.06, "yield_trend_pa": 0.006, "climate_crop": "rice"},
+        "Pulses": {"price_usd_t": 800, "price_cv": 0.20, "yield_cv": 0.15, "yield_trend_pa": 0.004},
+        "Cassava": {"price_usd_t": 60, "price_cv": 0.12, "yield_cv": 0.08, "yield_trend_pa": 0.006},
+        "Sorghum": {"price_usd_t": 230, "price_cv": 0.15, "yield_cv": 0.09, "yield_trend_pa": 0.004}
+    }
+    # Cropland (million ha), ClimateVolatilityModel region, and per-crop yield (t/ha), variable costs (USD/ha)
+    # and rotation share limits
+    regional_profiles = {
+        "North America (US)": {"cropland_mha": 125, "climate_region": "North America Plains", "crops": {
+            "Maize": {"yield_t_ha": 11.0, "variable_cost_usd_ha": 1500, "max_share": 0.6},
+            "Soybean": {"yield_t_ha": 3.5, "variable_cost_usd_ha": 800, "max_share": 0.5},
+            "Wheat": {"yield_t_ha": 3.4, "variable_cost_usd_ha": 500, "max_share": 0.5}}},
+        "Europe (EU-27)": {"cropland_mha": 100, "climate_region": "European Union", "crops": {
+            "Wheat": {"yield_t_ha": 6.0, "variable_cost_usd_ha": 900, "max_share": 0.6},
+            "Barley": {"yield_t_ha": 5.0, "variable_cost_usd_ha": 700, "max_share": 0.5},
+            "Rapeseed": {"yield_t_ha": 3.2, "variable_cost_usd_ha": 900, "max_share": 0.33},
+            "Maize": {"yield_t_ha": 7.8, "variable_cost_usd_ha": 1100, "max_share": 0.5}}},
+        "South America (Brazil)": {"cropland_mha": 65, "climate_region": "South America", "crops": {
+            "Soybean": {"yield_t_ha": 3.5, "variable_cost_usd_ha": 750, "max_share": 0.7},
+            "Maize": {"yield_t_ha": 5.8, "variable_cost_usd_ha": 800, "max_share": 0.5},
+            "Sugarcane": {"yield_t_ha": 75.0, "variable_cost_usd_ha": 2000, "max_share": 0.3}}},
+        "Asia (India)": {"cropland_mha": 155, "climate_region": "South Asia", "crops": {
+            "Rice": {"yield_t_ha": 4.0, "variable_cost_usd_ha": 700, "max_share": 0.6},
+            "Wheat": {"yield_t_ha": 3.5, "variable_cost_usd_ha": 500, "max_share": 0.6},
+            "Pulses": {"yield_t_ha": 0.9, "variable_cost_usd_ha": 350, "max_share": 0.5, "min_share": 0.1}}},
+        "Africa (Sub-Saharan)": {"cropland_mha": 220, "climate_region": "Sub-Saharan Africa", "crops": {
+            "Maize": {"yield_t_ha": 2.0, "variable_cost_usd_ha": 250, "max_share": 0.6},
+            "Cassava": {"yield_t_ha": 10.0, "variable_cost_usd_ha": 350, "max_share": 0.5},
+            "Sorghum": {"yield_t_ha": 1.2, "variable_cost_usd_ha": 120, "max_share": 0.6}}}
+    }
+    # Interannual anomaly spread today, its growth per year, the hot-dry correlation, and the years over
+    # which the warming scenario's temperature increase is reached
+    temperature_sd_c = 0.8
+    precipitation_sd_percent = 15.0
+    temperature_precipitation_correlation = -0.4
+    climate_volatility_growth_pa = 0.01
+    warming_horizon_years = 30
+
+    def __init__(self, climate_model: ClimateVolatilityModel = None, warming_scenario: str = "moderate_warming"):
+        self.climate_model = climate_model or ClimateVolatilityModel()
+        self.warming_scenario = warming_scenario
+        self.margin_models = {
+            region: {crop: FarmMarginModel(crop, local["yield_t_ha"], self.crop_economics[crop]["price_usd_t"],
+                                           {"variable_costs": local["variable_cost_usd_ha"]})
+                     for crop, local in profile["crops"].items()}
+            for region, profile in self.regional_profiles.items()
+        }
+
+    def margin_ensemble(self, region: str, years=(0,), scenarios: int = 500, seed: int = 0) -> dict:
+        """
+        Gross margin scenarios (USD/ha) per crop for each projection year, from one set of draws.
+
+        Returns:
+            dict: 'crops' and, per year, a list of scenario rows (one margin per crop).
+        """
+        profile = self.regional_profiles.get(region)
+        if profile is None:
+            return {"error": f"Region '{region}' not found."}
+        crops = list(profile["crops"])
+        climate_region = profile["climate_region"]
+        warming = self.climate_model.generate_temperature_anomaly_scenario(climate_region, self.warming_scenario)["temp_increase_c"]
+        yield_response = self.climate_model.correlate_climate_yield_impact
+        climate_crops = [self.crop_economics[c].get("climate_crop", c.lower()) for c in crops]
+        models = [self.margin_models[region][c] for c in crops]
+        rng = random.Random(seed)
+        gauss = rng.gauss
+        rho = self.temperature_precipitation_correlation
+        draws = [(t, rho * t + math.sqrt(1 - rho * rho) * gauss(0, 1), [gauss(0, 1) for _ in crops], [gauss(0, 1) for _ in crops])
+                 for t in (gauss(0, 1) for _ in range(scenarios))]
+        by_year = {}
+        for year in years:
+            spread = 1 + self.climate_volatility_growth_pa * year
+            mean_warming = warming * min(year / self.warming_horizon_years, 1.0)
+            temperature_sd, precipitation_sd = self.temperature_sd_c * spread, self.precipitation_sd_percent * spread
+            terms = []
+            for crop, model in zip(crops, models):
+                economics = self.crop_economics[crop]
+                yield_cv, price_cv = economics["yield_cv"] * spread, economics["price_cv"]
+                terms.append((model, model.expected_yield_t_per_ha * (1 + economics["yield_trend_pa"]) ** year, yield_cv,
+                              model.market_price_usd_per_t, price_cv))
+            rows = []
+            for temperature_shock, precipitation_shock, yield_shocks, price_shocks in draws:
+                temperature = mean_warming + temperature_sd * temperature_shock
+                precipitation = precipitation_sd * precipitation_shock
+                impacts = {crop_type: yield_response(temperature, precipitation, climate_region, crop_type)["total_estimated_yield_impact_percent"]
+                           for crop_type in set(climate_crops)}
+                rows.append([model.calculate_gross_margin_per_ha(model.calculate_gross_revenue_per_ha(
+                                 trend_yield * (1 + impacts[crop_type] / 100) * math.exp(cv * own - 0.5 * cv * cv),
+                                 price * math.exp(pcv * price_shock - 0.5 * pcv * pcv)))
+                             for (model, trend_yield, cv, price, pcv), crop_type, own, price_shock
+                             in zip(terms, climate_crops, yield_shocks, price_shocks)])
+            by_year[year] = rows
+        return {"region": region, "crops": crops, "margins_by_year": by_year}
+
+    def margin_outlook(self, region: str, year: int = 0, scenarios: int = 500, seed: int = 0) -> dict:
+        """{crop: (mean gross margin USD/ha, coefficient of variation)} from the margin ensemble."""
+        ensemble = self.margin_ensemble(region, (year,), scenarios, seed)
+        if "error" in ensemble:
+            return ensemble
+        mean, covariance = self._moments(ensemble["margins_by_year"][year])
+        return {crop: (m, math.sqrt(covariance[k][k]) / abs(m) if m else 0.0) for k, (crop, m) in enumerate(zip(ensemble["crops"], mean))}
+
+    @staticmethod
+    def _moments(rows):
+        n, k = len(rows), len(rows[0])
+        columns = list(zip(*rows))
+        mean = [sum(column) / n for column in columns]
+        centred = [[v - m for v in column] for column, m in zip(columns, mean)]
+        covariance = [[sum(map(operator.mul, centred[i], centred[j])) / (n - 1) for j in range(k)] for i in range(k)]
+        return mean, covariance
+
+    @staticmethod
+    def _solve_linear(matrix, rhs):
+        """Gaussian elimination with partial pivoting on a small dense system."""
+        n = len(rhs)
+        a = [row[:] + [b] for row, b in zip(matrix, rhs)]
+        for col in range(n):
+            pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+            a[col], a[pivot] = a[pivot], a[col]
+            if abs(a[col][col]) < 1e-14:
+                return None
+            for r in range(col + 1, n):
+                factor = a[r][col] / a[col][col]
+                if factor:
+                    a[r] = [x - factor * y for x, y in zip(a[r], a[col])]
+        solution = [0.0] * n
+        for r in range(n - 1, -1, -1):
+            solution[r] = (a[r][n] - sum(a[r][c] * solution[c] for c in range(r + 1, n))) / a[r][r]
+        return solution
+
+    def solve_portfolio(self, expected_margin, covariance, min_share, max_share, risk_aversion: float,
+                        warm_start=None, max_iterations: int = 200, tolerance: float = 1e-9) -> dict:
+        """
+        max  mu.x - (risk_aversion / 2) x'Cx   s.t.  sum(x) = 1,  min_share <= x <= max_share
+
+        Primal active-set method: shares at a bound are held fixed, the equality-constrained problem over
+        the free shares is solved exactly from its KKT system, steps stop at the first bound hit, and a fixed
+        share is released when its bound multiplier has the wrong sign. A feasible warm start (e.g. last
+        year's shares) typically leaves only a pivot or two.
+        """
+        n = len(expected_margin)
+        lower, upper = list(min_share), list(max_share)
+        if sum(lower) > 1 + tolerance or sum(upper) < 1 - tolerance or any(l > u for l, u in zip(lower, upper)):
+            return {"error": "Rotation limits leave no feasible allocation of the cropland."}
+        lam = risk_aversion
+        hessian = [[lam * c + (1e-9 if i == j else 0.0) for j, c in enumerate(row)] for i, row in enumerate(covariance)]
+        x = None
+        if warm_start is not None and len(warm_start) == n and abs(sum(warm_start) - 1) < 1e-6 and \
+                all(l - 1e-9 <= v <= u + 1e-9 for v, l, u in zip(warm_start, lower, upper)):
+            x = [min(max(v, l), u) for v, l, u in zip(warm_start, lower, upper)]
+        if x is None:
+            # Greedy feasible start: minimum shares, then fill the best-margin crops up to their limits
+            x, room = lower[:], 1 - sum(lower)
+            for i in sorted(range(n), key=lambda i: -expected_margin[i]):
+                add = min(upper[i] - x[i], room)
+                x[i] += add
+                room -= add
+        fixed = {i for i in range(n) if x[i] <= lower[i] + 1e-12 or x[i] >= upper[i] - 1e-12}
+        if len(fixed) == n:
+            fixed.discard(next((i for i in range(n) if upper[i] > lower[i]), 0))
+        pivots = 0
+        converged = False
+        multiplier = 0.0
+        while pivots < max_iterations:
+            free = [i for i in range(n) if i not in fixed]
+            fixed_sum = sum(x[i] for i in fixed)
+            rhs = [expected_margin[i] - sum(hessian[i][j] * x[j] for j in fixed) for i in free] + [1 - fixed_sum]
+            kkt = [[hessian[i][j] for j in free] + [1.0] for i in free] + [[1.0] * len(free) + [0.0]]
+            solution = self._solve_linear(kkt, rhs)
+            if solution is None:
+                return {"error": "Singular KKT system in crop portfolio solve."}
+            target, multiplier = solution[:-1], solution[-1]
+            step = [t - x[i] for t, i in zip(target, free)]
+            if max(map(abs, step), default=0.0) <= tolerance:
+                gradient = [sum(h * v for h, v in zip(row, x)) - m for row, m in zip(hessian, expected_margin)]
+                worst, release = -tolerance, None
+                for j in fixed:
+                    bound_multiplier = gradient[j] + multiplier if x[j] <= lower[j] + 1e-12 else -(gradient[j] + multiplier)
+                    if bound_multiplier < worst and upper[j] > lower[j]:
+                        worst, release = bound_multiplier, j
+                if release is None:
+                    converged = True
+                    break
+                fixed.discard(release)
+            else:
+                alpha, blocking = 1.0, None
+                for d, i in zip(step, free):
+                    if d < 0 and (lower[i] - x[i]) / d < alpha:
+                        alpha, blocking = (lower[i] - x[i]) / d, i
+                    elif d > 0 and (upper[i] - x[i]) / d < alpha:
+                        alpha, blocking = (upper[i] - x[i]) / d, i
+                for d, i in zip(step, free):
+                    x[i] += alpha * d
+                if blocking is not None:
+                    x[blocking] = lower[blocking] if step[free.index(blocking)] < 0 else upper[blocking]
+                    fixed.add(blocking)
+            pivots += 1
+        mean = sum(m * v for m, v in zip(expected_margin, x))
+        variance = sum(x[i] * sum(c * v for c, v in zip(covariance[i], x)) for i in range(n))
+        return {"shares": x, "expected_margin_usd_ha": mean, "margin_sd_usd_ha": math.sqrt(max(variance, 0.0)),
+                "objective": mean - 0.5 * lam * variance, "pivots": pivots, "converged": converged,
+                "binding_limits": sorted(i for i in fixed if x[i] >= upper[i] - 1e-12 or x[i] <= lower[i] + 1e-12)}
+
+    def _solve_problem(self, problem):
+        return self.solve_portfolio(problem["expected_margin"], problem["covariance"], problem["min_share"], problem["max_share"],
+                                    problem["risk_aversion"], problem.get("warm_start"))
+
+    def _solve_chunk(self, problems):
+        return [self._solve_problem(problem) for problem in problems]
+
+    def optimize_batch(self, problems: list, processes: int = None, chunk_size: int = 500) -> list:
+        """
+        Solves many independent portfolio problems (dicts with expected_margin, covariance, min_share,
+        max_share, risk_aversion and optional warm_start), optionally in chunks across worker processes.
+        """
+        chunks = [problems[k:k + chunk_size] for k in range(0, len(problems), chunk_size)]
+        if processes and processes > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                solved = list(pool.map(self._solve_chunk, chunks))
+        else:
+            solved = list(map(self._solve_chunk, chunks))
+        return list(chain.from_iterable(solved))
+
+    def project_evolution(self, region: str, years: int = 10, risk_aversion: float = 0.004, scenarios: int = 500,
+                          allow_fallow: bool = False, seed: int = 0, margin_scenarios: dict = None):
         """
         Project crop mix evolution by region.
         - Climate adaptation-driven crop switching
@@ -96,8 +485,74 @@ class CropMixEvolution:
         - Risk management diversification approaches
         - Input optimization-based selection
         - Value-added specialty crop integration
+
+        Solves the mean-variance allocation for years 0..years, warm-starting each year from the last.
+
+        Args:
+            risk_aversion (float): Penalty per USD^2/ha of margin variance (0 = maximise expected margin).
+            allow_fallow (bool): Let land stay uncropped (zero margin, zero risk) instead of forcing full use.
+            margin_scenarios (dict, optional): {year: scenario rows} to use instead of the built-in ensemble,
+                                               e.g. margins from climate scenario runs; crop order as regional_profiles.
+                                               Must cover every year 0..years; the built-in ensemble is then not drawn.
+
+        Returns:
+            dict: Per year the crop shares and hectares, expected margin and its standard deviation, and solver pivots.
         """
-        pass
+        profile = self.regional_profiles.get(region)
+        if profile is None:
+            return {"error": f"Region '{region}' not found."}
+        if margin_scenarios is not None:
+            crops, by_year = list(profile["crops"]), margin_scenarios
+            missing = [year for year in range(years + 1) if not by_year.get(year)]
+            if missing:
+                return {"error": f"margin_scenarios has no scenario rows for years {missing}."}
+            if any(len(row) != len(crops) for year in range(years + 1) for row in by_year[year]):
+                return {"error": f"margin_scenarios rows must have one margin per crop ({', '.join(crops)})."}
+        else:
+            ensemble = self.margin_ensemble(region, range(years + 1), scenarios, seed)
+            if "error" in ensemble:
+                return ensemble
+            crops, by_year = ensemble["crops"], ensemble["margins_by_year"]
+        min_share = [profile["crops"][c].get("min_share", 0.0) for c in crops]
+        max_share = [profile["crops"][c]["max_share"] for c in crops]
+        if allow_fallow:
+            crops = crops + ["Fallow"]
+            min_share, max_share = min_share + [0.0], max_share + [1.0]
+        projection, warm_start, total_pivots = [], None, 0
+        for year in range(years + 1):
+            rows = by_year[year]
+            if allow_fallow:
+                rows = [row + [0.0] for row in rows]
+            mean, covariance = self._moments(rows)
+            result = self.solve_portfolio(mean, covariance, min_share, max_share, risk_aversion, warm_start)
+            if "error" in result:
+                return result
+            warm_start = result["shares"]
+            total_pivots += result["pivots"]
+            projection.append({
+                "year": year,
+                "crop_shares": {c: round(v, 4) for c, v in zip(crops, result["shares"])},
+                "crop_area_mha": {c: round(v * profile["cropland_mha"], 2) for c, v in zip(crops, result["shares"])},
+                "expected_margin_usd_ha": round(result["expected_margin_usd_ha"], 2),
+                "margin_sd_usd_ha": round(result["margin_sd_usd_ha"], 2),
+                "rotation_limits_binding": [crops[i] for i in result["binding_limits"]],
+                "pivots": result["pivots"]
+            })
+        return {"region": region, "risk_aversion": risk_aversion, "projection": projection, "total_pivots": total_pivots}
+
+    def _project_task(self, task):
+        region, kwargs = task
+        return self.project_evolution(region, **kwargs)
+
+    def project_regions(self, regions: list = None, processes: int = None, **kwargs) -> dict:
+        """Runs project_evolution for several regions, optionally one region per worker process."""
+        tasks = [(region, kwargs) for region in (regions or list(self.regional_profiles))]
+        if processes and processes > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                outcomes = list(pool.map(self._project_task, tasks))
+        else:
+            outcomes = list(map(self._project_task, tasks))
+        return {region: outcome for (region, _), outcome in zip(tasks, outcomes)}
 
 class ProductionFinanceModelInnovation:
     def simulate_innovation(self, finance_model_type: str):
@@ -175,6 +630,261 @@ class PrecisionAgricultureAdoption:
         """Provides a qualitative overview of precision ag adoption in a region."""
         return self.regional_variations.get(region, "Regional data not available.")
 
+class AdoptionDiffusionEngine:
+    """
+    Bass / logistic diffusion curves for technology x region x farm-size class cells.
+
+    Current adoption per cell is anchored on PrecisionAgricultureAdoption's rates (US large farms, EU medium
+    farms, global) and scaled by region and size-class factors elsewhere. Each curve starts at the cell's
+    current adoption on its own Bass curve, so year t is F(tau0 + t). All cells and years are evaluated as one
+    flat map over repeated parameter columns. Calibrated parameters, when present, replace the priors.
+    """
+    regions = ("North America", "Europe", "South America", "Asia", "Africa", "Australia/NZ")
+    size_classes = ("small", "medium", "large")
+    region_factors = {"North America": 1.0, "Europe": 0.8, "South America": 0.7, "Asia": 0.3, "Africa": 0.15, "Australia/NZ": 0.95}
+    size_factors = {"large": 1.0, "medium": 0.7, "small": 0.35}
+    profile_anchors = {("North America", "large"): "adoption_rate_us_large_farms", ("Europe", "medium"): "adoption_rate_eu_med_farms"}
+    default_innovation, default_imitation, max_potential = 0.01, 0.35, 0.98
+
+    def __init__(self, precision_agriculture):
+        self.precision_agriculture = precision_agriculture
+        self.calibrated = {}  # (technology, region, size_class) -> {'p', 'q', 'm'}
+
+    def _current_adoption(self, technology, region, size_class):
+        data = self.precision_agriculture.adoption_data[technology]
+        anchor = self.profile_anchors.get((region, size_class))
+        if anchor in data:
+            return data[anchor]
+        base = data.get("adoption_rate_us_large_farms", data.get("adoption_rate_global", 0.1))
+        return base * self.region_factors[region] * self.size_factors[size_class]
+
+    def default_cells(self, technologies=None, regions=None, size_classes=None):
+        """
+        Columnar cell table (technology, region, size_class, current_adoption, p, q, m) for every combination.
+        Market potential m scales with region and size class but always leaves room above current adoption.
+        """
+        technologies = technologies or list(self.precision_agriculture.adoption_data)
+        cells = {k: [] for k in ("technology", "region", "size_class", "current_adoption", "p", "q", "m")}
+        for technology in technologies:
+            for region in regions or self.regions:
+                for size_class in size_classes or self.size_classes:
+                    key = (technology, region, size_class)
+                    current = self._current_adoption(*key)
+                    prior = self.calibrated.get(key)
+                    if prior is None:
+                        potential = self.max_potential * math.sqrt(self.size_factors[size_class]) * self.region_factors[region] ** 0.3
+                        prior = {"p": self.default_innovation, "q": self.default_imitation,
+                                 "m": min(self.max_potential, max(potential, current * 1.1))}
+                    for column, value in zip(("technology", "region", "size_class"), key):
+                        cells[column].append(value)
+                    cells["current_adoption"].append(current)
+                    cells["p"].append(prior["p"])
+                    cells["q"].append(prior["q"])
+                    cells["m"].append(max(prior["m"], current * 1.0001))
+        return cells
+
+    @staticmethod
+    def _bass(m, p, q, t):
+        decay = math.exp(-(p + q) * t)
+        return m * (1 - decay) / (1 + q / p * decay)
+
+    @staticmethod
+    def _bass_time(m, p, q, adoption):
+        """Time at which a Bass curve reaches the given adoption level."""
+        f = min(adoption / m, 1 - 1e-9)
+        return -math.log((1 - f) / (1 + f * q / p)) / (p + q)
+
+    @staticmethod
+    def _logistic(m, k, t):
+        return m / (1 + math.exp(-k * t))
+
+    @staticmethod
+    def _logistic_time(m, k, adoption):
+        f = min(max(adoption / m, 1e-9), 1 - 1e-9)
+        return math.log(f / (1 - f)) / k
+
+    def project(self, cells: dict = None, years: int = 15, model: str = "bass"):
+        """
+        Adoption share for every cell and year 1..years.
+
+        Args:
+            cells (dict, optional): Cell table as returned by default_cells (parameters may be edited).
+            model (str): 'bass' (p, q, m) or 'logistic' (growth rate q, ceiling m).
+
+        Returns:
+            dict: 'cells', 'years', 'shape' (cells, years) and 'adoption', a flat row-major array('d').
+        """
+        if model not in ("bass", "logistic"):
+            return {"error": f"Unknown diffusion model '{model}'. Use 'bass' or 'logistic'."}
+        cells = cells or self.default_cells()
+        m_col, p_col, q_col = cells["m"], cells["p"], cells["q"]
+        if model == "bass":
+            starts = list(map(self._bass_time, m_col, p_col, q_col, cells["current_adoption"]))
+        else:
+            starts = list(map(self._logistic_time, m_col, q_col, cells["current_adoption"]))
+        year_range = range(1, years + 1)
+        spread = lambda column: chain.from_iterable(map(repeat, column, repeat(years)))
+        times = map(float.__add__, map(float, spread(starts)), chain.from_iterable(repeat(year_range, len(starts))))
+        if model == "bass":
+            adoption = array('d', map(self._bass, spread(m_col), spread(p_col), spread(q_col), times))
+        else:
+            adoption = array('d', map(self._logistic, spread(m_col), spread(q_col), times))
+        return {"cells": cells, "years": list(year_range), "shape": (len(starts), years), "adoption": adoption, "model": model}
+
+    @staticmethod
+    def curves_by_cell(projection: dict):
+        """Splits a projection's flat array into {(technology, region, size_class): curve}."""
+        n_cells, years = projection["shape"]
+        cells, adoption = projection["cells"], projection["adoption"]
+        return {(cells["technology"][k], cells["region"][k], cells["size_class"][k]): adoption[k * years:(k + 1) * years]
+                for k in range(n_cells)}
+
+    def _refine_bass_fit(self, years, shares, m, p, q, iterations: int = 50):
+        """
+        Damped Gauss-Newton (Levenberg-Marquardt) fit of the closed-form Bass curve to cumulative shares.
+
+        Parameters are (ln m, ln p, ln q, tau), where tau is the time since launch at the first observation,
+        so m, p and q stay positive. Steps that do not lower the squared error are retried with more damping.
+        """
+        offsets = [year - years[0] for year in years]
+        bass = self._bass
+
+        def residuals(theta):
+            m_, p_, q_, tau = math.exp(theta[0]), math.exp(theta[1]), math.exp(theta[2]), theta[3]
+            return [share - bass(m_, p_, q_, tau + dt) for share, dt in zip(shares, offsets)]
+
+        theta = [math.log(m), math.log(p), math.log(q), self._bass_time(m, p, q, shares[0]) if shares[0] > 0 else 0.0]
+        r = residuals(theta)
+        sse, damping, h = sum(x * x for x in r), 1e-3, 1e-7
+        for _ in range(iterations):
+            if sse < 1e-20:
+                break
+            # Jacobian of the model (= -d residual) by forward differences
+            columns = []
+            for j in range(4):
+                shifted = theta[:]
+                shifted[j] += h
+                columns.append([(x - y) / h for x, y in zip(r, residuals(shifted))])
+            jtj = [[sum(map(operator.mul, ci, cj)) for cj in columns] for ci in columns]
+            jtr = [sum(map(operator.mul, ci, r)) for ci in columns]
+            while damping < 1e10:
+                system = [[v + (damping * row[i] if i == k else 0.0) for k, v in enumerate(row)] for i, row in enumerate(jtj)]
+                step = CropMixEvolution._solve_linear(system, jtr)
+                if step is None:
+                    damping *= 10
+                    continue
+                candidate = [t + d for t, d in zip(theta, step)]
+                try:
+                    candidate_r = residuals(candidate)
+                except (OverflowError, ZeroDivisionError):
+                    damping *= 10
+                    continue
+                candidate_sse = sum(x * x for x in candidate_r)
+                if candidate_sse < sse:
+                    break
+                damping *= 10
+            else:
+                break
+            improvement = sse - candidate_sse
+            theta, r, sse, damping = candidate, candidate_r, candidate_sse, max(damping / 10, 1e-12)
+            if improvement <= 1e-12 * sse:
+                break
+        return math.exp(theta[0]), math.exp(theta[1]), math.exp(theta[2]), theta[3]
+
+    def calibrate(self, observations: dict, store: bool = True):
+        """
+        Least-squares Bass fit per cell from observed cumulative adoption shares.
+
+        Starts from Bass's discrete form n_t = a + b N_(t-1) + c N_(t-1)^2 (n_t the yearly increase), solved
+        per cell from its 3x3 normal equations, then m, p, q from a, b, c. The discrete form is biased against
+        yearly samples of the continuous curve, so the estimate is refined by damped Gauss-Newton steps
+        against the closed-form F(t) that project() uses (with the time since launch as a fourth parameter).
+        Cells whose fit is not a valid diffusion curve (needs p > 0, q >= 0, m between the last observation
+        and 1) keep their prior.
+
+        Args:
+            observations (dict): {(technology, region, size_class): [(year, adoption_share), ...]}, yearly.
+            store (bool): Keep valid fits so later projections use them.
+
+        Returns:
+            dict: Per cell fitted p, q, m, RMSE of the yearly increases and whether the fit was accepted.
+        """
+        fits = {}
+        for key, series in observations.items():
+            series = sorted(series)
+            years = [year for year, _ in series]
+            shares = [share for _, share in series]
+            if len(shares) < 4:
+                fits[key] = {"fit_ok": False, "reason": "need at least 4 observations"}
+                continue
+            lagged = shares[:-1]
+            increases = [b - a for a, b in zip(shares, shares[1:])]
+            squared = [x * x for x in lagged]
+            s1, s2, s3, s4 = sum(lagged), sum(squared), sum(x * y for x, y in zip(squared, lagged)), sum(x * x for x in squared)
+            n = len(lagged)
+            t0, t1, t2 = sum(increases), sum(x * y for x, y in zip(lagged, increases)), sum(x * y for x, y in zip(squared, increases))
+            det = n * (s2 * s4 - s3 * s3) - s1 * (s1 * s4 - s3 * s2) + s2 * (s1 * s3 - s2 * s2)
+            if abs(det) < 1e-18:
+                fits[key] = {"fit_ok": False, "reason": "singular normal equations"}
+                continue
+            a = (t0 * (s2 * s4 - s3 * s3) - s1 * (t1 * s4 - s3 * t2) + s2 * (t1 * s3 - s2 * t2)) / det
+            b = (n * (t1 * s4 - s3 * t2) - t0 * (s1 * s4 - s3 * s2) + s2 * (s1 * t2 - t1 * s2)) / det
+            c = (n * (s2 * t2 - t1 * s3) - s1 * (s1 * t2 - t1 * s2) + t0 * (s1 * s3 - s2 * s2)) / det
+            discriminant = b * b - 4 * a * c
+            if c >= 0 or discriminant < 0:
+                fits[key] = {"fit_ok": False, "reason": "no saturating Bass curve fits the data"}
+                continue
+            m = (-b - math.sqrt(discriminant)) / (2 * c)
+            p, q = (a / m, -c * m) if m > 0 else (0.0, 0.0)
+            # Start the refinement from the discrete estimate, kept positive and above the observed shares
+            start_m = min(max(m, max(shares) * 1.05), 1.0)
+            start_p = p if p > 1e-4 else 0.01
+            start_q = q if q > 1e-3 else 0.3
+            try:
+                m, p, q, tau = self._refine_bass_fit(years, shares, start_m, start_p, start_q)
+            except (ValueError, OverflowError, ZeroDivisionError):
+                fits[key] = {"fit_ok": False, "reason": "no saturating Bass curve fits the data"}
+                continue
+            fitted = [self._bass(m, p, q, tau + year - years[0]) for year in years]
+            residuals = [y - (f1 - f0) for y, f0, f1 in zip(increases, fitted, fitted[1:])]
+            fit = {"p": p, "q": q, "m": m, "rmse": math.sqrt(sum(r * r for r in residuals) / n)}
+            fit["fit_ok"] = p > 0 and q >= 0 and shares[-1] <= m <= 1.0
+            if fit["fit_ok"] and store:
+                self.calibrated[key] = {"p": p, "q": q, "m": m}
+            fits[key] = {k: (round(v, 6) if isinstance(v, float) else v) for k, v in fit.items()}
+        return {"cells_fitted": sum(1 for f in fits.values() if f["fit_ok"]), "fits": fits}
+
+    def sample_uncertainty(self, cells: dict = None, years: int = 15, draws: int = 500, cv: dict = None,
+                           quantiles=(0.1, 0.5, 0.9), seed: int = 0, model: str = "bass"):
+        """
+        Uncertainty bands from lognormal draws of p, q and m around each cell's values.
+
+        Args:
+            cv (dict, optional): Coefficients of variation for 'p', 'q', 'm' (default 0.3, 0.2, 0.1).
+
+        Returns:
+            dict: 'shape' (cells, years) and, per quantile, a flat array of adoption shares.
+        """
+        cells = cells or self.default_cells()
+        cv = {"p": 0.3, "q": 0.2, "m": 0.1, **(cv or {})}
+        rng = random.Random(seed)
+        sigma = {k: math.sqrt(math.log(1 + v * v)) for k, v in cv.items()}
+        n_cells = len(cells["m"])
+        samples = []
+        for _ in range(draws):
+            drawn = dict(cells)
+            for k in ("p", "q", "m"):
+                s = sigma[k]
+                drawn[k] = [v * math.exp(rng.gauss(-0.5 * s * s, s)) for v in cells[k]]
+            drawn["m"] = [min(max(m, a * 1.0001), 1.0) for m, a in zip(drawn["m"], cells["current_adoption"])]
+            samples.append(self.project(drawn, years, model)["adoption"])
+        bands = {}
+        for quantile in quantiles:
+            rank = min(int(quantile * draws), draws - 1)
+            bands[quantile] = array('d', (sorted(column)[rank] for column in zip(*samples)))
+        return {"shape": (n_cells, years), "draws": draws, "bands": bands}
+
+
 class MechanizationAdvancements:
     def __init__(self):
         self.mechanization_levels = {
@@ -286,6 +996,179 @@ class IrrigationTechnologyModernization:
             drivers.append("High competition for water resources")
         return { "region": region, "drivers": drivers }
 
+class IrrigationSystemOptimizer:
+    """
+    Field-level least lifecycle cost irrigation system over every system in
+    IrrigationTechnologyModernization.irrigation_systems, subject to each field's water allocation.
+
+    Capital costs are parsed from the catalog's cost strings (a point within the quoted range); the Smart
+    Irrigation premium is applied on top of its base system. Per field and system the annual cost is
+    water + pumping energy + O&M, and lifecycle cost is the NPV over a common horizon of the equivalent
+    annual cost, so systems with different lifetimes compare fairly. Each system is evaluated for all
+    fields as whole-column operations over arrays.
+    """
+    # Engineering assumptions not held in the catalog: pressure head at the emitter, service life, O&M as share of capex
+    operating_profiles = {
+        "Flood/Furrow Irrigation": {"pressure_head_m": 0.0, "lifetime_years": 25, "om_share_of_capex": 0.02},
+        "Sprinkler Irrigation (Center Pivot, Linear Move)": {"pressure_head_m": 30.0, "lifetime_years": 20, "om_share_of_capex": 0.03},
+        "Drip/Micro-Irrigation": {"pressure_head_m": 12.0, "lifetime_years": 12, "om_share_of_capex": 0.05},
+        "Smart Irrigation (Sensor-based, VRI)": {"pressure_head_m": 30.0, "lifetime_years": 15, "om_share_of_capex": 0.04,
+                                                 "premium_base_system": "Sprinkler Irrigation (Center Pivot, Linear Move)"}
+    }
+    default_profile = {"pressure_head_m": 20.0, "lifetime_years": 15, "om_share_of_capex": 0.04}
+    kwh_per_m3_per_m = 9.81 / 3600  # hydraulic energy to lift 1 m3 by 1 m
+
+    def __init__(self, irrigation_model: IrrigationTechnologyModernization, pump_efficiency: float = 0.7):
+        self.irrigation_model = irrigation_model
+        self.pump_efficiency = pump_efficiency
+
+    @staticmethod
+    def _parse_range(text: str):
+        """'500 - 1,500 (setup)' -> (500.0, 1500.0); '10-25% over ...' -> (10.0, 25.0)."""
+        numbers = [float(n.replace(",", "")) for n in re.findall(r"\d[\d,]*(?:\.\d+)?", text)]
+        if not numbers:
+            return None
+        return (numbers[0], numbers[1] if len(numbers) > 1 else numbers[0])
+
+    def system_parameters(self, cost_quantile: float = 0.5) -> dict:
+        """Efficiency, capex per ha and operating profile for every catalog system with a usable cost."""
+        systems = self.irrigation_model.irrigation_systems
+        parameters = {}
+        for name, details in systems.items():
+            profile = {**self.default_profile, **self.operating_profiles.get(name, {})}
+            if "cost_per_ha_usd" in details:
+                low, high = self._parse_range(details["cost_per_ha_usd"])
+                capex = low + (high - low) * cost_quantile
+            else:
+                parameters[name] = {"efficiency_rate": details["efficiency_rate"], **profile}
+                continue
+            parameters[name] = {"efficiency_rate": details["efficiency_rate"], "capex_usd_ha": capex, **profile}
+        for name, params in parameters.items():
+            if "capex_usd_ha" in params:
+                continue
+            premium = self._parse_range(systems[name].get("cost_premium_percent", ""))
+            base = parameters.get(params.get("premium_base_system"), {}).get("capex_usd_ha")
+            if premium is None or base is None:
+                params["capex_usd_ha"] = None
+                continue
+            params["capex_usd_ha"] = base * (1 + (premium[0] + (premium[1] - premium[0]) * cost_quantile) / 100)
+        return {name: params for name, params in parameters.items() if params["capex_usd_ha"] is not None}
+
+    def optimize_fields(self, fields: dict, water_price_usd_m3: float = 0.05, discount_rate: float = 0.07,
+                        horizon_years: int = 20, cost_quantile: float = 0.5,
+                        baseline_system: str = "Flood/Furrow Irrigation", curve_points: int = 20) -> dict:
+        """
+        Optimal irrigation system per field and the aggregate water/energy savings curve.
+
+        Args:
+            fields (dict): Columns 'area_ha', 'crop_water_need_mm' (net irrigation need per season),
+                'pumping_head_m' (lift), 'electricity_price_usd_kwh'; optional 'water_cap_m3' (allocation,
+                None or missing = uncapped), 'water_price_usd_m3' and 'current_system' (defaults to baseline_system).
+            cost_quantile (float): Point within each quoted capex range (0 = low end, 1 = high end).
+            curve_points (int): Points returned on the savings curve.
+
+        Returns:
+            dict: Per-field best system, lifecycle cost, yearly water and energy use, yearly savings against the current
+                  system; per-system field counts; and the savings curve ordered from cheapest to dearest
+                  water saving (cumulative water saved, energy saved and lifecycle cost change).
+        """
+        required = ("area_ha", "crop_water_need_mm", "pumping_head_m", "electricity_price_usd_kwh")
+        missing = [column for column in required if column not in fields]
+        if missing:
+            return {"error": f"Missing field columns: {missing}"}
+        parameters = self.system_parameters(cost_quantile)
+        if baseline_system not in parameters:
+            return {"error": f"Baseline system '{baseline_system}' not found."}
+        n_fields = len(fields["area_ha"])
+        area = array('d', fields["area_ha"])
+        net_water = array('d', map(operator.mul, area, map((10.0).__mul__, fields["crop_water_need_mm"])))  # 1 mm on 1 ha = 10 m3
+        lift = array('d', fields["pumping_head_m"])
+        electricity = array('d', fields["electricity_price_usd_kwh"])
+        water_price = array('d', fields.get("water_price_usd_m3") or repeat(water_price_usd_m3, n_fields))
+        caps = array('d', (math.inf if c is None else c for c in (fields.get("water_cap_m3") or repeat(None, n_fields))))
+        horizon_annuity = (1 - (1 + discount_rate) ** -horizon_years) / discount_rate if discount_rate else horizon_years
+        names = list(parameters)
+        evaluated = {}
+        for name in names:
+            params = parameters[name]
+            lifetime = params["lifetime_years"]
+            crf = discount_rate / (1 - (1 + discount_rate) ** -lifetime) if discount_rate else 1 / lifetime
+            capex = array('d', map(params["capex_usd_ha"].__mul__, area))
+            water = array('d', map((1 / params["efficiency_rate"]).__mul__, net_water))
+            energy_per_m3 = map((self.kwh_per_m3_per_m / self.pump_efficiency).__mul__, map(params["pressure_head_m"].__add__, lift))
+            energy = array('d', map(operator.mul, water, energy_per_m3))
+            annual = map(operator.add, map(operator.add, map(operator.mul, water, water_price), map(operator.mul, energy, electricity)),
+                         map(params["om_share_of_capex"].__mul__, capex))
+            equivalent_annual = map(operator.add, map(crf.__mul__, capex), annual)
+            lifecycle = array('d', map(horizon_annuity.__mul__, equivalent_annual))
+            feasible = array('b', map(operator.le, water, caps))
+            evaluated[name] = {"water": water, "energy": energy, "lifecycle": lifecycle, "feasible": feasible}
+        # Cheapest feasible system per field; fields no system can serve within the cap get the least-water system
+        best = array('l', repeat(-1, n_fields))
+        best_cost = array('d', repeat(math.inf, n_fields))
+        least_water = array('l', repeat(0, n_fields))
+        least_water_m3 = evaluated[names[0]]["water"]
+        for s, name in enumerate(names):
+            columns = evaluated[name]
+            better = [ok and c < b for ok, c, b in zip(columns["feasible"], columns["lifecycle"], best_cost)]
+            best = array('l', [s if flag else k for flag, k in zip(better, best)])
+            best_cost = array('d', [c if flag else b for flag, c, b in zip(better, columns["lifecycle"], best_cost)])
+            lower = list(map(operator.lt, columns["water"], least_water_m3))
+            least_water = array('l', [s if flag else k for flag, k in zip(lower, least_water)])
+            least_water_m3 = array('d', [w if flag else v for flag, w, v in zip(lower, columns["water"], least_water_m3)])
+        infeasible = array('b', map((-1).__eq__, best))
+        best = array('l', [lw if bad else k for bad, lw, k in zip(infeasible, least_water, best)])
+
+        def gather(index, column):
+            columns = [evaluated[name][column] for name in names]
+            return array('d', [columns[s][i] for i, s in enumerate(index)])
+
+        current = fields.get("current_system") or repeat(baseline_system, n_fields)
+        current_index = array('l', (names.index(c if c in parameters else baseline_system) for c in current))
+        best_water, best_energy, best_lifecycle = (gather(best, column) for column in ("water", "energy", "lifecycle"))
+        current_water, current_energy, current_lifecycle = (gather(current_index, column) for column in ("water", "energy", "lifecycle"))
+        water_saved = array('d', map(operator.sub, current_water, best_water))
+        energy_saved = array('d', map(operator.sub, current_energy, best_energy))
+        cost_change = array('d', map(operator.sub, best_lifecycle, current_lifecycle))
+        # Savings curve: switching fields ordered by lifecycle cost per m3 of water saved (negative = saves money too)
+        switching = [i for i in range(n_fields) if best[i] != current_index[i] and water_saved[i] > 0]
+        switching.sort(key=lambda i: cost_change[i] / water_saved[i])
+        cumulative_water = list(accumulate(water_saved[i] for i in switching))
+        cumulative_energy = list(accumulate(energy_saved[i] for i in switching))
+        cumulative_cost = list(accumulate(cost_change[i] for i in switching))
+        step = max(1, -(-len(switching) // curve_points)) if switching else 1
+        picks = sorted(set(list(range(step - 1, len(switching), step)) + ([len(switching) - 1] if switching else [])))
+        savings_curve = [{
+            "fields_switched": k + 1,
+            "marginal_cost_usd_per_m3_saved": round(cost_change[switching[k]] / water_saved[switching[k]], 4),
+            "cumulative_water_saved_m3": round(cumulative_water[k], 1),
+            "cumulative_energy_saved_kwh": round(cumulative_energy[k], 1),
+            "cumulative_lifecycle_cost_change_usd": round(cumulative_cost[k], 1)
+        } for k in picks]
+        return {
+            "systems": {name: {"efficiency_rate": p["efficiency_rate"], "capex_usd_ha": round(p["capex_usd_ha"], 2),
+                               "lifetime_years": p["lifetime_years"]} for name, p in parameters.items()},
+            "fields": {
+                "best_system": [names[s] for s in best],
+                "lifecycle_cost_usd": best_lifecycle,
+                "water_use_m3": best_water,
+                "energy_use_kwh": best_energy,
+                "water_saved_m3": water_saved,
+                "energy_saved_kwh": energy_saved,
+                "lifecycle_cost_change_usd": cost_change,
+                "within_water_cap": array('b', map(operator.not_, infeasible))
+            },
+            "system_counts": {name: best.count(s) for s, name in enumerate(names)},
+            "fields_over_water_cap": infeasible.count(1),
+            "totals": {
+                "water_saved_m3": round(sum(water_saved), 1),
+                "energy_saved_kwh": round(sum(energy_saved), 1),
+                "lifecycle_cost_change_usd": round(sum(cost_change), 1)
+            },
+            "savings_curve": savings_curve
+        }
+
+
 class CropProtectionInnovation:
     def __init__(self):
         self.protection_methods = {
@@ -350,17 +1233,214 @@ class CropProtectionInnovation:
         ]
 
 # Main simulation class for Production System Transformation
+class FarmPopulationSimulator:
+    """
+    Agent-based farm population model in struct-of-arrays form.
+
+    Each region's farms are parallel arrays (size_ha, operator_age, adoption bitmask, crop, margin per ha).
+    A yearly step realises crop margins (regional mean and volatility from CropMixEvolution's margin
+    ensemble), lets retiring or distressed operators exit (their land is merged
+    into profitable neighbours) or hand over to a successor (split between heirs where inheritance is partible), spreads technologies with the Bass hazard of
+    AdoptionDiffusionEngine by size class, and re-chooses crops from the margin outlook. Regions are
+    independent shards with their own seeds, so serial and multi-process runs give identical results.
+    """
+    diffusion_regions = {"North America (US)": "North America", "Europe (EU-27)": "Europe", "South America (Brazil)": "South America",
+                         "Asia (India)": "Asia", "Africa (Sub-Saharan)": "Africa"}
+    size_class_bounds_ha = (20, 200)  # small < 20 ha <= medium < 200 ha <= large
+    regional_crops = {region: tuple(profile["crops"]) for region, profile in CropMixEvolution.regional_profiles.items()}
+    # Share of successions where the farm is split between two heirs (partible inheritance)
+    partible_inheritance_share = {"Asia (India)": 0.6, "Africa (Sub-Saharan)": 0.4}
+    class_margin_scale = (0.85, 1.0, 1.1)
+    # Fixed costs per ha by size class, as a share of the region's average expected crop gross margin
+    class_fixed_cost_share = (0.23, 0.17, 0.13)
+    technology_margin_uplift = {"GPS Guidance & Autosteer": 0.03, "Variable Rate Technology (VRT)": 0.05,
+                                "Drones & Remote Sensing": 0.02, "Farm Management Software (FMS)": 0.02}
+
+    def __init__(self, farm_consolidation: FarmConsolidationTrends, diffusion: AdoptionDiffusionEngine,
+                 retirement_age: int = 70, succession_probability: float = 0.7, base_exit_probability: float = 0.003,
+                 distress_exit_probability: float = 0.08, distressed_adoption_factor: float = 0.5,
+                 crop_inertia: float = 0.8, crop_choice_sensitivity: float = 3.0, crop_mix: CropMixEvolution = None):
+        self.farm_consolidation = farm_consolidation
+        self.diffusion = diffusion
+        self.retirement_age = retirement_age
+        self.succession_probability = succession_probability
+        self.base_exit_probability = base_exit_probability
+        self.distress_exit_probability = distress_exit_probability
+        self.distressed_adoption_factor = distressed_adoption_factor
+        self.crop_inertia = crop_inertia
+        self.crop_choice_sensitivity = crop_choice_sensitivity
+        self.technologies = [t for t in diffusion.precision_agriculture.adoption_data if t in self.technology_margin_uplift]
+        # {region: {crop: (expected gross margin USD/ha, yearly volatility)}}, shared with the crop mix model
+        crop_mix = crop_mix or CropMixEvolution()
+        self.crop_margins = {region: crop_mix.margin_outlook(region) for region in self.regional_crops}
+
+    def _fixed_costs(self, region):
+        """Fixed costs per ha for each size class in a region."""
+        margins = self.crop_margins[region]
+        average = sum(m for m, _ in margins.values()) / len(margins)
+        return [share * average for share in self.class_fixed_cost_share]
+
+    def _uplift_table(self):
+        """Margin multiplier for every adoption bitmask."""
+        uplifts = [self.technology_margin_uplift[t] for t in self.technologies]
+        return [1 + sum(u for k, u in enumerate(uplifts) if mask >> k & 1) for mask in range(1 << len(uplifts))]
+
+    def _crop_probabilities(self, expected_margins):
+        """Cumulative logit choice probabilities from expected crop margins."""
+        top = max(expected_margins)
+        weights = [math.exp(self.crop_choice_sensitivity * (m - top) / top) for m in expected_margins]
+        total = sum(weights)
+        return list(accumulate(w / total for w in weights))
+
+    def initialise_region(self, region: str, n_farms: int, seed: int = 0) -> dict:
+        """Struct-of-arrays farm population for a region at its current size distribution and adoption levels."""
+        if region not in self.regional_crops:
+            return {"error": f"Region '{region}' not found."}
+        rng = random.Random(seed)
+        size = self.farm_consolidation.synthetic_farms(region, 0, 1.0, n_farms, seed)["farm_size_ha"]
+        size_class = array('b', map(bisect_right, repeat(self.size_class_bounds_ha), size))
+        triangular = rng.triangular
+        age = array('b', (int(triangular(28, 80, 60)) for _ in range(n_farms)))
+        adopted = array('b', bytes(n_farms))
+        rand = rng.random
+        for k, technology in enumerate(self.technologies):
+            bit = 1 << k
+            shares = [self.diffusion._current_adoption(technology, self.diffusion_regions[region], c) for c in self.diffusion.size_classes]
+            adopted = array('b', [m | bit if rand() < shares[c] else m for m, c in zip(adopted, size_class)])
+        crops = self.regional_crops[region]
+        margins = self.crop_margins[region]
+        cumulative = self._crop_probabilities([margins[c][0] for c in crops])
+        crop = array('b', map(bisect_right, repeat(cumulative[:-1]), (rand() for _ in range(n_farms))))
+        base_margins, uplift = [margins[c][0] for c in crops], self._uplift_table()
+        scale, fixed_cost = self.class_margin_scale, self._fixed_costs(region)
+        margin = array('d', [base_margins[c] * scale[k] * uplift[m] - fixed_cost[k] for c, k, m in zip(crop, size_class, adopted)])
+        return {"region": region, "size_ha": size, "age": age, "adopted": adopted, "crop": crop, "margin_usd_ha": margin}
+
+    def _summarise(self, population, year, crops, exits, successions, splits, crop_margins):
+        size, adopted = population["size_ha"], population["adopted"]
+        n_farms, land = len(size), sum(size)
+        size_class = array('b', map(bisect_right, repeat(self.size_class_bounds_ha), size))
+        return {
+            "year": year,
+            "farms": n_farms,
+            "avg_size_ha": round(land / n_farms, 2) if n_farms else 0.0,
+            "land_share_large_farms": round(sum(compress(size, map((2).__eq__, size_class))) / land, 4) if land else 0.0,
+            "adoption_rate": {t: round(sum(map((1 << k).__and__, adopted)) / (1 << k) / n_farms, 4) if n_farms else 0.0
+                              for k, t in enumerate(self.technologies)},
+            "crop_land_share": {c: round(sum(compress(size, map((k).__eq__, population["crop"]))) / land, 4) if land else 0.0
+                                for k, c in enumerate(crops)},
+            "avg_margin_usd_ha": round(sum(map(operator.mul, size, population["margin_usd_ha"])) / land, 2) if land else 0.0,
+            "crop_margin_usd_ha": {c: round(m, 2) for c, m in zip(crops, crop_margins)},
+            "exits": exits,
+            "successions": successions,
+            "inheritance_splits": splits
+        }
+
+    def _simulate_region(self, task):
+        region, n_farms, years, seed = task
+        population = self.initialise_region(region, n_farms, seed)
+        rng = random.Random(seed + 1)
+        rand, gauss = rng.random, rng.gauss
+        crops = self.regional_crops[region]
+        bounds, uplift = self.size_class_bounds_ha, self._uplift_table()
+        scale, fixed_cost = self.class_margin_scale, self._fixed_costs(region)
+        margins = [self.crop_margins[region][c] for c in crops]
+        diffusion_region = self.diffusion_regions[region]
+        bass = [self.diffusion.default_cells([t], [diffusion_region]) for t in self.technologies]
+        expected = [m for m, _ in margins]
+        history = [self._summarise(population, 0, crops, 0, 0, 0, expected)]
+        for year in range(1, years + 1):
+            size, age, adopted, crop = population["size_ha"], population["age"], population["adopted"], population["crop"]
+            # 1. Realised margins per ha: crop margin shock, scale economies, technology uplift, fixed costs
+            realised = [m * math.exp(gauss(-0.5 * v * v, v)) for m, v in margins]
+            size_class = array('b', map(bisect_right, repeat(bounds), size))
+            margin = array('d', [realised[c] * scale[k] * uplift[m] - fixed_cost[k] for c, k, m in zip(crop, size_class, adopted)])
+            # 2. Exit / succession: 0 stays, 1 exits, 2 hands over to a successor
+            retire, succeed = self.retirement_age, self.succession_probability
+            base_exit, distress_exit = self.base_exit_probability, self.distress_exit_probability
+            status = array('b', [(2 if rand() < succeed else 1) if a >= retire else (1 if rand() < (distress_exit if g < 0 else base_exit) else 0)
+                                 for a, g in zip(age, margin)])
+            stay = array('b', map((1).__ne__, status))
+            growers = [i for i, (st, g) in enumerate(zip(status, margin)) if st != 1 and g > 0] or \
+                      [i for i, st in enumerate(status) if st != 1]
+            exits = status.count(1)
+            if growers:
+                n_growers = len(growers)
+                for i in compress(range(len(status)), map((1).__eq__, status)):
+                    size[growers[int(rand() * n_growers)]] += size[i]
+            successions = status.count(2)
+            age = array('b', [40 if st == 2 else a + 1 for a, st in zip(age, status)])
+            split_share = self.partible_inheritance_share.get(region, 0.0)
+            heirs = [i for i in compress(range(len(status)), map((2).__eq__, status)) if rand() < split_share]
+            for i in heirs:
+                size[i] *= 0.5
+            size, age, adopted, crop, margin = (array(column.typecode, chain(compress(column, stay), map(column.__getitem__, heirs)))
+                                                for column in (size, age, adopted, crop, margin))
+            size_class = array('b', map(bisect_right, repeat(bounds), size))
+            # 3. Technology adoption: Bass hazard by size class, driven by current class adoption, damped under distress
+            class_counts = [size_class.count(k) for k in range(3)]
+            group = array('b', [k * 2 + (g >= 0) for k, g in zip(size_class, margin)])
+            for t, cells in enumerate(bass):
+                bit = 1 << t
+                adopter_classes = array('b', compress(size_class, map(bit.__and__, adopted)))
+                adopters = [adopter_classes.count(k) for k in range(3)]
+                hazard = []
+                for k in range(3):
+                    share = adopters[k] / class_counts[k] if class_counts[k] else 0.0
+                    p, q, potential = cells["p"][k], cells["q"][k], cells["m"][k]
+                    h = max(0.0, (p + q * share / potential) * (potential - share) / (1 - share)) if share < 1 else 0.0
+                    hazard += [h * self.distressed_adoption_factor, h]
+                adopted = array('b', [m if m & bit or rand() >= hazard[g] else m | bit for m, g in zip(adopted, group)])
+            # 4. Crop choice: most farms keep their crop, the rest choose by logit on the margin outlook
+            expected = [0.5 * e + 0.5 * r for e, r in zip(expected, realised)]
+            cumulative = self._crop_probabilities(expected)[:-1]
+            inertia = self.crop_inertia
+            crop = array('b', [c if r < inertia else bisect_right(cumulative, (r - inertia) / (1 - inertia))
+                               for c, r in zip(crop, (rand() for _ in range(len(crop))))])
+            population.update({"size_ha": size, "age": age, "adopted": adopted, "crop": crop, "margin_usd_ha": margin})
+            history.append(self._summarise(population, year, crops, exits, successions, len(heirs), realised))
+        return {"region": region, "initial_farms": n_farms, "history": history}
+
+    def simulate(self, farms_per_region: dict, years: int = 20, seed: int = 0, processes: int = None) -> dict:
+        """
+        Runs the farm population forward year by year for each region.
+
+        Args:
+            farms_per_region (dict): {region: number of farm agents}, regions as in FarmConsolidationTrends.
+            years (int): Years to simulate.
+            seed (int): Base seed; each region derives its own.
+            processes (int, optional): Shard regions across this many worker processes.
+
+        Returns:
+            dict: Per region, yearly farm counts, average size, land share of large farms, adoption rates,
+                  crop land shares, land-weighted margin, exits and successions.
+        """
+        missing = [r for r in farms_per_region if r not in self.regional_crops]
+        if missing:
+            return {"error": f"Region(s) not found: {missing}"}
+        tasks = [(region, n, years, seed * 1000003 + k) for k, (region, n) in enumerate(farms_per_region.items())]
+        if processes and processes > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                outcomes = list(pool.map(self._simulate_region, tasks))
+        else:
+            outcomes = list(map(self._simulate_region, tasks))
+        return {"years": years, "regions": {outcome["region"]: outcome for outcome in outcomes}}
+
+
 class ProductionSystemTransformation:
     def __init__(self):
         self.farm_consolidation = FarmConsolidationTrends()
-        self.tech_adoption = TechnologyAdoptionDifferential()
+        self.precision_agriculture = PrecisionAgricultureAdoption()
+        self.tech_adoption = TechnologyAdoptionDifferential(self.precision_agriculture)
         self.sustainability_practices = SustainabilityPracticeImplementation()
         self.crop_mix_evolution = CropMixEvolution()
         self.finance_innovation = ProductionFinanceModelInnovation()
-        self.precision_agriculture = PrecisionAgricultureAdoption()
         self.mechanization = MechanizationAdvancements()
         self.irrigation_modernization = IrrigationTechnologyModernization()
+        self.irrigation_optimizer = IrrigationSystemOptimizer(self.irrigation_modernization)
         self.crop_protection = CropProtectionInnovation()
+        self.farm_population = FarmPopulationSimulator(self.farm_consolidation, self.tech_adoption.diffusion,
+                                                       crop_mix=self.crop_mix_evolution)
 
     def run_scenario(self, region: str, years_to_project: int, consolidation_driver_factor: float = 1.0):
         """Runs a comprehensive scenario for production system transformation."""
@@ -385,17 +1465,26 @@ class ProductionSystemTransformation:
             # print(f"  Details: {regional_comparison}") # Can be verbose
 
         # Placeholder calls for other components
-        print("\n-- Technology Adoption (Placeholder) --")
-        self.tech_adoption.simulate_differential(technology_type="PrecisionAg", farm_size="LargeScale")
-        print(f"  Called simulate_differential for PrecisionAg on LargeScale farms in {region}.")
+        print("\n-- Technology Adoption Differential --")
+        adoption_differential = self.tech_adoption.simulate_differential(technology_type="PrecisionAg", farm_size="SmallScale", years=years_to_project)
+        autosteer_small = adoption_differential["by_technology"]["GPS Guidance & Autosteer"]
+        for adoption_region in ("North America", "Asia"):
+            curve = autosteer_small[adoption_region]
+            print(f"  GPS Guidance & Autosteer, small farms, {adoption_region}: {curve['adoption_curve'][0]:.0%} -> {curve['adoption_curve'][-1]:.0%} "
+                  f"(gap to large farms in year {years_to_project}: {curve['gap_to_large_farms_final_year']:.0%})")
 
         print("\n-- Sustainability Practices (Placeholder) --")
         self.sustainability_practices.track_implementation(practice_type="RegenerativeAgriculture")
         print(f"  Called track_implementation for RegenerativeAgriculture in {region}.")
 
-        print("\n-- Crop Mix Evolution (Placeholder) --")
-        self.crop_mix_evolution.project_evolution(region=region)
-        print(f"  Called project_evolution for {region}.")
+        print("\n-- Crop Mix Evolution --")
+        crop_mix = self.crop_mix_evolution.project_evolution(region=region, years=years_to_project)
+        if "error" in crop_mix:
+            print(f"  Error projecting crop mix: {crop_mix['error']}")
+        else:
+            first, last = crop_mix["projection"][0], crop_mix["projection"][-1]
+            print(f"  Crop shares now: {first['crop_shares']}")
+            print(f"  Crop shares in {years_to_project} years: {last['crop_shares']} (expected margin {last['expected_margin_usd_ha']:.0f} +/- {last['margin_sd_usd_ha']:.0f} USD/ha)")
 
         print("\n-- Production Finance Innovation (Placeholder) --")
         self.finance_innovation.simulate_innovation(finance_model_type="DataDrivenLending")
@@ -437,6 +1526,8 @@ class ProductionSystemTransformation:
             "consolidation_projection": consolidation_projection,
             "regional_comparison_example": regional_comparison,
             "adoption_rate": adoption_rate,
+            "adoption_differential": adoption_differential,
+            "crop_mix": crop_mix,
             "drivers_barriers": drivers_barriers,
             "regional_trend": regional_trend,
             "mechanization_profile": mechanization_profile,
@@ -481,4 +1572,74 @@ if __name__ == '__main__':
     if "error" in eu_data:
         print(f"Error: {eu_data['error']}")
     else:
-        print(f"Farm Size Data for Europe (EU-27): {eu_data}") 
\ No newline at end of file
+        print(f"Farm Size Data for Europe (EU-27): {eu_data}") 
+    # Example: Adoption diffusion curves, calibration and uncertainty bands
+    print("\n----------------------------------------------------")
+    print("Adoption Diffusion Example: Drones & Remote Sensing")
+    print("----------------------------------------------------")
+    diffusion = simulation.tech_adoption.diffusion
+    drone_cells = diffusion.default_cells(technologies=["Drones & Remote Sensing"], regions=["North America", "Asia"])
+    drone_projection = diffusion.project(drone_cells, years=15)
+    for (technology, adoption_region, size_class), curve in diffusion.curves_by_cell(drone_projection).items():
+        print(f"  {adoption_region:<14} {size_class:<7}: year 1 {curve[0]:.1%}, year 15 {curve[-1]:.1%}")
+    observed = {("Drones & Remote Sensing", "North America", "large"): [(2016 + i, share) for i, share in enumerate([0.04, 0.07, 0.11, 0.16, 0.22, 0.28, 0.34, 0.40])]}
+    calibration = diffusion.calibrate(observed)
+    print(f"  Calibrated from 2016-2023 observations: {calibration['fits']}")
+    drone_bands = diffusion.sample_uncertainty(diffusion.default_cells(technologies=["Drones & Remote Sensing"], regions=["North America"], size_classes=["large"]), years=15, draws=300)
+    print(f"  Year-15 band (p10/p50/p90): " + " / ".join(f"{band[-1]:.1%}" for band in drone_bands["bands"].values()))
+
+    # Example: Consolidation projection cube and farm-size distributions
+    print("\n----------------------------------------------------")
+    print("Farm Consolidation Cube Example: regions x 30 years x driver factors")
+    print("----------------------------------------------------")
+    size_cube = simulation.farm_consolidation.size_distribution_cube(years=30, n_farms=1000000)
+    _, cube_years, cube_factors = size_cube["shape"]
+    for region_index, cube_region in enumerate(size_cube["regions"]):
+        cell = (region_index * cube_years + cube_years - 1) * cube_factors + size_cube["driver_factors"].index(1.0)
+        quartiles = " / ".join(f"{size_cube['quantiles_ha'][q][cell]:.1f}" for q in (0.25, 0.5, 0.75))
+        print(f"  {cube_region:<24} year 30 avg {size_cube['avg_ha'][cell]:>7.1f} ha, quartiles {quartiles} ha, "
+              f"farms > 500 ha: {size_cube['share_of_farms_above_ha'][500][cell]:.1%}")
+
+    # Example: Agent-based farm population, 20 years
+    print("\n----------------------------------------------------")
+    print("Farm Population Simulation Example: 20,000 farm agents per region, 20 years")
+    print("----------------------------------------------------")
+    population_run = simulation.farm_population.simulate({region_name: 20000 for region_name in ("North America (US)", "Europe (EU-27)", "Asia (India)")}, years=20, seed=7)
+    for population_region, outcome in population_run["regions"].items():
+        start, end = outcome["history"][0], outcome["history"][-1]
+        print(f"  {population_region:<20} farms {start['farms']:>6} -> {end['farms']:>6}, avg size {start['avg_size_ha']:.1f} -> {end['avg_size_ha']:.1f} ha, "
+              f"VRT adoption {start['adoption_rate']['Variable Rate Technology (VRT)']:.0%} -> {end['adoption_rate']['Variable Rate Technology (VRT)']:.0%}, "
+              f"margin {end['avg_margin_usd_ha']:.0f} USD/ha")
+
+    # Example: Field-level irrigation system optimization under water caps
+    print("\n----------------------------------------------------")
+    print("Irrigation Optimization Example: 20,000 synthetic fields")
+    print("----------------------------------------------------")
+    field_rng = random.Random(11)
+    field_count = 20000
+    synthetic_fields = {
+        "area_ha": [field_rng.uniform(5, 200) for _ in range(field_count)],
+        "crop_water_need_mm": [field_rng.uniform(200, 700) for _ in range(field_count)],
+        "pumping_head_m": [field_rng.uniform(5, 80) for _ in range(field_count)],
+        "electricity_price_usd_kwh": [field_rng.uniform(0.05, 0.25) for _ in range(field_count)]
+    }
+    synthetic_fields["water_cap_m3"] = [area * field_rng.uniform(4000, 12000) for area in synthetic_fields["area_ha"]]
+    irrigation_plan = simulation.irrigation_optimizer.optimize_fields(synthetic_fields, water_price_usd_m3=0.08)
+    print(f"  Optimal system counts: {irrigation_plan['system_counts']}")
+    print(f"  Fields no system can serve within their cap: {irrigation_plan['fields_over_water_cap']}")
+    print(f"  Yearly savings vs flood/furrow: {irrigation_plan['totals']['water_saved_m3'] / 1e6:,.1f} million m3 water, "
+          f"{irrigation_plan['totals']['energy_saved_kwh'] / 1e6:,.1f} GWh energy, lifecycle cost change {irrigation_plan['totals']['lifecycle_cost_change_usd'] / 1e6:,.1f} M USD")
+    for curve_point in irrigation_plan["savings_curve"][4::5]:
+        print(f"    {curve_point['fields_switched']:>6} fields switched: {curve_point['cumulative_water_saved_m3'] / 1e6:,.1f} million m3 saved "
+              f"at marginal {curve_point['marginal_cost_usd_per_m3_saved']:.3f} USD/m3")
+
+    # Example: Mean-variance crop mix projections for every region
+    print("\n----------------------------------------------------")
+    print("Crop Mix Optimization Example: all regions, 10 years, moderate risk aversion")
+    print("----------------------------------------------------")
+    regional_crop_mix = simulation.crop_mix_evolution.project_regions(years=10, risk_aversion=0.004)
+    for mix_region, crop_mix_projection in regional_crop_mix.items():
+        final_year = crop_mix_projection["projection"][-1]
+        shares = ", ".join(f"{crop} {share:.0%}" for crop, share in final_year["crop_shares"].items())
+        print(f"  {mix_region:<24} year 10: {shares} | margin {final_year['expected_margin_usd_ha']:.0f} +/- {final_year['margin_sd_usd_ha']:.0f} USD/ha "
+              f"({crop_mix_projection['total_pivots']} solver pivots over 11 years)")